@@ -1,49 +1,121 @@
 import functools
+import json
 import logging
+import math
+import threading
 import time
-from collections.abc import Iterator
-from datetime import datetime
-from multiprocessing import Pool, cpu_count
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import UTC, datetime, timedelta
+from multiprocessing import get_context
 from pathlib import Path
 from typing import Any
 from urllib.parse import quote
 
 import polars as pl
 import polars.selectors as cs
-from git import Actor
+from git import Commit
+from git.exc import GitCommandError
 from git.repo import Repo
-from git.repo.base import BlameEntry
-from git.types import Commit_ish
 from polars import DataFrame
 
-from .db import DB
+from .cache import ResultCache, result_key
+from .cost import (
+    HUNK_BYTES,
+    BlameCostModel,
+    BlameEstimate,
+    BlameSample,
+    directory_costs,
+    peak_rss,
+    suggest_every,
+    suggest_exclusions,
+)
+from .db import DB, SCHEMA_VERSION, Window, data_directory, missing_windows, to_utc
+from .identity import apply_identities, resolve_identities
+from .ingest import read_shard, shards
+from .lineage import build_lineage, read_renames
+from .mailmap import Mailmap
 from .models import (
+    COCHANGE_MAX_FILES,
     ActivityReportCmdOptions,
     BlameCmdOptions,
     BusFactorCmdOptions,
+    CompareCmdOptions,
+    CouplingCmdOptions,
     FileChangeCommitRecord,
+    FileSaveOptions,
     GitOptions,
+    HotspotsCmdOptions,
+    IdentitiesCmdOptions,
     OutputOptions,
     PunchcardCmdOptions,
+    PunchcardsCmdOptions,
     RevisionsCmdOptions,
     SummaryCmdOptions,
+    file_stats_args,
+    parse_file_stats,
 )
+from .objects import ObjectReader
+from .pathfilter import PathFilter
 from .plotting import Plotter
+from .progress import ProgressReporter
+from .scheduler import GitScheduler, parse_blame_incremental
+from .sketch import estimate, scale_sample
+from .snapshot import Snapshot
+from .spill import FrameSpool
 from .types import SupportedPlotType
 
 logger = logging.getLogger(__name__)
 
 LARGE_THRESHOLD = 10_000
 
-max_cpu_count = cpu_count() or 4
+# a rough count of file change records that fit in a MB while being ingested
+RECORDS_PER_MB = 1000
+
+# shards per ingest worker, so a slow shard doesn't leave the other workers idle
+SHARDS_PER_WORKER = 4
+
+# revisions of a cumulative blame that are blamed at the same time
+REVISIONS_IN_FLIGHT = 4
+
+# revisions whose files are listed, and files that are blamed, to estimate a blame
+BLAME_SAMPLE_REVISIONS = 8
+BLAME_SAMPLE_FILES = 5
+
+# like git, a file with a NUL byte this close to its start is binary
+BINARY_SNIFF_BYTES = 8000
+
+# options that change how results are reported or computed, but not the results
+RESULT_INDEPENDENT_FIELDS = {
+    "check_dirty",
+    "persist_data",
+    "progress",
+    "cache_size_mb",
+    "memory_limit_mb",
+    "max_git_processes",
+    "ingest_workers",
+    "JSON",
+    "csv",
+    "stdout",
+    "visualize",
+    "img_location",
+}
+
+# (revs, since, until, pathspecs) of a history traversal to ingest, where revs are
+# like the arguments of `git rev-list`, e.g., a head and `^`-prefixed heads to exclude
+type IngestTask = tuple[list[str], datetime | None, datetime | None, list[str]]
 
 type AnyCmdOptions = (
     SummaryCmdOptions
     | BlameCmdOptions
     | PunchcardCmdOptions
+    | PunchcardsCmdOptions
     | RevisionsCmdOptions
     | ActivityReportCmdOptions
     | BusFactorCmdOptions
+    | HotspotsCmdOptions
+    | CouplingCmdOptions
+    | CompareCmdOptions
 )
 
 
@@ -75,89 +147,705 @@ class RepoAnalyzer:
             raise ValueError(
                 "Repository has no commits! Please check the path and/or unstage any changes"
             )
-        elif self.repo.is_dirty():
-            logger.warning("Repository has uncommitted changes! Proceed with caution.")
 
+        self._is_dirty: bool | None = None
         self._commit_count = None
+        self._mailmap: Mailmap | None = None
+        self._path_filter: PathFilter | None = None
+        self._ref: str | None = None
 
+        # what the store was last brought up to date for
+        self._ingested: tuple | None = None
         self._revs = None
+        self._identities = None
+        self._resolved_revs = None
+        self._lineage = None
+        self._binary_files: frozenset[str] | None = None
+        self._ignored_paths: frozenset[str] | None = None
+        self._covers_store: bool | None = None
+        # selection key -> filtered revisions, shared by reports with the same selection
+        self._filtered: dict[tuple[str, bool], DataFrame] = {}
+        self._rollups: dict[str, DataFrame] = {}
+        self._lock = threading.RLock()
+
+        # one long lived `git cat-file` reader for every object lookup
+        self.objects = ObjectReader(Path(self.repo.git_dir))
+        # every other git command runs through one scheduler, with one process limit
+        self.scheduler = GitScheduler(
+            Path(self.repo.git_dir), max_processes=self.options.max_git_processes
+        )
 
         self.name = self.options.path.name
-        self._db = DB(name=self.name, in_memory=in_memory, initialize=True)
+        self._db = DB(
+            name=self.name,
+            in_memory=in_memory,
+            initialize=True,
+            memory_limit_mb=self.options.memory_limit_mb,
+        )
+        self._results = (
+            ResultCache(
+                data_directory() / "results" / self.name,
+                max_bytes=self.options.cache_size_mb * 2**20,
+            )
+            if not in_memory and self.options.cache_size_mb
+            else None
+        )
+        # the loaded history, memory-mapped by later runs instead of read from the store
+        self._snapshot = (
+            Snapshot(data_directory() / f"{self.name}.revs") if not in_memory else None
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        """Stops the git processes and the scheduler thread. They start again if the
+        analyzer is used afterwards.
+        """
+        self.objects.close()
+        self.scheduler.close()
+
+    def _ref_name(self, branch: str) -> str:
+        """The full name of a branch or other ref, e.g., `refs/heads/main`. Names that
+        aren't refs, like shas, are kept as they are.
+        """
+        return self.repo.git.rev_parse("--symbolic-full-name", branch) or branch
+
+    @property
+    def ref(self) -> str:
+        """The full name of the analyzed branch, `GitOptions.branch` or the default branch,
+        or `HEAD` if there is neither
+        """
+        if self._ref is None:
+            self._ref = self._ref_name(self.default_branch or "HEAD")
+        return self._ref
+
+    @property
+    def head(self) -> str:
+        """The sha of the analyzed revision"""
+        return self.objects.rev_parse(f"{self.ref}^{{commit}}")
+
+    def refresh(self) -> str:
+        """Forgets everything read at the previous head, e.g., after the ref moved, so the
+        next report ingests the new commits. Returns the current head.
+        """
+        with self._lock:
+            self._ref = None
+            self._commit_count = None
+            self._mailmap = None
+            self._path_filter = None
+            return self.head
 
-    @functools.cache
-    def _file_names_at_rev(self, rev: str) -> pl.Series:
-        raw = self.repo.git.ls_tree("-r", "--name-only", rev)
-        vals = raw.strip().split("\n")
-        return pl.Series(name="filename", values=vals)
+    def _is_ancestor(self, ancestor: str, rev: str) -> bool:
+        """Like `Repo.is_ancestor`, but false if `ancestor` isn't in the repository, e.g.,
+        when a stored watermark was written for another repository with the same name
+        """
+        try:
+            _ = self.repo.git.merge_base("--is-ancestor", ancestor, rev)
+        except GitCommandError:
+            return False
+        return True
+
+    @property
+    def is_dirty(self) -> bool:
+        """Whether the repository has uncommitted changes, checked on first use according to
+        `GitOptions.check_dirty`. Analysis only reads committed history, so by default only the
+        index is compared to HEAD, rather than stat-ing the whole working tree.
+        """
+        if self._is_dirty is None:
+            mode = self.options.check_dirty
+            self._is_dirty = mode != "skip" and self.repo.is_dirty(
+                index=True,
+                working_tree=mode == "working_tree",
+                untracked_files=False,
+            )
+            if self._is_dirty:
+                logger.warning(
+                    "Repository has uncommitted changes! Proceed with caution."
+                )
+        return self._is_dirty
 
     @property
     def commit_count(self):
+        """The number of commits reachable from HEAD. Cached in the store by HEAD sha,
+        and counted incrementally from the last cached HEAD when possible.
+        """
         if self._commit_count is None:
-            self._commit_count = self.repo.head.commit.count()
+            head = self.head
+            cached = self._db.get_metadata(f"commit_count:{head}")
+            if cached is not None:
+                self._commit_count = int(cached)
+                return self._commit_count
+
+            previous = self._db.get_metadata("commit_count_head")
+            previous_count = (
+                self._db.get_metadata(f"commit_count:{previous}") if previous else None
+            )
+            if (
+                previous is not None
+                and previous_count is not None
+                and self._is_ancestor(previous, head)
+            ):
+                self._commit_count = int(previous_count) + int(
+                    self.repo.git.rev_list("--count", f"{previous}..{head}")
+                )
+                self._db.delete_metadata(f"commit_count:{previous}")
+            else:
+                self._commit_count = int(self.repo.git.rev_list("--count", head))
+            self._db.set_metadata(f"commit_count:{head}", str(self._commit_count))
+            self._db.set_metadata("commit_count_head", head)
         return self._commit_count
 
     @property
-    def revs(self):
-        """The git revisions property."""
-        _, sha = self._db.get_latest_change_tuple()
-        if self._revs is None:
-            revs: list[FileChangeCommitRecord] = []
-            rev_spec = (
-                self.repo.head.commit.hexsha
-                if sha is None
-                else f"{sha}...{self.repo.head.commit.hexsha}"
-            )
-            for c in self.repo.iter_commits(
-                rev_spec, no_merges=self.options.ignore_merges
-            ):
-                revs.extend(FileChangeCommitRecord.from_git(c, self.name, by_file=True))
+    def mailmap(self) -> Mailmap:
+        """The .mailmap at the analyzed revision"""
+        if self._mailmap is None:
+            self._mailmap = Mailmap.from_objects(self.objects, self.head)
+        return self._mailmap
 
-            self._revs = self._db.insert_file_changes(revs)
+    def _sync_mailmap(self):
+        """If the .mailmap changed since the store was written, re-resolve the stored
+        identities from their raw values instead of re-ingesting the history.
+        """
+        if self._db.get_metadata("mailmap") == self.mailmap.digest:
+            return
+        pairs = self._db.raw_identity_pairs()
+        if pairs.height:
+            logger.info("The .mailmap changed, re-resolving stored identities")
+            self._db.remap_identities(self.mailmap.mapping(pairs))
+        self._db.set_metadata("mailmap", self.mailmap.digest)
 
-        assert self._revs is not None
-        count = self._revs.unique("sha").height
+    @property
+    def path_filter(self) -> PathFilter:
+        """The ignored and generated paths at the analyzed revision"""
+        if self._path_filter is None:
+            self._path_filter = PathFilter.from_objects(self.objects, self.head)
+        return self._path_filter
 
-        assert count == self._db.change_count(), (
-            "Mismatch of database and dataframe sha counts"
-        )
-        if count != self.commit_count:
+    def _sync_path_filter(self):
+        """If the generated files changed since the store was written, re-flag the stored
+        changes instead of re-ingesting the history.
+        """
+        digest = self.path_filter.digest
+        if self._db.get_metadata("generated_paths") == digest:
+            return
+        names = self._db.filenames()
+        if names.len():
+            logger.info("The generated file rules changed, re-flagging stored changes")
+            generated = names.filter(self.path_filter.generated(names))
+            _ = self._db.mark_generated(generated.to_frame("filename"))
+        self._db.set_metadata("generated_paths", digest)
+
+    @property
+    def ignored_paths(self) -> frozenset[str]:
+        """The stored paths that are ignored at the analyzed revision, if `use_gitignore`"""
+        if self._ignored_paths is None:
+            self.ingest()
+            if self.options.use_gitignore:
+                names = self._db.filenames()
+                ignored = names.filter(self.path_filter.ignored(names))
+                self._ignored_paths = frozenset(ignored)
+            else:
+                self._ignored_paths = frozenset()
+        return self._ignored_paths
+
+    def _path_mask(self, options: AnyCmdOptions, filenames: pl.Series) -> pl.Series:
+        """Which of `filenames` the data selection keeps, without ignored paths. Each
+        unique path is only matched once.
+        """
+        names = filenames.unique()
+        keep = options.glob_filter_expr(names, self.path_filter.generated(names))
+        if self.options.use_gitignore:
+            keep &= ~self.path_filter.ignored(names)
+        return filenames.is_in(names.filter(keep).implode())
+
+    @property
+    def window(self) -> Window:
+        """The requested (since, until) commit date window, as naive UTC datetimes"""
+        return (to_utc(self.options.since), to_utc(self.options.until))
+
+    def _reset_store(self, fingerprint: str):
+        self._db.create_tables(replace=True)
+        self._db.set_metadata("ingest_options", fingerprint)
+
+    def _known_heads(self, fingerprint: str) -> dict[str, str]:
+        """The stored head of every ingested ref, leaving out heads that aren't in the
+        repository, e.g., after a force push and gc, since git can't traverse from them.
+        If none is, the store was written for another repository with the same name, and
+        is reset.
+        """
+        known = self._db.ref_heads()
+        found = self.objects.info(known.values())
+        stale = [r for r, res in zip(known, found) if res is None]
+        if stale and len(stale) == len(known):
             logger.warning(
-                f"Excluding {self.commit_count - count} commits due to settings"
+                "None of the stored heads are in the repository, resetting the store"
             )
+            self._reset_store(fingerprint)
+            return {}
+        for r in stale:
+            logger.warning(f"The stored head of {r} is gone, forgetting its commits")
+            self._db.forget_ref(r)
+            del known[r]
+        return known
+
+    def _ingest_plan(self, ref: str, head: str) -> list[IngestTask]:
+        """The traversals that still need to be ingested, so the store covers the requested
+        window and paths of `ref` up to `head`.
+
+        Every stored window covers every ingested ref, so commits reachable from the head
+        of any of them are already stored, and only the commits of `head` beyond them are
+        read. Adding a branch costs its unique commits.
+        """
+        fingerprint = f"ignore_merges={self.options.ignore_merges}"
+        if self._db.get_metadata("ingest_options") != fingerprint:
+            self._reset_store(fingerprint)
+
+        plan: list[IngestTask] = []
+        known = self._known_heads(fingerprint)
+        if known and known.get(ref) != head:
+            if ref in known and not self._is_ancestor(known[ref], head):
+                logger.warning(
+                    f"{ref} was rewritten, only its new commits are ingested"
+                )
+            # bring every window that was already ingested up to the new head
+            exclude = [f"^{h}" for h in sorted(set(known.values()))]
+            for scope, since, until in self._db.all_ingest_windows():
+                pathspecs = json.loads(scope) if scope else []
+                plan.append(([head, *exclude], since, until, pathspecs))
+
+        # new windows cover the other ingested refs too
+        others = sorted({h for r, h in known.items() if r != ref} - {head})
+        for since, until in missing_windows(
+            self.window, self._db.ingest_windows(self.options.scope)
+        ):
+            plan.append(([head, *others], since, until, self.options.pathspecs))
+        return plan
+
+    def _tag_ref(self, ref: str, head: str):
+        """Records which commits are reachable from `ref`, listing only the commits since
+        its last head unless it was rewritten
+        """
+        previous = self._db.ref_heads().get(ref)
+        if previous == head:
+            return
+        if previous is not None and self._is_ancestor(previous, head):
+            shas = self.repo.git.rev_list(f"{previous}..{head}").split()
+            self._db.tag_commits(ref, head, shas)
+        else:
+            self._db.tag_commits(ref, head, self.repo.git.rev_list(head).split(), True)
+
+    @property
+    def ingest_batch_size(self) -> int | None:
+        """How many file change records are stored at a time, None to store them at once"""
+        limit = self.options.memory_limit_mb
+        # a quarter of the budget for the records, the store and the frames get the rest
+        return None if limit is None else max(limit * RECORDS_PER_MB // 4, 1)
+
+    def _traversal_kwargs(self, task: IngestTask) -> dict[str, Any]:
+        """The `git log`/`rev-list` options of a traversal"""
+        _, since, until, _ = task
+        kwargs: dict[str, Any] = {"no_merges": self.options.ignore_merges}
+        if since is not None:
+            kwargs["since"] = since.replace(tzinfo=UTC).isoformat()
+        if until is not None:
+            kwargs["until"] = until.replace(tzinfo=UTC).isoformat()
+        return kwargs
+
+    def _ingest_sharded(self, task: IngestTask) -> int | None:
+        """Ingests a traversal in parallel. The commits of one `rev-list` are split into
+        contiguous shards, each diffed and parsed by a worker process into a frame, and
+        every frame is bulk loaded in a single transaction.
+        """
+        rev_spec, _, _, pathspecs = task
+        kwargs = self._traversal_kwargs(task)
+        self._db.insert_renames(
+            read_renames(self.repo, rev_spec, pathspecs=pathspecs, **kwargs)
+        )
+        shas = self.repo.git.rev_list(rev_spec, "--", *pathspecs, **kwargs).split()
+        workers = self.options.ingest_workers
+        parts = shards(shas, workers * SHARDS_PER_WORKER)
+        logger.info(
+            f"Ingesting {len(shas)} commits in {len(parts)} shards with {workers} workers"
+        )
+        read = functools.partial(
+            read_shard,
+            Path(self.repo.git_dir),
+            repository=self.name,
+            pathspecs=pathspecs,
+            mailmap=self.mailmap,
+        )
+        with (
+            # workers are spawned, forking would copy the threads of the store and scheduler
+            ProcessPoolExecutor(workers, mp_context=get_context("spawn")) as executor,
+            ProgressReporter(
+                "ingest",
+                total=len(shas),
+                unit="commits",
+                secondary_unit="files",
+                mode=self.options.progress,
+                workers=workers,
+            ) as progress,
+        ):
+
+            def frames() -> Iterator[DataFrame]:
+                for part, df in zip(parts, executor.map(read, parts)):
+                    progress.update(len(part), secondary=df.height)
+                    yield df
+
+            return self._db.insert_file_change_frames(
+                frames(), self.path_filter.generated
+            )
+
+    def _ingest(
+        self, task: IngestTask, head: str
+    ) -> Iterator[list[FileChangeCommitRecord]]:
+        """Reads the changes of a traversal, in batches of whole commits"""
+        rev_spec, since, until, pathspecs = task
+        kwargs = self._traversal_kwargs(task)
+        unbounded = rev_spec == [head] and since is None and until is None
+        batch_size = self.ingest_batch_size
+        revs: list[FileChangeCommitRecord] = []
+        with ProgressReporter(
+            "ingest",
+            total=self.commit_count if unbounded and not pathspecs else None,
+            unit="commits",
+            secondary_unit="files",
+            mode=self.options.progress,
+        ) as progress:
+            # a single traversal detects the renames of every commit in this task
+            self._db.insert_renames(
+                read_renames(self.repo, rev_spec, pathspecs=pathspecs, **kwargs)
+            )
+            # like `Repo.iter_commits`, which takes a single revision, not exclusions
+            commits = (
+                Commit(self.repo, bytes.fromhex(sha))
+                for sha in self.repo.git.rev_list(
+                    *rev_spec, "--", *pathspecs, **kwargs
+                ).split()
+            )
+
+            def stats_command(c: Commit) -> list[str]:
+                parent = c.parents[0].hexsha if c.parents else None
+                return file_stats_args(c.hexsha, parent, pathspecs)
+
+            # commits are diffed concurrently, and recorded in traversal order
+            for c, output in self.scheduler.map(commits, stats_command):
+                stats = parse_file_stats(
+                    output.decode("utf-8", errors="surrogateescape"),
+                    root=not c.parents,
+                )
+                records = list(
+                    FileChangeCommitRecord.from_git(
+                        c,
+                        self.name,
+                        by_file=True,
+                        mailmap=self.mailmap,
+                        pathspecs=pathspecs,
+                        stats=stats,
+                    )
+                )
+                revs.extend(records)
+                progress.update(secondary=len(records))
+                if batch_size is not None and len(revs) >= batch_size:
+                    yield revs
+                    revs = []
+        yield revs
+
+    def ingest(self):
+        """Brings the store up to date with the requested window and paths of the analyzed
+        ref, without loading the history. Only commits the store doesn't have yet are read
+        from git.
+        """
+        with self._lock:
+            ref, head = self.ref, self.head
+            key = (
+                ref,
+                head,
+                self.options.scope,
+                self.window,
+                self.options.ignore_merges,
+                self.mailmap.digest,
+            )
+            if self._ingested == key:
+                return
+            _ = self.is_dirty
+            self._ingest_ref(ref, head)
+            self._ingested = key
+            self._revs = None
+            self._identities = None
+            self._resolved_revs = None
+            self._lineage = None
+            self._binary_files = None
+            self._ignored_paths = None
+            self._covers_store = None
+            self._filtered = {}
+            self._rollups = {}
+
+    def _ingest_ref(self, ref: str, head: str):
+        """Ingests the requested window and paths of any ref, and tags its commits"""
+        plan = self._ingest_plan(ref, head)
+        self._sync_mailmap()
+        self._sync_path_filter()
+        generated = self.path_filter.generated
+        complete = True
+        for task in plan:
+            if self.options.ingest_workers > 1:
+                complete = self._ingest_sharded(task) is not None and complete
+                continue
+            for batch in self._ingest(task, head):
+                complete = (
+                    self._db.insert_file_changes(batch, generated) is not None
+                    and complete
+                )
+
+        if complete:
+            self._db.add_ingest_window(self.options.scope, *self.window)
+            self._tag_ref(ref, head)
+            if plan:
+                self._db.set_metadata("ingested_head", head)
+
+    @property
+    def revs(self):
+        """The git revisions property, the ingested changes in the requested window and paths.
+        Memory-mapped from a snapshot when an earlier run loaded the same history.
+        """
+        if self._revs is None:
+            self.ingest()
+            watermark = json.dumps(
+                [SCHEMA_VERSION, *(self._ingested or ()), self.path_filter.digest],
+                default=str,
+            )
+            if self._snapshot is not None:
+                self._revs = self._snapshot.load(watermark)
+                if self._revs is not None:
+                    return self._revs
+
+            all_revs = self._db.all_file_changes(*self.window, refs=[self.ref])
+            if self.options.pathspecs:
+                all_revs = all_revs.filter(self.options.pathspec_filter_expr())
+            self._revs = all_revs
+
+            count = self._revs.unique("sha").height
+            scoped = self.options.pathspecs or self.window != (None, None)
+            assert scoped or count == self._db.change_count(self.ref), (
+                "Mismatch of database and dataframe sha counts"
+            )
+            if count != self.commit_count:
+                logger.warning(
+                    f"Excluding {self.commit_count - count} commits due to settings"
+                )
+            if self._snapshot is not None:
+                self._snapshot.save(watermark, self._revs)
         return self._revs
 
-    def filtered_revs(self, options: AnyCmdOptions, ignore_limit=False):
-        df = (
-            self.revs.with_columns(
-                pl.col(options.group_by_key).replace(options.aliases)
+    @property
+    def identities(self) -> DataFrame:
+        """Maps every (name, email) pair in the history to a canonical identity.
+        Computed once over all distinct pairs and persisted in the store.
+        """
+        if self._identities is None:
+            self.ingest()
+            self._identities = self._db.replace_identities(
+                resolve_identities(self._db.identity_pairs())
             )
-            .filter(pl.col(options.group_by_key).is_in(options.exclude_users).not_())
-            .filter(
-                options.glob_filter_expr(
-                    self.revs["filename"],
+        return self._identities
+
+    @property
+    def lineage(self) -> DataFrame:
+        """Maps every path in the history to a stable file identity that follows renames.
+        Rebuilt from the stored renames only when the ingested history changed. Renames
+        on every ingested ref are followed.
+        """
+        if self._lineage is None:
+            self.ingest()
+            head = self._db.get_metadata("ingested_head")
+            if self._db.get_metadata("lineage_head") == head:
+                self._lineage = self._db.file_lineage()
+            else:
+                self._lineage = self._db.replace_file_lineage(
+                    build_lineage(self._db.file_dates(), self._db.renames())
                 )
+                self._db.set_metadata("lineage_head", str(head))
+        return self._lineage
+
+    def _follow_renames(self, df: DataFrame) -> DataFrame:
+        """Replaces each filename with the most recent path of its lineage"""
+        return (
+            df.join(
+                self.lineage.select("filename", "lineage_path"),
+                on="filename",
+                how="left",
+                maintain_order="left",
             )
+            .with_columns(pl.coalesce("lineage_path", "filename").alias("filename"))
+            .drop("lineage_path")
         )
-        if not ignore_limit:
-            if not options.limit or options.limit <= 0:
-                df = df.sort(by=options.sort_key)
-            elif options.sort_descending:
-                df = df.bottom_k(options.limit, by=options.sort_key)
-            else:
-                df = df.top_k(options.limit, by=options.sort_key)
 
+    def _apply_aliases(self, df: DataFrame, options: AnyCmdOptions) -> DataFrame:
+        if options.resolve_identities:
+            df = apply_identities(df, self.identities)
+        if options.aliases:
+            df = df.with_columns(pl.col(options.group_by_key).replace(options.aliases))
         return df
 
+    def _select(self, df: DataFrame, options: AnyCmdOptions) -> DataFrame:
+        """The changes of `df` that the requested paths and the data selection keep, with
+        the selected identities. Like `filtered_revs`, for changes read apart from `revs`.
+        """
+        if self.options.pathspecs:
+            df = df.filter(self.options.pathspec_filter_expr())
+        df = self._apply_aliases(df, options)
+        return df.filter(
+            pl.col(options.group_by_key).is_in(options.exclude_users).not_(),
+            self._path_mask(options, df["filename"]),
+        )
+
+    def filtered_revs(self, options: AnyCmdOptions, ignore_limit=False):
+        """The revisions selected by the data selection options. Computed once per distinct
+        selection, so reports that share a selection share the result. Different
+        selections are filtered concurrently.
+        """
+        key = (options.selection_key, ignore_limit)
+        with self._lock:
+            cached = self._filtered.get(key)
+        if cached is not None:
+            return cached
+        if ignore_limit:
+            df = self._filter_revs(self.revs, options)
+        else:
+            df = self._limit_revs(
+                self.filtered_revs(options, ignore_limit=True), options
+            )
+        with self._lock:
+            return self._filtered.setdefault(key, df)
+
+    def _filter_revs(self, revs: DataFrame, options: AnyCmdOptions) -> DataFrame:
+        if options.resolve_identities:
+            if self._resolved_revs is None:
+                self._resolved_revs = apply_identities(revs, self.identities)
+            revs = self._resolved_revs
+        if options.aliases:
+            revs = revs.with_columns(
+                pl.col(options.group_by_key).replace(options.aliases)
+            )
+        return revs.filter(
+            pl.col(options.group_by_key).is_in(options.exclude_users).not_()
+        ).filter(self._path_mask(options, revs["filename"]))
+
+    def _limit_revs(self, df: DataFrame, options: AnyCmdOptions) -> DataFrame:
+        if not options.limit or options.limit <= 0:
+            return df.sort(by=options.sort_key)
+        elif options.sort_descending:
+            return df.bottom_k(options.limit, by=options.sort_key)
+        else:
+            return df.top_k(options.limit, by=options.sort_key)
+
+    def _cached(
+        self, command: str, options: AnyCmdOptions, compute: Callable[[], DataFrame]
+    ) -> DataFrame:
+        """The result of `compute`, reused if the command already ran with the same options
+        on the same data. A hit doesn't read the history at all.
+        """
+        if self._results is None:
+            return compute()
+        key = result_key(
+            command, self.options, options, exclude=RESULT_INDEPENDENT_FIELDS
+        )
+        return self._results.cached(key, f"{self.head}:{SCHEMA_VERSION}", compute)
+
+    def _use_rollups(self, options: AnyCmdOptions) -> bool:
+        """Whether a report can be answered from the rollups in the store, which aggregate
+        every ingested commit. That requires an unscoped analysis of a ref that reaches
+        every stored commit, and no row filters, including ignored paths.
+        """
+        return not (
+            options.filters_rows
+            or self.options.pathspecs
+            or self.window != (None, None)
+            or self.ignored_paths
+            or not self.covers_store
+        )
+
+    @property
+    def covers_store(self) -> bool:
+        """Whether every stored commit is reachable from the analyzed ref, rather than
+        only from other ingested branches
+        """
+        if self._covers_store is None:
+            self.ingest()
+            self._covers_store = self._db.covers_store(self.ref)
+        return self._covers_store
+
+    def _rollup(self, table: str) -> DataFrame:
+        self.ingest()
+        with self._lock:
+            if table not in self._rollups:
+                self._rollups[table] = getattr(self._db, table)()
+            return self._rollups[table]
+
+    def _hourly_activity(self, options: AnyCmdOptions) -> DataFrame:
+        """Activity per identity and hour from the rollups, with the selected identities"""
+        df = self._rollup("activity_by_hour").rename(
+            {
+                "authored_hour": "authored_datetime",
+                "committed_hour": "committed_datetime",
+            }
+        )
+        if not options.generated:
+            df = df.filter("has_source").with_columns(
+                pl.col(c) - pl.col(f"generated_{c}")
+                for c in ("lines", "insertions", "deletions")
+            )
+        df = df.with_columns(
+            pl.col("commits", "lines", "insertions", "deletions").cast(pl.UInt64)
+        )
+        return self._apply_aliases(df, options).sort(by=options.sort_key)
+
+    def _file_activity(self, options: AnyCmdOptions) -> DataFrame:
+        """Activity per path from the rollups"""
+        df = self._rollup("activity_by_file")
+        if not options.generated:
+            df = df.filter(pl.col("is_generated").not_())
+        return df.with_columns(
+            pl.col("commits", "lines", "insertions", "deletions").cast(pl.UInt64)
+        ).sort("filename")
+
+    def prepare(self, selections: Iterable[AnyCmdOptions], workers: int | None = None):
+        """Loads everything that reports with these selections read from the store,
+        so the reports can then run concurrently. The revisions of each distinct selection
+        that can't be answered from the rollups are filtered side by side.
+        """
+        selections = list(selections)
+        self.ingest()
+        reading = {s.selection_key: s for s in selections if not self._use_rollups(s)}
+        if reading:
+            _ = self.revs
+        if any(s.resolve_identities for s in selections):
+            _ = self.identities
+            if reading and self._resolved_revs is None:
+                self._resolved_revs = apply_identities(self.revs, self.identities)
+        if any(s.follow_renames for s in selections):
+            _ = self.lineage
+        if any(self._use_rollups(s) for s in selections):
+            for table in ("activity_by_hour", "activity_by_file"):
+                _ = self._rollup(table)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for _ in executor.map(
+                lambda s: self.filtered_revs(s, ignore_limit=True), reading.values()
+            ):
+                pass
+
     @property
-    def default_branch(self):
-        if self.options.branch is None:
-            branches = {b.name for b in self.repo.branches}
-            for n in ["main", "master"]:
-                if n in branches:
-                    self.options.branch = n
-                    break
-        return self.options.branch
+    def default_branch(self) -> str | None:
+        """`GitOptions.branch`, or else the `main` or `master` branch, in that order"""
+        if self.options.branch is not None:
+            return self.options.branch
+        branches = {b.name for b in self.repo.branches}
+        return next((n for n in ("main", "master") if n in branches), None)
 
     @property
     def is_large(self):
@@ -173,7 +861,7 @@ class RepoAnalyzer:
     def _output(
         self,
         output_df: DataFrame,
-        options: AnyCmdOptions,
+        options: FileSaveOptions,
         plot_df: DataFrame | None = None,
         plot_type: SupportedPlotType | None = None,
         **kwargs,
@@ -204,8 +892,83 @@ class RepoAnalyzer:
 
     def summary(self, options: SummaryCmdOptions) -> DataFrame:
         """A simple summary with counts of files, contributors, commits."""
+        summary_df = self._cached("summary", options, lambda: self._summary(options))
+        self._output(summary_df, options)
+        return summary_df
+
+    def sketch(
+        self,
+        generated: bool = False,
+        since: str | None = None,
+        until: str | None = None,
+    ) -> DataFrame:
+        """The HyperLogLog registers of the ingested history, or of the months from `since`
+        up to and including `until`, like `2024-01`. Sketches of several repositories and
+        periods can be merged with `sketch.merge`, and counted with `sketch.estimate`.
+        """
+        self.ingest()
+        return self._db.sketches(generated, since, until)
+
+    def _use_sketches(self, options: SummaryCmdOptions) -> bool:
+        """Whether the sketches count the selection, which also rules out merging
+        identities, since sketches only count the stored values
+        """
+        return (
+            self._use_rollups(options)
+            and not options.resolve_identities
+            and not options.aliases
+        )
+
+    def _approximate_summary(self, options: SummaryCmdOptions) -> DataFrame:
+        counts = {
+            kind: (int(n), int(error))
+            for kind, n, error in estimate(self.sketch(options.generated)).iter_rows()
+        }
+        first, last = self._db.sketch_bounds(options.generated)
+        summary: dict[str, Any] = {"name": [self.name]}
+        for column, kind in (
+            ("files", "filename"),
+            ("contributors", options.group_by_key),
+            ("commits", "sha"),
+        ):
+            summary[column], summary[f"{column}_error"] = counts.get(kind, (0, 0))
+        return DataFrame(
+            {**summary, "first_commit": first, "last_commit": last}
+        ).select(
+            "name",
+            pl.col("files", "contributors", "commits").cast(pl.UInt32),
+            "first_commit",
+            "last_commit",
+            cs.ends_with("_error").cast(pl.UInt64),
+        )
+
+    def _summary(self, options: SummaryCmdOptions) -> DataFrame:
+        if options.approximate:
+            if self._use_sketches(options):
+                return self._approximate_summary(options)
+            logger.info("The sketches can't count this selection, counting exactly")
+            return self._exact_summary(options).with_columns(
+                pl.lit(0, pl.UInt64).alias(f"{c}_error")
+                for c in ("files", "contributors", "commits")
+            )
+        return self._exact_summary(options)
+
+    def _exact_summary(self, options: SummaryCmdOptions) -> DataFrame:
+        if self._use_rollups(options):
+            activity = self._hourly_activity(options)
+            return DataFrame(
+                {
+                    "name": [self.name],
+                    "files": self._file_activity(options)["filename"].n_unique(),
+                    "contributors": activity[options.group_by_key].n_unique(),
+                    "commits": activity["commits"].sum(),
+                    "first_commit": activity["first_authored"].min(),
+                    "last_commit": activity["last_authored"].max(),
+                }
+            )
+
         df = self.filtered_revs(options)
-        summary_df = DataFrame(
+        return DataFrame(
             {
                 "name": df["repository"].unique(),
                 "files": df["filename"].unique().count(),
@@ -215,31 +978,77 @@ class RepoAnalyzer:
                 "last_commit": df["authored_datetime"].max(),
             }
         )
-        self._output(summary_df, options)
-        return summary_df
 
     def revisions(self, options: RevisionsCmdOptions):
         revision_df = self.filtered_revs(options)
         self._output(revision_df, options)
         return revision_df
 
-    def contributor_report(self, options: ActivityReportCmdOptions) -> DataFrame:
-        report_df = (
-            self.filtered_revs(options)
-            .group_by(options.group_by_key)
-            .agg(pl.sum("lines"), pl.sum("insertions"), pl.sum("deletions"))
-            .with_columns((pl.col("insertions") - pl.col("deletions")).alias("net"))
+    def identity_report(self, options: IdentitiesCmdOptions) -> DataFrame:
+        """Every name and email pair in the history, with the identity it resolves to"""
+        report_df = self.identities
+        self._output(report_df, options, filename=f"{self.name}_identities")
+        return report_df
+
+    def _sampled(
+        self, options: ActivityReportCmdOptions, by: str, fraction: float
+    ) -> DataFrame:
+        """Activity per `by`, estimated from a sample of the commits, so only that
+        fraction of the history is read from the store
+        """
+        self.ingest()
+        df = self._select(
+            self._db.all_file_changes(*self.window, refs=[self.ref], sample=fraction),
+            options,
+        )
+        if by == "filename" and options.follow_renames:
+            df = self._follow_renames(df)
+        df = df.with_columns(
+            net=pl.col("insertions").cast(pl.Int64) - pl.col("deletions")
         )
+        return scale_sample(
+            df, by, ("lines", "insertions", "deletions", "net"), fraction
+        ).with_columns(
+            pl.col("lines", "insertions", "deletions").cast(pl.UInt64),
+            pl.col("net").cast(pl.Int64),
+            cs.ends_with("_error").cast(pl.UInt64),
+        )
+
+    def contributor_report(self, options: ActivityReportCmdOptions) -> DataFrame:
+        def compute() -> DataFrame:
+            if options.sample is not None:
+                return self._sampled(options, options.group_by_key, options.sample)
+            if self._use_rollups(options):
+                df = self._hourly_activity(options)
+            else:
+                df = self.filtered_revs(options)
+            return (
+                df.group_by(options.group_by_key)
+                .agg(pl.sum("lines"), pl.sum("insertions"), pl.sum("deletions"))
+                .with_columns((pl.col("insertions") - pl.col("deletions")).alias("net"))
+            )
+
+        report_df = self._cached("contributor_report", options, compute)
         self._output(report_df, options)
         return report_df
 
     def file_report(self, options: ActivityReportCmdOptions) -> DataFrame:
-        report_df = (
-            self.filtered_revs(options)
-            .group_by("filename")
-            .agg(pl.sum("lines"), pl.sum("insertions"), pl.sum("deletions"))
-            .with_columns((pl.col("insertions") - pl.col("deletions")).alias("net"))
-        )
+        def compute() -> DataFrame:
+            if options.sample is not None:
+                return self._sampled(options, "filename", options.sample)
+            if self._use_rollups(options):
+                df = self._file_activity(options)
+            else:
+                df = self.filtered_revs(options)
+            if options.follow_renames:
+                df = self._follow_renames(df)
+            return (
+                df.group_by("filename")
+                .agg(pl.sum("lines"), pl.sum("insertions"), pl.sum("deletions"))
+                .with_columns((pl.col("insertions") - pl.col("deletions")).alias("net"))
+            )
+
+        report_df = self._cached("file_report", options, compute)
         if (
             isinstance(options.sort_key, str)
             and options.sort_key not in report_df.columns
@@ -250,10 +1059,15 @@ class RepoAnalyzer:
         return report_df
 
     def _blame_with_dt(
-        self, rev: str, dt: datetime, options: BlameCmdOptions, **kwargs
-    ) -> DataFrame:
-        df = self.blame(options, rev, **kwargs)
-        return df.with_columns(datetime=dt)
+        self, rev_dt: tuple[str, datetime], options: BlameCmdOptions, data_field: str
+    ) -> tuple[DataFrame, float]:
+        """Blame a single revision, returning the frame and the seconds spent on it. Only
+        the cumulative result is cached, not the blame of every revision.
+        """
+        start = time.perf_counter()
+        rev, dt = rev_dt
+        df = self._blame(options, rev, data_field, headless=True)
+        return df.with_columns(datetime=dt), time.perf_counter() - start
 
     def blame(
         self,
@@ -264,54 +1078,251 @@ class RepoAnalyzer:
     ) -> DataFrame:
         """For a given revision, lists the number of total lines contributed by the aggregating entity"""
 
-        rev = self.repo.head.commit.hexsha if rev is None else rev
-        files_at_rev = self._file_names_at_rev(rev)
-        logger.debug(f"Starting blame for rev: {rev}")
-        # git blame for each file.
-        # so the number of lines items for each file is the number of lines in the
-        # file at the specified revision
-        # BlameEntry
-        blame_map: dict[str, Iterator[BlameEntry]] = {
-            f: self.repo.blame_incremental(
-                rev,
-                f,
-                w=self.options.ignore_whitespace,
-                no_merges=self.options.ignore_merges,
-            )
-            for f in files_at_rev.filter(
-                options.glob_filter_expr(
-                    files_at_rev,
-                )
+        rev = self.head if rev is None else self.objects.rev_parse(rev)
+        agg_df = self._cached(
+            f"blame:{rev}:{data_field}",
+            options,
+            lambda: self._blame(options, rev, data_field, headless),
+        )
+        if not headless:
+            self._output(
+                agg_df,
+                options,
+                plot_type="blame",
+                title=f"{self.name} Blame at {rev[:10]}",
+                x=f"{data_field}:Q",
+                y=options.group_by_key,
+                filename=f"{self.name}_blame_by_{options.group_by_key}",
             )
-        }
+
+        return agg_df
+
+    @property
+    def binary_files(self) -> frozenset[str]:
+        """The paths the ingested history only ever changed as binary files"""
+        if self._binary_files is None:
+            self.ingest()
+            self._binary_files = frozenset(self._db.binary_files()["filename"])
+        return self._binary_files
+
+    def blame_skips(
+        self, options: BlameCmdOptions, rev: str | None = None
+    ) -> DataFrame:
+        """The files at a revision that blame skips, with the reason: `binary`, `size`
+        or `lines`
+        """
+        rev = self.head if rev is None else self.objects.rev_parse(rev)
+        return self._blame_files(options, rev)[1]
+
+    def _blame_files(
+        self, options: BlameCmdOptions, rev: str
+    ) -> tuple[DataFrame, DataFrame]:
+        """Splits the files at a revision into those to blame, with their sizes, largest
+        first, since they take longest to blame, and those to skip. Sizes come with the
+        tree listing, so only line counts need the content of a blob.
+        """
+        listing = self.objects.ls_tree(rev, with_sizes=True)
+        listing = listing.filter(self._path_mask(options, listing["filename"]))
+        max_size = (
+            None
+            if options.max_file_size_kb is None
+            else options.max_file_size_kb * 1024
+        )
+        binary = self.binary_files
+
+        keep: list[tuple[int, str]] = []
+        skips: dict[str, list[Any]] = {"filename": [], "size": [], "reason": []}
+        for filename, sha, size in listing.select(
+            "filename", "sha", "size"
+        ).iter_rows():
+            reason = None
+            if filename in binary:
+                reason = "binary"
+            elif max_size is not None and size > max_size:
+                reason = "size"
+            elif options.max_lines is not None:
+                _, _, content = self.objects.read(sha)
+                if b"\0" in content[:BINARY_SNIFF_BYTES]:
+                    reason = "binary"
+                elif content.count(b"\n") > options.max_lines:
+                    reason = "lines"
+            if reason is None:
+                keep.append((size, filename))
+            else:
+                for k, v in (
+                    ("filename", filename),
+                    ("size", size),
+                    ("reason", reason),
+                ):
+                    skips[k].append(v)
+        keep.sort(key=lambda k: (-k[0], k[1]))
+        return DataFrame(
+            [(filename, size) for size, filename in keep],
+            schema={"filename": pl.String, "size": pl.UInt64},
+            orient="row",
+        ), DataFrame(
+            skips,
+            schema={"filename": pl.String, "size": pl.UInt64, "reason": pl.String},
+        )
+
+    def _blame_args(self) -> list[str]:
+        # the number of lines attributed to commits in each file is the number of lines
+        # in the file at the specified revision
+        blame_args = ["blame", "-p", "--incremental"]
+        if self.options.ignore_whitespace:
+            blame_args.append("-w")
+        if self.options.ignore_merges:
+            blame_args.append("--no-merges")
+        return blame_args
+
+    def estimate_blame(
+        self,
+        options: BlameCmdOptions,
+        rev: str | None = None,
+        cumulative: bool = False,
+        budget_seconds: float | None = None,
+    ) -> BlameEstimate:
+        """Predicts the cost of `blame` at `rev`, or of `cumulative_blame`, without running
+        it. The files to blame are listed at a few revisions spread over the history, and
+        a few files of the last one, from small to large, are blamed and timed.
+        """
+        if cumulative:
+            revs = self._cumulative_revisions(options)["sha"].to_list()
+        else:
+            revs = [self.head if rev is None else self.objects.rev_parse(rev)]
+        if not revs:
+            return BlameEstimate(0, 0, 0, 0.0, 0.0, self.scheduler.max_processes, 0)
+        step = max(1, math.ceil(len(revs) / BLAME_SAMPLE_REVISIONS))
+        sampled = sorted({*revs[::step], revs[-1]}, key=revs.index)
+        listings = {r: self._blame_files(options, r)[0] for r in sampled}
+        files = sum(df.height for df in listings.values()) / len(sampled)
+        size = sum(df["size"].sum() for df in listings.values()) / len(sampled)
+
+        latest = listings[revs[-1]].sort("size", "filename")
+        picks = latest[
+            sorted(
+                {
+                    round(i * (latest.height - 1) / max(BLAME_SAMPLE_FILES - 1, 1))
+                    for i in range(min(BLAME_SAMPLE_FILES, latest.height))
+                }
+            )
+        ]
+        samples = []
+        for filename, blob_size in picks.select("filename", "size").iter_rows():
+            start = time.perf_counter()
+            ((_, hunks),) = self.scheduler.map(
+                [filename],
+                lambda f: [*self._blame_args(), revs[-1], "--", f],
+                parse_blame_incremental,
+            )
+            samples.append(
+                BlameSample(blob_size, time.perf_counter() - start, len(hunks))
+            )
+        model = BlameCostModel.fit(samples)
+        # the largest file takes the most memory to blame
+        git_memory = (
+            peak_rss(
+                [
+                    "git",
+                    f"--git-dir={self.repo.git_dir}",
+                    *self._blame_args(),
+                    revs[-1],
+                    "--",
+                    latest["filename"][-1],
+                ]
+            )
+            if latest.height
+            else 0
+        )
+
+        processes = self.scheduler.max_processes
+        cpu_seconds = model.seconds(files, size) * len(revs)
+        wall_seconds = cpu_seconds / processes
+        in_flight = min(REVISIONS_IN_FLIGHT, len(revs)) if cumulative else 1
+        peak_memory = (
+            None
+            if git_memory is None
+            else in_flight * size * model.hunks_per_byte * HUNK_BYTES
+            + processes * git_memory
+        )
+        every, exclude_globs = None, ()
+        if budget_seconds is not None and wall_seconds > budget_seconds:
+            every = suggest_every(len(revs), wall_seconds, budget_seconds)
+            # the last revision stands for every revision
+            exclude_globs = suggest_exclusions(
+                directory_costs(latest, model).with_columns(
+                    pl.col("seconds") * len(revs) / processes
+                ),
+                wall_seconds,
+                budget_seconds,
+            )
+        return BlameEstimate(
+            revisions=len(revs),
+            invocations=round(files * len(revs)),
+            bytes=round(size * len(revs)),
+            cpu_seconds=cpu_seconds,
+            wall_seconds=wall_seconds,
+            processes=processes,
+            peak_memory_bytes=None if peak_memory is None else round(peak_memory),
+            budget_seconds=budget_seconds,
+            every=every,
+            exclude_globs=exclude_globs,
+        )
+
+    def _blame(
+        self, options: BlameCmdOptions, rev: str, data_field: str, headless: bool
+    ) -> DataFrame:
+        kept, skipped = self._blame_files(options, rev)
+        files = kept["filename"].to_list()
+        if skipped.height:
+            reasons = ", ".join(
+                f"{count} {reason}"
+                for reason, count in skipped["reason"]
+                .value_counts(sort=True)
+                .iter_rows()
+            )
+            logger.info(f"Skipping {skipped.height} files at {rev[:10]}: {reasons}")
+        logger.debug(f"Starting blame for rev: {rev}")
+        blame_args = self._blame_args()
+
         data: list[dict[str, Any]] = []
-        for f, blame_entries in blame_map.items():
-            for blame_entry in blame_entries:
-                commit: Commit_ish = blame_entry.commit
-                author: Actor = commit.author
-                committer: Actor = commit.committer
+        progress = ProgressReporter(
+            f"blame {rev[:10]}",
+            total=len(files),
+            unit="files",
+            secondary_unit="lines",
+            mode="none" if headless else self.options.progress,
+        )
+        # files finish in any order, so the large files started first never hold back
+        # the small ones that fill the processes around them
+        for f, hunks in self.scheduler.map_unordered(
+            files, lambda f: [*blame_args, rev, "--", f], parse_blame_incremental
+        ):
+            lines = 0
+            for hunk in hunks:
+                author, committer = hunk.commit.author, hunk.commit.committer
                 data.append(
                     {
                         "point_in_time": rev,
                         "filename": f,
-                        "sha": commit.hexsha,
-                        "line_range": blame_entry.linenos,
+                        "sha": hunk.commit.sha,
+                        "line_count": hunk.lines,
                         "author_name": author.name,
-                        "author_email": author.email.lower() if author.email else "",
+                        "author_email": author.email,
                         "committer_name": committer.name,
-                        "committer_email": committer.email.lower()
-                        if committer.email
-                        else "",
-                        "committed_datetime": commit.committed_datetime,
-                        "authored_datetime": commit.authored_datetime,
+                        "committer_email": committer.email,
+                        "committed_datetime": committer.datetime,
+                        "authored_datetime": author.datetime,
                     }
                 )
+                lines += hunk.lines
+            progress.update(secondary=lines)
+        progress.close()
 
         blame_df = (
-            DataFrame(data)
-            .with_columns(pl.col(options.group_by_key).replace(options.aliases))
+            self._apply_aliases(self.mailmap.apply(DataFrame(data)), options)
             .filter(pl.col(options.group_by_key).is_in(options.exclude_users).not_())
-            .with_columns(pl.col("line_range").list.len().alias(data_field))
+            .with_columns(pl.col("line_count").alias(data_field))
         )
 
         agg_df = blame_df.group_by(options.group_by_key).agg(pl.sum(data_field))
@@ -324,47 +1335,19 @@ class RepoAnalyzer:
             agg_df = agg_df.bottom_k(options.limit, by=options.sort_key)
         else:
             agg_df = agg_df.top_k(options.limit, by=options.sort_key)
-        if not headless:
-            self._output(
-                agg_df,
-                options,
-                plot_type="blame",
-                title=f"{self.name} Blame at {rev[:10] if rev else 'HEAD'}",
-                x=f"{data_field}:Q",
-                y=options.group_by_key,
-                filename=f"{self.name}_blame_by_{options.group_by_key}",
-            )
-
         return agg_df
 
     def cumulative_blame(
-        self, options: BlameCmdOptions, batch_size=2, data_field="lines"
+        self, options: BlameCmdOptions, data_field="lines"
     ) -> DataFrame:
         """For each revision over time, the number of total lines authored or commmitted by
         an actor at that point in time.
         """
-        total = DataFrame()
-        sha_dates = (
-            self.filtered_revs(options, ignore_limit=True)
-            .sort(cs.temporal())
-            .select(pl.col(("sha", "committed_datetime")))
-            .unique("sha", keep="first", maintain_order=True)
-            .iter_rows()
+        total = self._cached(
+            f"cumulative_blame:{data_field}",
+            options,
+            lambda: self._cumulative_blame(options, data_field),
         )
-
-        total = DataFrame()
-
-        msg = f"Using {max_cpu_count} cpus"
-        logger.info(msg)
-        # Manually set up the pool rather than use a context manager, because
-        # killing the subprocesses breaks coverage
-        with Pool(processes=max_cpu_count, initargs={"daemon": True}) as p:
-            fn = functools.partial(self._blame_with_dt, options=options, headless=True)
-            blame_frame_results = p.starmap(fn, sha_dates, chunksize=batch_size)
-
-        for blame_dfs in blame_frame_results:
-            _ = total.vstack(blame_dfs, in_place=True)
-
         pivot_df = (
             total.pivot(
                 options.group_by_key,
@@ -388,6 +1371,70 @@ class RepoAnalyzer:
         )
         return total
 
+    def _cumulative_revisions(self, options: BlameCmdOptions) -> DataFrame:
+        """The revisions a cumulative blame blames, oldest first, with their dates and the
+        lines of the selected files at each, which is what blaming one costs. With
+        `every`, only every Nth revision counting back from the latest.
+        """
+        revisions = (
+            self.filtered_revs(options, ignore_limit=True)
+            .sort(cs.temporal())
+            .group_by("sha", maintain_order=True)
+            .agg(
+                pl.first("committed_datetime"),
+                lines=(pl.col("insertions").cast(pl.Int64) - pl.col("deletions")).sum(),
+            )
+            .with_columns(pl.col("lines").cum_sum())
+        )
+        return revisions.reverse().gather_every(options.every).reverse()
+
+    def _cumulative_blame(self, options: BlameCmdOptions, data_field: str) -> DataFrame:
+        # the largest revisions are blamed first, so the small ones are left to even out
+        # the end of the run
+        sha_dates = list(
+            self._cumulative_revisions(options)
+            .sort("lines", descending=True, maintain_order=True)
+            .select("sha", "committed_datetime")
+            .iter_rows()
+        )
+
+        limit = self.options.memory_limit_mb
+        # revision frames are spilled to disk past an eighth of the budget
+        spool = FrameSpool(max_bytes=None if limit is None else limit * 2**20 // 8)
+
+        # revisions are blamed side by side, so the scheduler always has files queued
+        # from the next revision while the last files of one are still running
+        workers = min(REVISIONS_IN_FLIGHT, max(len(sha_dates), 1))
+        logger.info(
+            f"Blaming {workers} revisions at a time, "
+            f"with up to {self.scheduler.max_processes} git processes"
+        )
+        with (
+            spool,
+            ThreadPoolExecutor(max_workers=workers) as executor,
+            ProgressReporter(
+                "cumulative blame",
+                total=len(sha_dates),
+                unit="revisions",
+                mode=self.options.progress,
+                workers=workers,
+                check_every=1,
+            ) as progress,
+        ):
+            fn = functools.partial(
+                self._blame_with_dt,
+                options=options,
+                data_field=data_field,
+            )
+            for future in as_completed([executor.submit(fn, r) for r in sha_dates]):
+                blame_df, busy = future.result()
+                spool.append(blame_df)
+                progress.update(busy=busy)
+            collected = spool.collect()
+        if collected.is_empty():
+            return collected
+        return collected.sort("datetime", options.group_by_key, maintain_order=True)
+
     def bus_factor(self, options: BusFactorCmdOptions) -> DataFrame:
         if options.limit:
             logger.warning(
@@ -397,17 +1444,23 @@ class RepoAnalyzer:
         return df
 
     def punchcard(self, options: PunchcardCmdOptions) -> DataFrame:
-        df = (
-            self.filtered_revs(options)
-            .filter(pl.col(options.group_by_key) == options.identifier)
-            .pivot(
-                options.group_by_key,
-                values=["lines"],
-                index=options.punchcard_key,
-                aggregate_function="sum",
+        def compute() -> DataFrame:
+            if self._use_rollups(options):
+                df = self._hourly_activity(options)
+            else:
+                df = self.filtered_revs(options)
+            return (
+                df.filter(pl.col(options.group_by_key) == options.identifier)
+                .pivot(
+                    options.group_by_key,
+                    values=["lines"],
+                    index=options.punchcard_key,
+                    aggregate_function="sum",
+                )
+                .sort(by=cs.temporal())
             )
-            .sort(by=cs.temporal())
-        )
+
+        df = self._cached("punchcard", options, compute)
         plot_df = df.rename(
             {options.identifier: "count", options.punchcard_key: "time"}
         )
@@ -425,5 +1478,299 @@ class RepoAnalyzer:
         )
         return df
 
-    def file_timeline(self, options: ActivityReportCmdOptions):
-        pass
+    def punchcards(self, options: PunchcardsCmdOptions) -> DataFrame:
+        """Commits and lines by day of week and hour for many users at once. Every
+        histogram comes from a single group by, and is plotted as one faceted chart.
+        """
+        report_df = self._cached(
+            "punchcards", options, lambda: self._punchcards(options)
+        )
+        key = options.group_by_key
+        self._output(
+            report_df,
+            options,
+            plot_type="punchcards",
+            x="hour:O",
+            y="day:O",
+            color="sum(lines):Q",
+            size="sum(lines):Q",
+            facet=f"{key}:N",
+            title=f"{self.name} Punchcards",
+            filename=f"{self.name}_punchcards_by_{key}",
+        )
+        return report_df
+
+    def _punchcards(self, options: PunchcardsCmdOptions) -> DataFrame:
+        if self._use_rollups(options):
+            df = self._hourly_activity(options)
+            commits = pl.sum("commits")
+        else:
+            df = self.filtered_revs(options)
+            commits = pl.col("sha").n_unique()
+        key = options.group_by_key
+
+        identifiers = set(options.identifiers)
+        if options.min_commits or not identifiers:
+            counts = df.group_by(key).agg(commits.alias("commits"))
+            identifiers.update(
+                counts.filter(pl.col("commits") >= options.min_commits)[key]
+            )
+
+        when = pl.col(options.punchcard_key)
+        return (
+            df.filter(pl.col(key).is_in(list(identifiers)))
+            .group_by(
+                key,
+                when.dt.weekday().alias("day"),
+                when.dt.hour().alias("hour"),
+            )
+            .agg(pl.sum("lines"), commits.alias("commits"))
+            .sort(key, "day", "hour")
+        )
+
+    def file_timeline(self, options: ActivityReportCmdOptions) -> DataFrame:
+        """Monthly activity per file"""
+
+        def compute() -> DataFrame:
+            df = self.filtered_revs(options, ignore_limit=True)
+            if options.follow_renames:
+                df = self._follow_renames(df)
+            return (
+                df.group_by(
+                    "filename",
+                    pl.col("committed_datetime").dt.truncate("1mo").alias("month"),
+                )
+                .agg(
+                    pl.sum("lines"),
+                    pl.sum("insertions"),
+                    pl.sum("deletions"),
+                    pl.col("sha").n_unique().alias("commits"),
+                )
+                .with_columns((pl.col("insertions") - pl.col("deletions")).alias("net"))
+                .sort("filename", "month")
+            )
+
+        report_df = self._cached("file_timeline", options, compute)
+        self._output(report_df, options)
+        return report_df
+
+    def hotspots(self, options: HotspotsCmdOptions) -> DataFrame:
+        """Files or directories ranked by how much faster they churn recently than over
+        their history, with commits, churn (insertions + deletions) and distinct authors
+        in each trailing window.
+        """
+        report_df = self._cached("hotspots", options, lambda: self._hotspots(options))
+        key = options.hotspot_key
+        self._output(
+            report_df,
+            options,
+            plot_df=report_df.head(options.limit or 20),
+            plot_type="blame",
+            title=f"{self.name} Hotspots",
+            x="acceleration:Q",
+            y=f"{key}:N",
+            filename=f"{self.name}_hotspots_by_{options.hotspot_by}",
+        )
+        return report_df
+
+    def _hotspots(self, options: HotspotsCmdOptions) -> DataFrame:
+        key = options.hotspot_key
+        windows = sorted(set(options.windows))
+        # windows end at the analyzed revision, so results don't depend on when they ran
+        reference = to_utc(self.objects.commit(self.head).committer.datetime)
+        assert reference is not None
+
+        df = self.filtered_revs(options, ignore_limit=True)
+        if options.follow_renames:
+            df = self._follow_renames(df)
+        if options.hotspot_by == "directory":
+            parts = pl.col("filename").str.split("/")
+            levels = pl.min_horizontal(parts.list.len() - 1, pl.lit(options.depth))
+            df = df.with_columns(
+                directory=pl.when(levels > 0)
+                .then(parts.list.head(levels).list.join("/"))
+                .otherwise(pl.lit("."))
+            )
+        df = df.with_columns(
+            churn=(pl.col("insertions") + pl.col("deletions")).fill_null(0)
+        )
+
+        aggregations = [
+            pl.col("sha").n_unique().alias("commits"),
+            pl.sum("churn"),
+            pl.col(options.group_by_key).n_unique().alias("authors"),
+            pl.min("committed_datetime").alias("first_changed"),
+            pl.max("committed_datetime").alias("last_changed"),
+        ]
+        for days in windows:
+            recent = pl.col("committed_datetime") > reference - timedelta(days=days)
+            aggregations += [
+                pl.col("sha").filter(recent).n_unique().alias(f"commits_{days}d"),
+                pl.col("churn").filter(recent).sum().alias(f"churn_{days}d"),
+                pl.col(options.group_by_key)
+                .filter(recent)
+                .n_unique()
+                .alias(f"authors_{days}d"),
+            ]
+
+        shortest = windows[0]
+        # the history is at least one recent window long, so new files don't dominate
+        lifetime = (
+            (pl.lit(reference) - pl.col("first_changed")).dt.total_seconds() / 86400
+        ).clip(lower_bound=shortest)
+        historical_rate = pl.col("churn") / lifetime
+        report_df = (
+            df.group_by(key)
+            .agg(aggregations)
+            .with_columns(
+                acceleration=pl.when(historical_rate > 0).then(
+                    (pl.col(f"churn_{shortest}d") / shortest) / historical_rate
+                )
+            )
+            .sort(
+                "acceleration",
+                f"churn_{shortest}d",
+                key,
+                descending=[True, True, False],
+                nulls_last=True,
+            )
+        )
+        if options.limit:
+            report_df = report_df.head(options.limit)
+        return report_df
+
+    def compare_branches(self, options: CompareCmdOptions) -> DataFrame:
+        """Commits, changes and authors of each branch. `unique_commits` are reachable from
+        that branch alone among those compared, the rest are shared with another.
+
+        Every branch is ingested into the same store, so shared history is read once.
+        """
+        heads = {b: self.objects.rev_parse(f"{b}^{{commit}}") for b in options.branches}
+        report_df = self._cached(
+            f"compare:{json.dumps(heads, sort_keys=True)}",
+            options,
+            lambda: self._compare_branches(options, heads),
+        )
+        self._output(
+            report_df,
+            options,
+            filename=f"{self.name}_compare_{'_'.join(quote(b, safe='') for b in heads)}",
+        )
+        return report_df
+
+    def _compare_branches(
+        self, options: CompareCmdOptions, heads: dict[str, str]
+    ) -> DataFrame:
+        refs = {b: self._ref_name(b) for b in heads}
+        with self._lock:
+            for branch, ref in refs.items():
+                self._ingest_ref(ref, heads[branch])
+            # the analyzed ref's caches describe the store before these were added
+            self._ingested = None
+            self.ingest()
+
+        df = self._select(
+            self._db.all_file_changes(*self.window, refs=list(refs.values())), options
+        )
+        key = options.group_by_key
+
+        membership = (
+            self._db.commit_refs(list(refs.values()))
+            .join(
+                DataFrame({"branch": list(refs), "ref": list(refs.values())}), on="ref"
+            )
+            .select("sha", "branch")
+            .unique()
+            .with_columns(unique=pl.len().over("sha") == 1)
+        )
+        commits = df.group_by("sha").agg(
+            pl.first("committed_datetime"),
+            pl.sum("insertions", "deletions", "lines"),
+            pl.first(key),
+        )
+        report_df = (
+            membership.join(commits, on="sha")
+            .group_by("branch")
+            .agg(
+                commits=pl.len(),
+                unique_commits=pl.col("unique").sum(),
+                authors=pl.col(key).n_unique(),
+                insertions=pl.sum("insertions"),
+                deletions=pl.sum("deletions"),
+                lines=pl.sum("lines"),
+                first_commit=pl.min("committed_datetime"),
+                last_commit=pl.max("committed_datetime"),
+            )
+        )
+        # branches with no selected commits are reported too, in the order given
+        return (
+            DataFrame({"branch": list(refs), "head": list(heads.values())})
+            .join(report_df, on="branch", how="left", maintain_order="left")
+            .with_columns(
+                pl.col("commits", "unique_commits", "authors")
+                .fill_null(0)
+                .cast(pl.UInt32)
+            )
+        )
+
+    def coupling(self, options: CouplingCmdOptions) -> DataFrame:
+        """Pairs of files that tend to change in the same commits. `confidence_ab` is the
+        share of the commits of `file_a` that also change `file_b`, and vice versa.
+        """
+        report_df = self._cached("coupling", options, lambda: self._coupling(options))
+        self._output(report_df, options)
+        return report_df
+
+    def _coupling(self, options: CouplingCmdOptions) -> DataFrame:
+        if (
+            self._use_rollups(options)
+            and not options.follow_renames
+            and options.max_files == COCHANGE_MAX_FILES
+        ):
+            pairs = self._rollup("co_changes")
+            names = pl.concat([pairs["file_a"], pairs["file_b"]]).unique()
+            kept = names.filter(self._path_mask(options, names))
+            pairs = pairs.filter(
+                pl.col("file_a").is_in(kept.implode()),
+                pl.col("file_b").is_in(kept.implode()),
+            )
+        else:
+            df = self.filtered_revs(options, ignore_limit=True)
+            if options.follow_renames:
+                df = self._follow_renames(df)
+            pairs = self._db.co_changes_of(
+                df.select("sha", "filename"), options.max_files
+            )
+
+        counts = pairs.filter(pl.col("file_a") == pl.col("file_b")).select(
+            "file_a", pl.col("commits").alias("commits_a")
+        )
+        report_df = (
+            pairs.filter(
+                pl.col("file_a") != pl.col("file_b"),
+                pl.col("commits") >= options.min_commits,
+            )
+            .join(counts, on="file_a")
+            .join(
+                counts.rename({"file_a": "file_b", "commits_a": "commits_b"}),
+                on="file_b",
+            )
+            .with_columns(
+                confidence_ab=pl.col("commits") / pl.col("commits_a"),
+                confidence_ba=pl.col("commits") / pl.col("commits_b"),
+            )
+            .filter(
+                pl.max_horizontal("confidence_ab", "confidence_ba")
+                >= options.min_confidence
+            )
+            .sort(
+                "commits",
+                pl.max_horizontal("confidence_ab", "confidence_ba"),
+                "file_a",
+                "file_b",
+                descending=[True, True, False, False],
+            )
+        )
+        if options.limit:
+            report_df = report_df.head(options.limit)
+        return report_df
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+from pathlib import Path
+
+import polars as pl
+from polars import DataFrame
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+SUFFIX = ".parquet"
+
+
+def result_key(
+    command: str, *models: BaseModel, exclude: set[str] | None = None
+) -> str:
+    """A stable hash of a command and the options it ran with"""
+    exclude = exclude or set()
+    payload = json.dumps(
+        [command, *(m.model_dump(mode="json", exclude=exclude) for m in models)],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    """Report results stored as parquet files, evicting the least recently used files
+    once the directory grows past `max_bytes`.
+
+    Every entry belongs to a data watermark, e.g., the analyzed HEAD. Storing a result for
+    a new watermark drops the results of every other watermark.
+
+    The directory is only scanned for the first result of a watermark, later entries and
+    their sizes are tracked as they are stored and read.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # the size of each entry of the current watermark, least recently used first
+        self._entries: OrderedDict[Path, int] = OrderedDict()
+        self._bytes = 0
+        self._watermark: str | None = None
+
+    @staticmethod
+    def _prefix(watermark: str) -> str:
+        return hashlib.sha256(watermark.encode()).hexdigest()[:16]
+
+    def _path(self, key: str, watermark: str) -> Path:
+        return self.directory / f"{self._prefix(watermark)}-{key}{SUFFIX}"
+
+    def get(self, key: str, watermark: str) -> DataFrame | None:
+        path = self._path(key, watermark)
+        try:
+            df = pl.read_parquet(path)
+            # the modification time orders entries for eviction
+            os.utime(path)
+        except (FileNotFoundError, pl.exceptions.ComputeError):
+            return None
+        with self._lock:
+            if path in self._entries:
+                self._entries.move_to_end(path)
+        logger.debug(f"Result cache hit {path.name}")
+        return df
+
+    def put(self, key: str, watermark: str, df: DataFrame):
+        path = self._path(key, watermark)
+        # write and rename, so concurrent readers never see a partial file
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        df.write_parquet(tmp)
+        size = tmp.stat().st_size
+        _ = tmp.replace(path)
+        with self._lock:
+            if watermark != self._watermark:
+                self._scan(self._prefix(watermark))
+                self._watermark = watermark
+            else:
+                self._bytes += size - self._entries.pop(path, 0)
+                self._entries[path] = size
+            self._evict()
+
+    def _scan(self, prefix: str):
+        """Drops the entries of other watermarks, and reads the sizes of the rest"""
+        entries: list[tuple[float, int, Path]] = []
+        for path in self.directory.glob(f"*{SUFFIX}"):
+            try:
+                if not path.name.startswith(prefix):
+                    path.unlink()
+                    continue
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        self._entries = OrderedDict((path, size) for _, size, path in sorted(entries))
+        self._bytes = sum(self._entries.values())
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            path, size = self._entries.popitem(last=False)
+            path.unlink(missing_ok=True)
+            self._bytes -= size
+
+    def cached(
+        self, key: str, watermark: str, compute: Callable[[], DataFrame]
+    ) -> DataFrame:
+        df = self.get(key, watermark)
+        if df is None:
+            df = compute()
+            self.put(key, watermark, df)
+        return df
+
+    def clear(self):
+        with self._lock:
+            for path in self.directory.glob(f"*{SUFFIX}"):
+                path.unlink(missing_ok=True)
+            self._entries.clear()
+            self._bytes = 0
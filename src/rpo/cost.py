@@ -0,0 +1,179 @@
+import math
+import subprocess
+import sys
+from collections.abc import Sequence
+from datetime import timedelta
+from typing import NamedTuple
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+import polars as pl
+from polars import DataFrame
+
+# a rough size of a blamed hunk while its revision is being blamed, with its strings
+HUNK_BYTES = 400
+
+
+class BlameSample(NamedTuple):
+    """A file that was blamed to time it"""
+
+    size: int
+    seconds: float
+    hunks: int
+
+
+class BlameCostModel(NamedTuple):
+    """The seconds a `git blame` takes, as a fixed cost plus a cost per byte of the file"""
+
+    overhead: float
+    per_byte: float
+    hunks_per_byte: float
+
+    @classmethod
+    def fit(cls, samples: Sequence[BlameSample]) -> "BlameCostModel":
+        """Least squares over the samples, falling back to a cost per byte when their
+        sizes don't vary
+        """
+        if not samples:
+            return cls(0.0, 0.0, 0.0)
+        sizes = [float(s.size) for s in samples]
+        seconds = [s.seconds for s in samples]
+        total_size = sum(sizes) or 1.0
+        hunks_per_byte = sum(s.hunks for s in samples) / total_size
+        mean_size, mean_seconds = sum(sizes) / len(sizes), sum(seconds) / len(seconds)
+        variance = sum((x - mean_size) ** 2 for x in sizes)
+        if variance > 0:
+            per_byte = (
+                sum(
+                    (x - mean_size) * (y - mean_seconds) for x, y in zip(sizes, seconds)
+                )
+                / variance
+            )
+            per_byte = max(per_byte, 0.0)
+            overhead = max(mean_seconds - per_byte * mean_size, 0.0)
+        else:
+            overhead, per_byte = 0.0, sum(seconds) / total_size
+        return cls(overhead, per_byte, hunks_per_byte)
+
+    def seconds(self, files: float, size: float) -> float:
+        """The seconds to blame `files` files of `size` bytes in total"""
+        return self.overhead * files + self.per_byte * size
+
+    def seconds_expr(self, files: pl.Expr, size: pl.Expr) -> pl.Expr:
+        """`seconds` over columns"""
+        return self.overhead * files + self.per_byte * size
+
+
+class BlameEstimate(NamedTuple):
+    """The predicted cost of a blame, and how to fit it in a time budget"""
+
+    revisions: int
+    # one git blame per file of each revision
+    invocations: int
+    bytes: int
+    cpu_seconds: float
+    wall_seconds: float
+    processes: int
+    # None if the memory of git couldn't be measured
+    peak_memory_bytes: int | None
+    # suggestions to fit `budget_seconds`, if one was given and the blame exceeds it
+    budget_seconds: float | None = None
+    every: int | None = None
+    exclude_globs: tuple[str, ...] = ()
+
+    def explain(self) -> str:
+        lines = [
+            f"revisions:       {self.revisions:,}",
+            f"git invocations: {self.invocations:,}",
+            f"bytes blamed:    {self.bytes:,}",
+            f"cpu time:        {timedelta(seconds=round(self.cpu_seconds))}",
+            (
+                f"wall time:       {timedelta(seconds=round(self.wall_seconds))} "
+                f"with {self.processes} git processes"
+            ),
+        ]
+        if self.peak_memory_bytes is not None:
+            lines.append(f"peak memory:     {self.peak_memory_bytes / 2**20:,.0f} MB")
+        if self.budget_seconds is not None:
+            budget = timedelta(seconds=round(self.budget_seconds))
+            if self.wall_seconds <= self.budget_seconds:
+                lines.append(f"fits the budget of {budget}")
+            else:
+                lines.append(f"exceeds the budget of {budget}, to fit it:")
+                if self.every is not None:
+                    lines.append(
+                        f"  blame one revision in {self.every}: --every {self.every}"
+                    )
+                if self.exclude_globs:
+                    lines.append(
+                        "  or exclude the costliest directories: "
+                        + " ".join(f"-xg '{g}'" for g in self.exclude_globs)
+                    )
+                if self.every is None and not self.exclude_globs:
+                    lines.append(
+                        "  no revision interval or excluded directories fit it, "
+                        "narrow the files or revisions to blame"
+                    )
+        return "\n".join(lines)
+
+
+def peak_rss(command: list[str]) -> int | None:
+    """Runs a command, returning its peak memory in bytes, or None if it can't be told.
+
+    A child process starts out with the peak memory of the process that started it, so
+    a peak is only known when the command exceeds ours.
+    """
+    if resource is None:
+        _ = subprocess.run(
+            command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        return None
+    before = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    _ = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if peak <= before:
+        return None
+    # kilobytes, except on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def directory_costs(files: DataFrame, model: BlameCostModel) -> DataFrame:
+    """The blame seconds of the files in each top level directory, costliest first.
+    `files` has `filename` and `size` columns.
+    """
+    return (
+        files.filter(pl.col("filename").str.contains("/"))
+        .group_by(directory=pl.col("filename").str.split("/").list.first())
+        .agg(seconds=model.seconds_expr(pl.len(), pl.col("size").sum()))
+        .sort("seconds", "directory", descending=[True, False])
+    )
+
+
+def suggest_exclusions(
+    directories: DataFrame, total_seconds: float, budget_seconds: float
+) -> tuple[str, ...]:
+    """The fewest directories, costliest first, whose exclusion brings `total_seconds`
+    within the budget. Empty if excluding every directory doesn't.
+    """
+    excluded: list[str] = []
+    remaining = total_seconds
+    for directory, seconds in directories.select("directory", "seconds").iter_rows():
+        if remaining <= budget_seconds:
+            break
+        excluded.append(f"{directory}/*")
+        remaining -= seconds
+    return tuple(excluded) if remaining <= budget_seconds else ()
+
+
+def suggest_every(
+    revisions: int, wall_seconds: float, budget_seconds: float
+) -> int | None:
+    """The smallest revision interval that fits the budget, if any does"""
+    every = math.ceil(wall_seconds / budget_seconds)
+    return every if every <= revisions else None
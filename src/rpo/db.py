@@ -1,31 +1,252 @@
+import functools
 import logging
-from datetime import datetime
+import threading
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+from datetime import UTC, datetime
 from pathlib import Path
 from tempfile import gettempdir
-from typing import Any, Iterator, cast
+from typing import Any, Concatenate, cast
 
 import duckdb
+import polars as pl
 from polars import DataFrame
 
 from .exceptions import InvalidIdentificationOption
-from .models import FileChangeCommitRecord
+from .models import COCHANGE_MAX_FILES, FileChangeCommitRecord, is_generated
+from .sketch import SKETCH_PERIODS, SKETCH_REGISTERS
 
 logger = logging.getLogger(__name__)
 
-gconnection = duckdb.connect()
+# bump whenever the tables change, so stores created by older versions are rebuilt
+SCHEMA_VERSION = 8
+
+type Window = tuple[datetime | None, datetime | None]
+
+# flags which of a series of paths are generated
+type GeneratedPaths = Callable[[pl.Series], pl.Series]
+
+TABLES = (
+    "file_changes",
+    # no longer created, only dropped from older stores
+    "sha_files",
+    "ingest_windows",
+    "refs",
+    "commit_refs",
+    "renames",
+    "file_lineage",
+    "identities",
+    "activity_by_hour",
+    "activity_by_file",
+    "co_changes",
+    "sketches",
+    "sketch_periods",
+)
+
+# pairs of files changed in the same commits, counting commits of at most {max_files}
+# files. The diagonal, where file_a = file_b, counts the commits of each file
+COCHANGE_PAIRS = """WITH changes AS (
+    SELECT DISTINCT sha, filename FROM {source}
+  ), eligible AS (
+    SELECT sha FROM changes GROUP BY sha HAVING count(*) <= {max_files}
+  )
+  SELECT a.filename AS file_a, b.filename AS file_b, count(*)::BIGINT AS commits
+  FROM changes a JOIN changes b ON a.sha = b.sha AND a.filename <= b.filename
+  WHERE a.sha IN (SELECT sha FROM eligible)
+  GROUP BY ALL"""
+
+# the columns of file_changes, for frames that are bulk loaded into it
+FILE_CHANGES_SCHEMA = {
+    "repository": pl.String,
+    "sha": pl.String,
+    "author_name": pl.String,
+    "author_email": pl.String,
+    "committer_name": pl.String,
+    "committer_email": pl.String,
+    "gpgsig": pl.String,
+    "authored_datetime": pl.Datetime("us", "UTC"),
+    "committed_datetime": pl.Datetime("us", "UTC"),
+    "filename": pl.String,
+    "insertions": pl.UInt64,
+    "deletions": pl.UInt64,
+    "lines": pl.UInt64,
+    "change_type": pl.String,
+    "is_binary": pl.Boolean,
+    "raw_author_name": pl.String,
+    "raw_author_email": pl.String,
+    "raw_committer_name": pl.String,
+    "raw_committer_email": pl.String,
+    "is_generated": pl.Boolean,
+}
+
+# restricts a rollup query to the commits in `_frame`
+AFFECTED_COMMITS = "WHERE sha IN (SELECT sha FROM _frame)"
+
+# Rollups are pre-aggregated views of file_changes that reports read instead of scanning
+# every file change. Each is an aggregate query over file_changes, the columns that sum
+# and the query that merges rows with the same key after an incremental update.
+ROLLUPS: dict[str, tuple[str, tuple[str, ...], str]] = {
+    # every commit falls in exactly one row, so commit counts can be summed
+    "activity_by_hour": (
+        """SELECT author_name, author_email, committer_name, committer_email,
+            date_trunc('hour', authored_datetime) AS authored_hour,
+            date_trunc('hour', committed_datetime) AS committed_hour,
+            has_source,
+            count(*)::BIGINT AS commits,
+            sum(lines)::BIGINT AS lines,
+            sum(insertions)::BIGINT AS insertions,
+            sum(deletions)::BIGINT AS deletions,
+            sum(generated_lines)::BIGINT AS generated_lines,
+            sum(generated_insertions)::BIGINT AS generated_insertions,
+            sum(generated_deletions)::BIGINT AS generated_deletions,
+            min(authored_datetime) AS first_authored,
+            max(authored_datetime) AS last_authored
+          FROM (
+            SELECT sha, author_name, author_email, committer_name, committer_email,
+              authored_datetime, committed_datetime,
+              bool_or(NOT is_generated) AS has_source,
+              coalesce(sum(lines), 0) AS lines,
+              coalesce(sum(insertions), 0) AS insertions,
+              coalesce(sum(deletions), 0) AS deletions,
+              coalesce(sum(lines) FILTER (WHERE is_generated), 0) AS generated_lines,
+              coalesce(sum(insertions) FILTER (WHERE is_generated), 0) AS generated_insertions,
+              coalesce(sum(deletions) FILTER (WHERE is_generated), 0) AS generated_deletions
+            FROM file_changes {where}
+            GROUP BY ALL
+          )
+          GROUP BY ALL""",
+        (
+            "commits",
+            "lines",
+            "insertions",
+            "deletions",
+            "generated_lines",
+            "generated_insertions",
+            "generated_deletions",
+        ),
+        """SELECT author_name, author_email, committer_name, committer_email,
+            authored_hour, committed_hour, has_source,
+            sum(commits)::BIGINT AS commits,
+            sum(lines)::BIGINT AS lines,
+            sum(insertions)::BIGINT AS insertions,
+            sum(deletions)::BIGINT AS deletions,
+            sum(generated_lines)::BIGINT AS generated_lines,
+            sum(generated_insertions)::BIGINT AS generated_insertions,
+            sum(generated_deletions)::BIGINT AS generated_deletions,
+            min(first_authored) AS first_authored,
+            max(last_authored) AS last_authored
+          FROM activity_by_hour
+          GROUP BY ALL
+          HAVING sum(commits) > 0""",
+    ),
+    "activity_by_file": (
+        """SELECT filename, is_generated,
+            count(*)::BIGINT AS commits,
+            coalesce(sum(lines), 0)::BIGINT AS lines,
+            coalesce(sum(insertions), 0)::BIGINT AS insertions,
+            coalesce(sum(deletions), 0)::BIGINT AS deletions,
+            min(committed_datetime) AS first_seen,
+            max(committed_datetime) AS last_seen
+          FROM file_changes {where}
+          GROUP BY ALL""",
+        ("commits", "lines", "insertions", "deletions"),
+        """SELECT filename, is_generated,
+            sum(commits)::BIGINT AS commits,
+            sum(lines)::BIGINT AS lines,
+            sum(insertions)::BIGINT AS insertions,
+            sum(deletions)::BIGINT AS deletions,
+            min(first_seen) AS first_seen,
+            max(last_seen) AS last_seen
+          FROM activity_by_file
+          GROUP BY ALL
+          HAVING sum(commits) > 0""",
+    ),
+    "co_changes": (
+        COCHANGE_PAIRS.format(
+            source="file_changes {where}", max_files=COCHANGE_MAX_FILES
+        ),
+        ("commits",),
+        """SELECT file_a, file_b, sum(commits)::BIGINT AS commits
+          FROM co_changes
+          GROUP BY ALL
+          HAVING sum(commits) > 0""",
+    ),
+}
+
+
+# stores of the same file share a database within a process, and so a writer
+_write_locks: dict[str, threading.RLock] = {}
+_write_locks_lock = threading.Lock()
+
+
+def _write_lock(path: str) -> threading.RLock:
+    with _write_locks_lock:
+        return _write_locks.setdefault(path, threading.RLock())
+
+
+def _atomic[**P, R](
+    method: Callable[Concatenate["DB", P], R],
+) -> Callable[Concatenate["DB", P], R]:
+    """Runs a method that writes in several statements as one transaction"""
+
+    @functools.wraps(method)
+    def wrapper(self: "DB", *args: P.args, **kwargs: P.kwargs) -> R:
+        with self._writing():
+            return method(self, *args, **kwargs)
+
+    return wrapper
 
 
 class DB:
-    def __init__(self, name: str, initialize=False, in_memory=False) -> None:
+    """A store of ingested history, backed by its own DuckDB connection.
+
+    Reads run concurrently, each on a cursor borrowed from a pool. Writes are serialized
+    on a single writer cursor, and methods that write in several statements hold the
+    writer for all of them, so concurrent readers only ever see whole updates.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initialize=False,
+        in_memory=False,
+        memory_limit_mb: int | None = None,
+    ) -> None:
         self.name = name
 
         self._in_memory = in_memory
+        self.memory_limit_mb = memory_limit_mb
         self._file_path = None
 
-        self._created = False
+        self._conn: duckdb.DuckDBPyConnection | None = None
+        self._writer: duckdb.DuckDBPyConnection | None = None
+        self._idle: list[duckdb.DuckDBPyConnection] = []
+        self._pool_lock = threading.Lock()
+        self._write_lock = (
+            _write_lock(str(self.file_path)) if not in_memory else threading.RLock()
+        )
+        self._write_owner: int | None = None
+        self._write_depth = 0
 
         if initialize:
-            self.create_tables()
+            self.create_tables(replace=in_memory)
+
+    def __getstate__(self):
+        # connections can't be shared with other processes, they reconnect on first use
+        return {
+            "name": self.name,
+            "in_memory": self._in_memory,
+            "memory_limit_mb": self.memory_limit_mb,
+        }
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
 
     @property
     def file_path(self):
@@ -33,45 +254,156 @@ class DB:
             if self._in_memory:
                 self._file_path = ":memory:"
             else:
-                tmp_dir = Path(gettempdir()) / "rpo-data"
-                tmp_dir.mkdir(exist_ok=True, parents=True)
-                self._file_path = tmp_dir / f"{self.name}.ddb"
+                self._file_path = data_directory() / f"{self.name}.ddb"
         return self._file_path
 
     @property
     def conn(self) -> duckdb.DuckDBPyConnection:
-        global gconnection
-        if not self._in_memory and not self._created:
-            gconnection = duckdb.connect(self.file_path)
-            self._created = True
-        return gconnection
+        """The connection that owns this store. In memory stores are private to it, while
+        stores of the same file share a database within a process.
+        """
+        with self._pool_lock:
+            if self._conn is None:
+                self._conn = duckdb.connect(self.file_path)
+                if self.memory_limit_mb is not None:
+                    self._limit_memory(self._conn, self.memory_limit_mb)
+            return self._conn
+
+    def _limit_memory(self, conn: duckdb.DuckDBPyConnection, limit_mb: int):
+        """Caps the memory DuckDB uses, spilling larger intermediate results to disk"""
+        spill = data_directory() / "spill"
+        spill.mkdir(exist_ok=True)
+        _ = conn.execute(f"SET memory_limit = '{limit_mb}MB'")
+        _ = conn.execute(f"SET temp_directory = '{spill}'")
+        logger.debug(f"Limited {self.file_path} to {limit_mb}MB, spilling to {spill}")
+
+    def close(self):
+        with self._write_lock, self._pool_lock:
+            for cur in [*self._idle, self._writer]:
+                if cur is not None:
+                    cur.close()
+            self._idle, self._writer = [], None
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    @contextmanager
+    def _reader(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        """A cursor for the calling thread, returned to the pool afterwards. A thread that
+        is writing reads from the writer, so it sees its own uncommitted writes.
+        """
+        if self._write_owner == threading.get_ident():
+            yield cast(duckdb.DuckDBPyConnection, self._writer)
+            return
+        conn = self.conn
+        with self._pool_lock:
+            cur = self._idle.pop() if self._idle else None
+        if cur is None:
+            cur = conn.cursor()
+        try:
+            yield cur
+        finally:
+            with self._pool_lock:
+                self._idle.append(cur)
+
+    @contextmanager
+    def _writing(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        """The writer cursor, held by one thread at a time. Everything written until the
+        outermost `_writing` exits is one transaction, so methods that write in several
+        statements are atomic to readers.
+        """
+        conn = self.conn
+        with self._write_lock:
+            if self._write_depth:
+                self._write_depth += 1
+                try:
+                    yield cast(duckdb.DuckDBPyConnection, self._writer)
+                finally:
+                    self._write_depth -= 1
+                return
+
+            if self._writer is None:
+                self._writer = conn.cursor()
+            writer = self._writer
+            self._write_owner, self._write_depth = threading.get_ident(), 1
+            _ = writer.begin()
+            try:
+                yield writer
+            except BaseException:
+                _ = writer.rollback()
+                raise
+            else:
+                _ = writer.commit()
+            finally:
+                self._write_owner, self._write_depth = None, 0
 
     def _execute_many(self, query, data):
-        if self._in_memory:
-            return self.conn.executemany(query, data)
-        with self.conn.cursor() as cur:
+        with self._writing() as cur:
             return cur.executemany(query, data)
 
     def _execute(
         self,
         query,
         params: list[Any] | dict[str, Any] | None = None,
+        write: bool = False,
     ) -> DataFrame:
-        if self._in_memory:
-            return self.conn.execute(query, params).pl()
-        with self.conn.cursor() as cur:
+        with self._writing() if write else self._reader() as cur:
             return cur.execute(query, params).pl()
 
     def _execute_sql(self, query):
-        """Use this only if you do not need the output"""
-        if self._in_memory:
-            return self.conn.sql(query)
-        with self.conn.cursor() as cur:
-            return cur.sql(query)
+        """Use this only if you do not need the output. Runs as a write"""
+        with self._writing() as cur:
+            _ = cur.execute(query)
+
+    def _execute_with_frame(
+        self, query: str, df: DataFrame, write: bool = False
+    ) -> DataFrame:
+        """Executes a query that reads from `df`, which is available to it as `_frame`"""
+        # registered frames are private to the cursor, so concurrent queries can't clash
+        with self._writing() if write else self._reader() as cur:
+            cur.register("_frame", df)
+            try:
+                return cur.execute(query).pl()
+            finally:
+                cur.unregister("_frame")
+
+    def _insert_frame(self, table: str, df: DataFrame):
+        """Bulk inserts a frame, matching its columns to the columns of `table` by name"""
+        if not df.height:
+            return
+        _ = self._execute_with_frame(
+            f"INSERT INTO {table} BY NAME SELECT * FROM _frame", df, write=True
+        )
+
+    def get_metadata(self, key: str) -> str | None:
+        res = self._execute("SELECT value FROM metadata WHERE key = $1", [key])
+        return res["value"][0] if res.height else None
+
+    def set_metadata(self, key: str, value: str):
+        _ = self._execute(
+            "INSERT OR REPLACE INTO metadata VALUES ($1, $2)", [key, value], write=True
+        )
+
+    def delete_metadata(self, key: str):
+        _ = self._execute("DELETE FROM metadata WHERE key = $1", [key], write=True)
+
+    @_atomic
+    def create_tables(self, replace: bool = False):
+        """Creates any missing tables. Existing tables are dropped if `replace` is set, or if
+        they were created by a different version of the schema.
+        """
+        _ = self._execute_sql("""CREATE TABLE IF NOT EXISTS metadata (
+                key VARCHAR PRIMARY KEY,
+                value VARCHAR
+                )
+                """)
+        if replace or self.get_metadata("schema_version") != str(SCHEMA_VERSION):
+            for table in TABLES:
+                _ = self._execute_sql(f"DROP TABLE IF EXISTS {table}")
+            _ = self._execute_sql("DELETE FROM metadata")
 
-    def create_tables(self):
         _ = self._execute_sql("""
-                CREATE OR REPLACE TABLE file_changes (
+                CREATE TABLE IF NOT EXISTS file_changes (
                     repository VARCHAR,
                     sha VARCHAR(40),
                     author_name VARCHAR,
@@ -87,15 +419,87 @@ class DB:
                     deletions UBIGINT,
                     lines UBIGINT,
                     change_type VARCHAR(1),
-                    is_binary BOOLEAN)
+                    is_binary BOOLEAN,
+
+                    raw_author_name VARCHAR,
+                    raw_author_email VARCHAR,
+                    raw_committer_name VARCHAR,
+                    raw_committer_email VARCHAR,
+                    is_generated BOOLEAN)
                  """)
 
-        _ = self._execute_sql("""CREATE OR REPLACE TABLE sha_files (
+        _ = self._execute_sql("""CREATE TABLE IF NOT EXISTS ingest_windows (
+                scope VARCHAR,
+                since DATETIME,
+                until DATETIME
+                )
+                """)
+
+        # the head each ingested ref was last ingested at
+        _ = self._execute_sql("""CREATE TABLE IF NOT EXISTS refs (
+                ref VARCHAR,
+                head VARCHAR(40)
+                )
+                """)
+
+        # every ref each commit is reachable from, so shared history is stored once
+        _ = self._execute_sql("""CREATE TABLE IF NOT EXISTS commit_refs (
+                sha VARCHAR(40),
+                ref VARCHAR
+                )
+                """)
+
+        _ = self._execute_sql("""CREATE TABLE IF NOT EXISTS renames (
                 sha VARCHAR(40),
-                filename VARCHAR
+                committed_datetime DATETIME,
+                old_filename VARCHAR,
+                new_filename VARCHAR
+                )
+                """)
+
+        _ = self._execute_sql("""CREATE TABLE IF NOT EXISTS file_lineage (
+                filename VARCHAR,
+                file_id VARCHAR,
+                lineage_path VARCHAR
+                )
+                """)
+
+        _ = self._execute_sql("""CREATE TABLE IF NOT EXISTS identities (
+                name VARCHAR,
+                email VARCHAR,
+                identity_id UBIGINT,
+                identity_name VARCHAR,
+                identity_email VARCHAR
+                )
+                """)
+
+        for table, (query, _, _) in ROLLUPS.items():
+            _ = self._execute_sql(
+                f"CREATE TABLE IF NOT EXISTS {table} AS {query.format(where='')}"
+            )
+
+        # HyperLogLog registers of the distinct values of each month and of the whole
+        # store, see `sketch.SKETCH_REGISTERS`
+        _ = self._execute_sql("""CREATE TABLE IF NOT EXISTS sketches (
+                period VARCHAR,
+                source BOOLEAN,
+                kind VARCHAR,
+                idx USMALLINT,
+                rank UTINYINT,
+                PRIMARY KEY (period, source, kind, idx)
+                )
+                """)
+
+        _ = self._execute_sql("""CREATE TABLE IF NOT EXISTS sketch_periods (
+                period VARCHAR,
+                source BOOLEAN,
+                first_authored DATETIME,
+                last_authored DATETIME,
+                PRIMARY KEY (period, source)
                 )
                 """)
 
+        self.set_metadata("schema_version", str(SCHEMA_VERSION))
         logger.info("Created tables")
 
     def _check_group_by(self, group_by: str) -> str:
@@ -112,15 +516,6 @@ class DB:
             return default
         return group_by
 
-    def insert_sha_files(self, data: Iterator[tuple[str, str]]):
-        return self._execute_many("""INSERT INTO sha_files VALUES ($1, $2)""", data)
-
-    def sha_file_datetime(self):
-        """gets filenames and the date of the commit"""
-        return self._execute(
-            "SELECT committed_datetime, sf.sha, sf.filename FROM file_changes fc JOIN sha_files sf ON fc.sha = sf.sha",
-        ).sort(by="filename")
-
     def author_file_change_report(self, author: str, by: str = "email"):
         if by not in {"email", "name"}:
             raise InvalidIdentificationOption("Must be either 'email' or 'name'")
@@ -132,47 +527,256 @@ class DB:
             [author],
         )
 
-    def insert_file_changes(self, revs: list[FileChangeCommitRecord]):
-        to_insert = [
-            r.model_dump(
-                exclude=set(
-                    [
-                        "summary",
-                    ]
-                )
-            )
-            for r in revs
-        ]
-        query = """INSERT into file_changes VALUES (
-                    $repository,
-                    $sha,
-                    $author_name,
-                    $author_email,
-                    $committer_name,
-                    $committer_email,
-                    $gpgsig,
-                    $authored_datetime,
-                    $committed_datetime,
-                    $filename,
-                    $insertions,
-                    $deletions,
-                    $lines,
-                    $change_type,
-                    $is_binary
-                )"""
+    def insert_file_changes(
+        self,
+        revs: list[FileChangeCommitRecord],
+        generated: GeneratedPaths | None = None,
+    ) -> int | None:
+        """Stores the changes not stored yet, returning how many. None if they can't be stored"""
+        to_insert = [r.model_dump(exclude={"summary"}) for r in revs]
+        if generated is None:
+            for r in to_insert:
+                r["is_generated"] = is_generated(r["filename"])
+        return self.insert_file_change_frames(
+            [DataFrame(to_insert, schema=FILE_CHANGES_SCHEMA, strict=False)], generated
+        )
+
+    def insert_file_change_frames(
+        self, frames: Iterable[DataFrame], generated: GeneratedPaths | None = None
+    ) -> int | None:
+        """Bulk loads frames with the columns of `file_changes`, e.g., the shards of a
+        parallel ingest, in one transaction. Returns how many changes were new, or None if
+        they can't be stored, in which case nothing is.
+
+        `generated` flags the generated paths, instead of the flags the frames come with.
+        """
+        inserted = 0
         try:
-            if to_insert:
-                _ = self._execute_many(query, to_insert)
-            return self.all_file_changes()
+            with self._writing():
+                for df in frames:
+                    df = self._new_file_changes(df)
+                    if generated is not None and df.height:
+                        df = df.with_columns(is_generated=generated(df["filename"]))
+                    if df.is_empty():
+                        continue
+                    affected = df.select("sha").unique()
+                    before = self._aggregate_rollups(affected)
+                    self._insert_frame("file_changes", df)
+                    self._update_rollups(self._aggregate_rollups(affected), before)
+                    self._update_sketches(df)
+                    inserted += df.height
         except (duckdb.InvalidInputException, duckdb.ConversionException) as e:
             logger.error(f"Failure to insert file change records: {e}")
-        logger.info(f"Inserted {len(revs)} file change records into {self.file_path}")
+            return None
+        logger.info(f"Inserted {inserted} file change records into {self.file_path}")
+        return inserted
 
-    def change_count(self) -> int:
+    def _new_file_changes(self, df: DataFrame) -> DataFrame:
+        """Ingested windows may overlap at their boundaries, skip rows already stored"""
+        df = df.unique(["sha", "filename"], keep="first", maintain_order=True)
+        if df.is_empty():
+            return df
+        existing = self._execute_with_frame(
+            """SELECT DISTINCT fc.sha, fc.filename FROM file_changes fc
+              JOIN _frame f ON fc.sha = f.sha AND fc.filename = f.filename""",
+            df.select("sha", "filename"),
+        )
+        return df.join(
+            existing, on=["sha", "filename"], how="anti", maintain_order="left"
+        )
+
+    def _aggregate_rollups(self, affected: DataFrame) -> dict[str, DataFrame]:
+        """The contribution of the `affected` commits to each rollup"""
+        return {
+            table: self._execute_with_frame(
+                query.format(where=AFFECTED_COMMITS), affected
+            )
+            for table, (query, _, _) in ROLLUPS.items()
+        }
+
+    @_atomic
+    def _update_rollups(
+        self, added: dict[str, DataFrame], removed: dict[str, DataFrame]
+    ):
+        """Applies the change in contribution of a set of commits to each rollup, without
+        re-aggregating the file changes of any other commit.
+        """
+        for table, (_, sums, compact) in ROLLUPS.items():
+            delta = pl.concat(
+                [added[table], removed[table].with_columns(pl.col(sums) * -1)]
+            )
+            self._insert_frame(table, delta)
+            _ = self._execute_sql(f"CREATE OR REPLACE TABLE {table} AS {compact}")
+
+    @_atomic
+    def _update_sketches(self, df: DataFrame | None = None):
+        """Adds the changes in `df` to the sketches, or all the stored changes if it's None.
+        Sketches only ever grow: a register keeps the largest rank it has seen.
+        """
+        source = "file_changes" if df is None else "_frame"
+        for table, query, update in (
+            ("sketches", SKETCH_REGISTERS, "rank = greatest(rank, excluded.rank)"),
+            (
+                "sketch_periods",
+                SKETCH_PERIODS,
+                """first_authored = least(first_authored, excluded.first_authored),
+                last_authored = greatest(last_authored, excluded.last_authored)""",
+            ),
+        ):
+            upsert = f"""INSERT INTO {table} BY NAME {query.format(source=source)}
+              ON CONFLICT DO UPDATE SET {update}"""
+            if df is None:
+                self._execute_sql(upsert)
+            else:
+                _ = self._execute_with_frame(upsert, df, write=True)
+
+    def sketches(
+        self,
+        generated: bool = False,
+        since: str | None = None,
+        until: str | None = None,
+    ) -> DataFrame:
+        """The registers of the changes committed from the month `since` up to and
+        including `until`, both like `2024-01`, or of all of them. Generated files are
+        only included if `generated` is set.
+        """
+        return self._execute(
+            """SELECT kind, idx, max(rank) AS rank FROM sketches
+              WHERE (source OR $1)
+                AND CASE WHEN $2::VARCHAR IS NULL AND $3::VARCHAR IS NULL
+                  THEN period = 'all'
+                  ELSE period != 'all'
+                    AND ($2::VARCHAR IS NULL OR period >= $2)
+                    AND ($3::VARCHAR IS NULL OR period <= $3)
+                  END
+              GROUP BY kind, idx""",
+            [generated, since, until],
+        )
+
+    def sketch_bounds(self, generated: bool = False) -> tuple[datetime, datetime]:
+        """The first and last authored change, from the sketches"""
+        row = self._execute(
+            """SELECT min(first_authored), max(last_authored) FROM sketch_periods
+              WHERE period = 'all' AND (source OR $1)""",
+            [generated],
+        ).row(0)
+        return row[0], row[1]
+
+    def filenames(self) -> pl.Series:
+        """Every stored path"""
+        return self._execute("SELECT DISTINCT filename FROM activity_by_file")[
+            "filename"
+        ]
+
+    @_atomic
+    def mark_generated(self, generated: DataFrame) -> int:
+        """Flags the changes of the paths in `generated` as generated, and no others,
+        rebuilding the rollups if any flag changed. Returns how many changes were updated.
+        """
+        updated = self._execute_with_frame(
+            """UPDATE file_changes
+              SET is_generated = filename IN (SELECT filename FROM _frame)
+              WHERE is_generated IS DISTINCT FROM (filename IN (SELECT filename FROM _frame))""",
+            generated.select("filename"),
+            write=True,
+        ).item()
+        if updated:
+            self.rebuild_rollups()
+        logger.info(f"Updated the generated flag of {updated} changes")
+        return updated
+
+    @_atomic
+    def rebuild_rollups(self):
+        for table, (query, _, _) in ROLLUPS.items():
+            _ = self._execute_sql(
+                f"CREATE OR REPLACE TABLE {table} AS {query.format(where='')}"
+            )
+        for table in ("sketches", "sketch_periods"):
+            _ = self._execute_sql(f"DELETE FROM {table}")
+        self._update_sketches()
+        logger.info(f"Rebuilt rollups in {self.file_path}")
+
+    def activity_by_hour(self) -> DataFrame:
+        """Commit activity per author, committer and the hours it was authored and committed"""
+        return self._execute("SELECT * FROM activity_by_hour")
+
+    def activity_by_file(self) -> DataFrame:
+        """Commit activity per path"""
+        return self._execute("SELECT * FROM activity_by_file")
+
+    def co_changes(self) -> DataFrame:
+        """Co-change counts of every pair of paths, see `COCHANGE_PAIRS`"""
+        return self._execute("SELECT * FROM co_changes")
+
+    def co_changes_of(self, df: DataFrame, max_files: int) -> DataFrame:
+        """Co-change counts of the file changes in `df`, see `COCHANGE_PAIRS`"""
+        return self._execute_with_frame(
+            COCHANGE_PAIRS.format(source="_frame", max_files=int(max_files)), df
+        )
+
+    def change_count(self, ref: str | None = None) -> int:
         return self._execute(
-            "select count(distinct sha) as commit_count from file_changes",
+            """select count(distinct sha) as commit_count from file_changes
+              WHERE $1::VARCHAR IS NULL
+                OR sha IN (SELECT sha FROM commit_refs WHERE ref = $1)""",
+            [ref],
         )["commit_count"][0]
 
+    def ref_heads(self) -> dict[str, str]:
+        """The head of every ingested ref"""
+        return dict(self._execute("SELECT ref, head FROM refs").iter_rows())
+
+    @_atomic
+    def tag_commits(self, ref: str, head: str, shas: list[str], replace: bool = False):
+        """Records that `shas` are reachable from `ref`, now at `head`. With `replace`,
+        they are the only commits reachable from it, e.g., after a force push.
+        """
+        if replace:
+            if ref in self.ref_heads():
+                # commits that were only reachable from the old history stay stored
+                self.set_metadata("rewritten", "true")
+            _ = self._execute(
+                "DELETE FROM commit_refs WHERE ref = $1", [ref], write=True
+            )
+        self._insert_frame(
+            "commit_refs",
+            DataFrame(
+                {"sha": shas, "ref": ref}, schema={"sha": pl.String, "ref": pl.String}
+            ),
+        )
+        _ = self._execute("DELETE FROM refs WHERE ref = $1", [ref], write=True)
+        _ = self._execute("INSERT INTO refs VALUES ($1, $2)", [ref, head], write=True)
+        logger.info(f"Tagged {len(shas)} commits reachable from {ref}")
+
+    @_atomic
+    def forget_ref(self, ref: str):
+        """Drops the head of `ref` and which commits are reachable from it, e.g., when its
+        head is no longer in the repository. Its commits stay stored.
+        """
+        self.set_metadata("rewritten", "true")
+        _ = self._execute("DELETE FROM commit_refs WHERE ref = $1", [ref], write=True)
+        _ = self._execute("DELETE FROM refs WHERE ref = $1", [ref], write=True)
+
+    def commit_refs(self, refs: list[str]) -> DataFrame:
+        """Which of `refs` every stored commit is reachable from"""
+        return self._execute(
+            "SELECT sha, ref FROM commit_refs WHERE list_contains($1, ref)", [refs]
+        )
+
+    def covers_store(self, ref: str) -> bool:
+        """Whether every stored change is reachable from `ref`, so aggregates over the
+        whole store, like the rollups, describe it
+        """
+        if self.ref_heads().keys() == {ref} and not self.get_metadata("rewritten"):
+            # every stored commit was read from the history of the only ref
+            return True
+        return not self._execute(
+            """SELECT 1 FROM file_changes
+              WHERE sha NOT IN (SELECT sha FROM commit_refs WHERE ref = $1)
+              LIMIT 1""",
+            [ref],
+        ).height
+
     def commits_per_file(self) -> DataFrame:
         return self._execute(
             """SELECT filename, count(DISTINCT sha) AS count
@@ -189,9 +793,26 @@ class DB:
               ORDER BY count DESC""",
         )
 
-    def all_file_changes(self) -> DataFrame:
+    def all_file_changes(
+        self,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        refs: list[str] | None = None,
+        sample: float | None = None,
+    ) -> DataFrame:
+        """Every stored change, or those committed in the window and reachable from any of
+        `refs`, so only those are loaded. With `sample`, only the changes of about that
+        fraction of the commits are, chosen by the hash of their sha, so a sample is stable.
+        """
         return self._execute(
-            "SELECT * from file_changes order by filename",
+            """SELECT * from file_changes
+              WHERE ($1::DATETIME IS NULL OR committed_datetime >= $1)
+                AND ($2::DATETIME IS NULL OR committed_datetime <= $2)
+                AND ($3::VARCHAR[] IS NULL
+                  OR sha IN (SELECT sha FROM commit_refs WHERE list_contains($3, ref)))
+                AND ($4::DOUBLE IS NULL OR md5_number_upper(sha)::DOUBLE < $4 * 2.0 ** 64)
+              order by filename""",
+            [to_utc(since), to_utc(until), refs, sample],
         )
 
     def get_latest_change_tuple(self) -> tuple[datetime, str | None]:
@@ -210,3 +831,185 @@ class DB:
         # NOTE: you cannot use duckdb parameters to set group by clause, so do this to prevent injection
         query = f"""SELECT {group_by}, count(DISTINCT sha) as count from file_changes GROUP BY {group_by} ORDER BY count"""
         return self._execute(query)
+
+    def identity_pairs(self) -> DataFrame:
+        """Every distinct (name, email) pair used as author or committer, with its commit count"""
+        return self._execute(
+            """SELECT name, email, count(DISTINCT sha) AS commits FROM (
+                SELECT author_name AS name, author_email AS email, sha FROM file_changes
+                UNION ALL
+                SELECT committer_name AS name, committer_email AS email, sha FROM file_changes
+              )
+              GROUP BY name, email""",
+        )
+
+    def identities(self) -> DataFrame:
+        return self._execute("SELECT * FROM identities ORDER BY identity_id, name")
+
+    @_atomic
+    def replace_identities(self, identities: DataFrame) -> DataFrame:
+        _ = self._execute_sql("DELETE FROM identities")
+        self._insert_frame("identities", identities)
+        logger.info(f"Stored {identities.height} identities in {self.file_path}")
+        return self.identities()
+
+    def raw_identity_pairs(self) -> DataFrame:
+        """Every distinct (name, email) pair as recorded in the commits, before any mapping"""
+        return self._execute(
+            """SELECT raw_author_name AS raw_name, raw_author_email AS raw_email FROM file_changes
+              UNION
+              SELECT raw_committer_name, raw_committer_email FROM file_changes""",
+        )
+
+    @_atomic
+    def remap_identities(self, mapping: DataFrame):
+        """Rewrites the canonical author and committer columns from their raw values.
+
+        `mapping` has `raw_name`, `raw_email`, `name` and `email` columns.
+        """
+        for role in ("author", "committer"):
+            _ = self._execute_with_frame(
+                f"""UPDATE file_changes
+                  SET {role}_name = _frame.name, {role}_email = _frame.email
+                  FROM _frame
+                  WHERE file_changes.raw_{role}_name IS NOT DISTINCT FROM _frame.raw_name
+                  AND file_changes.raw_{role}_email IS NOT DISTINCT FROM _frame.raw_email""",
+                mapping,
+                write=True,
+            )
+        self.rebuild_rollups()
+        logger.info(f"Remapped {mapping.height} identities in {self.file_path}")
+
+    def insert_renames(self, renames: DataFrame):
+        """Stores detected renames, skipping any that are already stored"""
+        if not renames.height:
+            return
+        _ = self._execute_with_frame(
+            """INSERT INTO renames BY NAME
+              SELECT DISTINCT * FROM _frame f
+              WHERE NOT EXISTS (
+                SELECT 1 FROM renames r
+                WHERE r.sha = f.sha AND r.old_filename = f.old_filename
+              )""",
+            renames,
+            write=True,
+        )
+        logger.info(f"Inserted {renames.height} renames into {self.file_path}")
+
+    def renames(self) -> DataFrame:
+        return self._execute("SELECT * FROM renames ORDER BY committed_datetime")
+
+    def binary_files(self) -> DataFrame:
+        """The paths that every stored change marks as binary"""
+        return self._execute(
+            """SELECT filename
+              FROM file_changes
+              GROUP BY filename
+              HAVING bool_and(is_binary)""",
+        )
+
+    def file_dates(self) -> DataFrame:
+        """When each path was first and last changed"""
+        return self._execute(
+            """SELECT filename, min(first_seen) AS first_seen, max(last_seen) AS last_seen
+              FROM activity_by_file
+              GROUP BY filename""",
+        )
+
+    def file_lineage(self) -> DataFrame:
+        return self._execute("SELECT * FROM file_lineage ORDER BY file_id, filename")
+
+    @_atomic
+    def replace_file_lineage(self, lineage: DataFrame) -> DataFrame:
+        _ = self._execute_sql("DELETE FROM file_lineage")
+        self._insert_frame("file_lineage", lineage)
+        logger.info(f"Stored lineage of {lineage.height} paths in {self.file_path}")
+        return self.file_lineage()
+
+    def all_ingest_windows(self) -> list[tuple[str, datetime | None, datetime | None]]:
+        """Every ingested (scope, since, until) window"""
+        return list(
+            self._execute("SELECT scope, since, until FROM ingest_windows").iter_rows()
+        )
+
+    def ingest_windows(self, scope: str) -> list[Window]:
+        """The merged commit date windows that have been ingested for a scope of paths.
+        Windows ingested for all paths cover every scope.
+        """
+        res = self._execute(
+            "SELECT since, until FROM ingest_windows WHERE scope = $1 OR scope = ''",
+            [scope],
+        )
+        return merge_windows(res.iter_rows())
+
+    @_atomic
+    def add_ingest_window(
+        self, scope: str, since: datetime | None, until: datetime | None
+    ):
+        res = self._execute(
+            "SELECT since, until FROM ingest_windows WHERE scope = $1", [scope]
+        )
+        windows = merge_windows([*res.iter_rows(), (since, until)])
+        _ = self._execute(
+            "DELETE FROM ingest_windows WHERE scope = $1", [scope], write=True
+        )
+        _ = self._execute_many(
+            "INSERT INTO ingest_windows VALUES ($1, $2, $3)",
+            [(scope, s, u) for s, u in windows],
+        )
+
+
+def data_directory() -> Path:
+    """Where rpo keeps persisted data"""
+    path = Path(gettempdir()) / "rpo-data"
+    path.mkdir(exist_ok=True, parents=True)
+    return path
+
+
+def to_utc(dt: datetime | None) -> datetime | None:
+    """Converts to the naive UTC datetimes used by the store. Naive datetimes are assumed to be UTC"""
+    if dt is None or dt.tzinfo is None:
+        return dt
+    return dt.astimezone(UTC).replace(tzinfo=None)
+
+
+def _lower(bound: datetime | None) -> datetime:
+    return datetime.min if bound is None else bound
+
+
+def _upper(bound: datetime | None) -> datetime:
+    return datetime.max if bound is None else bound
+
+
+def merge_windows(windows: Iterable[Window]) -> list[Window]:
+    """Merges overlapping (since, until) windows, where `None` is an open end"""
+    merged: list[Window] = []
+    for since, until in sorted(windows, key=lambda w: _lower(w[0])):
+        if merged and _lower(since) <= _upper(merged[-1][1]):
+            prev_since, prev_until = merged[-1]
+            merged[-1] = (
+                prev_since,
+                None if until is None or prev_until is None else max(prev_until, until),
+            )
+        else:
+            merged.append((since, until))
+    return merged
+
+
+def missing_windows(requested: Window, covered: Iterable[Window]) -> list[Window]:
+    """The parts of the `requested` window that none of the `covered` windows include"""
+    cursor, until = requested
+    missing: list[Window] = []
+    for covered_since, covered_until in merge_windows(covered):
+        if _upper(covered_until) < _lower(cursor):
+            continue
+        if _lower(covered_since) > _upper(until):
+            break
+        if _lower(covered_since) > _lower(cursor):
+            missing.append((cursor, covered_since))
+        if covered_until is None:
+            return missing
+        cursor = covered_until
+    if _lower(cursor) < _upper(until):
+        missing.append((cursor, until))
+    return missing
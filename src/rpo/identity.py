@@ -0,0 +1,152 @@
+import logging
+
+import polars as pl
+from polars import DataFrame
+
+logger = logging.getLogger(__name__)
+
+# addresses that are shared by many unrelated people, and so never identify anyone
+GENERIC_EMAILS = frozenset(
+    {
+        "",
+        "noreply@github.com",
+        "none@none",
+        "nobody@nowhere",
+        "root@localhost",
+        "unknown",
+    }
+)
+
+# single token names like these are shared by many unrelated people
+GENERIC_NAMES = frozenset({"", "root", "admin", "administrator", "ubuntu", "unknown"})
+
+# matches GitHub's private commit emails, e.g., 1234+octocat@users.noreply.github.com
+GITHUB_NOREPLY_PATTERN = r"^(?:\d+\+)?([^@]+)@users\.noreply\.github\.com$"
+
+
+class UnionFind:
+    """Disjoint set over the integers 0..n-1 with path compression and union by size"""
+
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+        self.size = [1] * n
+
+    def find(self, i: int) -> int:
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+        return root
+
+    def union(self, a: int, b: int) -> int:
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return a
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        return a
+
+    def union_by_key(self, keys: list[str | None]):
+        """Merge every element that shares a key with an earlier element. `None` keys never merge"""
+        first_seen: dict[str, int] = {}
+        for i, key in enumerate(keys):
+            if key is None:
+                continue
+            j = first_seen.setdefault(key, i)
+            if j != i:
+                _ = self.union(i, j)
+
+
+def normalized_email_expr(col: str = "email") -> pl.Expr:
+    """Lowercased, trimmed email, with GitHub's private commit emails reduced to the account name"""
+    email = pl.col(col).fill_null("").str.strip_chars().str.to_lowercase()
+    github_user = email.str.extract(GITHUB_NOREPLY_PATTERN, 1)
+    return (
+        pl.when(github_user.is_not_null())
+        .then(pl.lit("github:") + github_user)
+        .when(email.is_in(list(GENERIC_EMAILS)))
+        .then(None)
+        .otherwise(email)
+    )
+
+
+def normalized_name_expr(col: str = "name") -> pl.Expr:
+    """Case folded name with punctuation removed and whitespace collapsed. Generic names are null"""
+    name = (
+        pl.col(col)
+        .fill_null("")
+        .str.to_lowercase()
+        .str.replace_all(r"[^\w\s]", "")
+        .str.replace_all(r"\s+", " ")
+        .str.strip_chars()
+    )
+    return pl.when(name.is_in(list(GENERIC_NAMES))).then(None).otherwise(name)
+
+
+def resolve_identities(pairs: DataFrame) -> DataFrame:
+    """Groups (name, email) pairs that refer to the same person.
+
+    Pairs are merged when they share a normalized email or a normalized name. The canonical
+    name and email of each identity are the ones used on the most commits.
+
+    `pairs` must have `name`, `email` and `commits` columns, the result has `name`, `email`,
+    `identity_id`, `identity_name` and `identity_email`.
+    """
+    pairs = (
+        pairs.group_by("name", "email")
+        .agg(pl.sum("commits"))
+        .sort("commits", "name", "email", descending=[True, False, False])
+        .with_columns(
+            normalized_email_expr().alias("_email_key"),
+            normalized_name_expr().alias("_name_key"),
+        )
+    )
+
+    uf = UnionFind(pairs.height)
+    uf.union_by_key(pairs["_email_key"].to_list())
+    uf.union_by_key(pairs["_name_key"].to_list())
+    roots = [uf.find(i) for i in range(pairs.height)]
+
+    # pairs are sorted by commits, so the first entry of each group is the most used
+    resolved = pairs.with_columns(
+        identity_id=pl.Series(roots, dtype=pl.UInt64)
+    ).with_columns(
+        identity_name=pl.col("name").first().over("identity_id"),
+        identity_email=pl.col("email").drop_nulls().first().over("identity_id"),
+    )
+    logger.info(
+        f"Resolved {pairs.height} name and email pairs to {resolved['identity_id'].n_unique()} identities"
+    )
+    return resolved.select(
+        "name", "email", "identity_id", "identity_name", "identity_email"
+    )
+
+
+def apply_identities(
+    df: DataFrame,
+    identities: DataFrame,
+    roles: tuple[str, ...] = ("author", "committer"),
+) -> DataFrame:
+    """Replaces the name and email columns of each role in `df` with their canonical identity"""
+    for role in roles:
+        name, email = f"{role}_name", f"{role}_email"
+        if name not in df.columns or email not in df.columns:
+            continue
+        mapping = identities.select(
+            pl.col("name").alias(name),
+            pl.col("email").alias(email),
+            pl.col("identity_name").alias("_identity_name"),
+            pl.col("identity_email").alias("_identity_email"),
+        )
+        df = (
+            df.join(mapping, on=[name, email], how="left", maintain_order="left")
+            .with_columns(
+                pl.coalesce("_identity_name", name).alias(name),
+                pl.coalesce("_identity_email", email).alias(email),
+            )
+            .drop("_identity_name", "_identity_email")
+        )
+    return df
@@ -0,0 +1,142 @@
+import logging
+import subprocess
+from collections.abc import Iterator, Sequence
+from pathlib import Path
+from typing import Any
+
+from git.exc import GitCommandError
+from polars import DataFrame
+
+from .db import FILE_CHANGES_SCHEMA
+from .mailmap import Mailmap
+from .models import is_generated, parse_file_stats
+from .objects import CommitInfo, ObjectReader
+
+logger = logging.getLogger(__name__)
+
+
+def shards[T](items: Sequence[T], count: int) -> list[Sequence[T]]:
+    """Splits `items` into at most `count` contiguous shards of about the same size"""
+    count = max(1, min(count, len(items)))
+    size, extra = divmod(len(items), count)
+    result, start = [], 0
+    for i in range(count):
+        end = start + size + (i < extra)
+        result.append(items[start:end])
+        start = end
+    return [s for s in result if s]
+
+
+def diff_tree_args(pathspecs: Sequence[str] = ()) -> list[str]:
+    """`git diff-tree --stdin` with the output of `file_stats_args`, for many commits"""
+    return [
+        "diff-tree",
+        "--stdin",
+        "--always",
+        "-r",
+        "--root",
+        "--numstat",
+        "--raw",
+        "--no-renames",
+        "--",
+        *pathspecs,
+    ]
+
+
+def split_diff_tree(output: str, shas: Sequence[str]) -> Iterator[tuple[str, str]]:
+    """Splits `diff-tree --stdin --always` output into the diff of each commit. Every diff
+    starts with a line holding just the sha of its commit, in the order they were given.
+    """
+    lines = output.splitlines()
+    starts = []
+    i = 0
+    for n, line in enumerate(lines):
+        if i < len(shas) and line == shas[i]:
+            starts.append(n)
+            i += 1
+    if i != len(shas):
+        raise ValueError(f"Expected diffs of {len(shas)} commits, found {i}")
+    for sha, start, end in zip(shas, starts, [*starts[1:], len(lines)]):
+        yield sha, "\n".join(lines[start + 1 : end])
+
+
+def file_change_rows(
+    commit: CommitInfo,
+    stats: dict[str, dict[str, Any]],
+    repository: str,
+    mailmap: Mailmap | None = None,
+) -> dict[str, list[Any]]:
+    """The columns of `FileChangeCommitRecord.from_git(..., by_file=True)` for a commit"""
+    identity: dict[str, Any] = {}
+    for role, sig in (("author", commit.author), ("committer", commit.committer)):
+        # stored emails are lowercase, like those of `FileChangeCommitRecord.from_git`
+        email = sig.email.lower()
+        identity[f"raw_{role}_name"], identity[f"raw_{role}_email"] = sig.name, email
+        identity[f"{role}_name"], identity[f"{role}_email"] = (
+            mailmap.resolve(sig.name, email) if mailmap else (sig.name, email)
+        )
+    columns: dict[str, list[Any]] = {k: [] for k in FILE_CHANGES_SCHEMA}
+    for filename, changes in stats.items():
+        row = {
+            "repository": repository,
+            "sha": commit.sha,
+            "gpgsig": commit.gpgsig,
+            "authored_datetime": commit.author.datetime,
+            "committed_datetime": commit.committer.datetime,
+            "filename": filename,
+            "insertions": changes.get("insertions"),
+            "deletions": changes.get("deletions"),
+            "lines": changes.get("lines"),
+            "change_type": changes.get("change_type"),
+            # if all the line change statistics are 0, it's a binary file
+            "is_binary": not sum(
+                changes.get(t, 0) for t in ("insertions", "deletions", "lines")
+            ),
+            "is_generated": is_generated(filename),
+            **identity,
+        }
+        for k, v in row.items():
+            columns[k].append(v)
+    return columns
+
+
+def read_shard(
+    git_dir: Path | str,
+    shas: Sequence[str],
+    repository: str,
+    pathspecs: Sequence[str] = (),
+    mailmap: Mailmap | None = None,
+) -> DataFrame:
+    """Diffs a shard of commits with a single `git diff-tree --stdin`, returning their
+    file changes as one frame with the columns of the `file_changes` table.
+
+    Runs in a worker process, so the commits are read with the worker's own reader.
+    """
+    with ObjectReader(git_dir) as objects:
+        commits = [objects.commit(sha) for sha in shas]
+
+    command = ["git", f"--git-dir={git_dir}", *diff_tree_args(pathspecs)]
+    process = subprocess.Popen(
+        command,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    # compare with the first parent, like `Commit.stats`
+    request = "".join(
+        f"{c.sha} {c.parents[0]}\n" if c.parents else f"{c.sha}\n" for c in commits
+    ).encode()
+    stdout, stderr = process.communicate(request)
+    if process.returncode != 0:
+        raise GitCommandError(command, process.returncode, stderr)
+
+    columns: dict[str, list[Any]] = {k: [] for k in FILE_CHANGES_SCHEMA}
+    by_sha = {c.sha: c for c in commits}
+    output = stdout.decode("utf-8", errors="surrogateescape")
+    for sha, diff in split_diff_tree(output, [c.sha for c in commits]):
+        stats = parse_file_stats(diff)
+        for k, values in file_change_rows(
+            by_sha[sha], stats, repository, mailmap
+        ).items():
+            columns[k].extend(values)
+    return DataFrame(columns, schema=FILE_CHANGES_SCHEMA)
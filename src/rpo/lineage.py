@@ -0,0 +1,107 @@
+import logging
+from collections.abc import Sequence
+from datetime import UTC, datetime
+from typing import Any
+
+import polars as pl
+from git.repo import Repo
+from polars import DataFrame
+
+from .identity import UnionFind
+
+logger = logging.getLogger(__name__)
+
+COMMIT_PREFIX = "commit "
+
+RENAMES_SCHEMA = {
+    "sha": pl.String,
+    "committed_datetime": pl.Datetime("us"),
+    "old_filename": pl.String,
+    "new_filename": pl.String,
+}
+
+
+def parse_renames(output: str) -> DataFrame:
+    """Parses `git log --name-status --format='commit %H %ct'` output into one row per rename"""
+    rows: dict[str, list[Any]] = {k: [] for k in RENAMES_SCHEMA}
+    sha, committed = None, None
+    for line in output.splitlines():
+        if line.startswith(COMMIT_PREFIX):
+            sha, timestamp = line[len(COMMIT_PREFIX) :].split()
+            committed = datetime.fromtimestamp(int(timestamp), UTC).replace(tzinfo=None)
+        elif line.startswith("R") and sha is not None:
+            _, old, new = line.split("\t")
+            rows["sha"].append(sha)
+            rows["committed_datetime"].append(committed)
+            rows["old_filename"].append(old)
+            rows["new_filename"].append(new)
+    return DataFrame(rows, schema=RENAMES_SCHEMA)
+
+
+def read_renames(
+    repo: Repo, rev_spec: str | Sequence[str], pathspecs: Sequence[str] = (), **kwargs
+) -> DataFrame:
+    """Detects every rename in the traversal of `rev_spec` with a single `git log` call"""
+    output = repo.git(c="core.quotePath=false").log(
+        rev_spec,
+        "--",
+        *pathspecs,
+        M=True,
+        diff_filter="R",
+        name_status=True,
+        format=f"{COMMIT_PREFIX}%H %ct",
+        **kwargs,
+    )
+    return parse_renames(output)
+
+
+def build_lineage(files: DataFrame, renames: DataFrame) -> DataFrame:
+    """Maps every historical path to a stable file identity.
+
+    `files` has a row per path with `filename`, `first_seen` and `last_seen` columns.
+    Paths connected by renames share a `file_id`, which is the oldest path of the lineage,
+    so it doesn't change as history grows. `lineage_path` is the most recent path.
+
+    NOTE: if a path is reused after its file was renamed away, both files share a lineage.
+    """
+    paths = pl.concat(
+        [
+            files["filename"],
+            renames["old_filename"].rename("filename"),
+            renames["new_filename"].rename("filename"),
+        ]
+    ).unique(maintain_order=True)
+    index = {p: i for i, p in enumerate(paths)}
+
+    uf = UnionFind(len(index))
+    for old, new in renames.select("old_filename", "new_filename").iter_rows():
+        _ = uf.union(index[old], index[new])
+
+    return (
+        DataFrame(
+            {
+                "filename": paths,
+                "_root": [uf.find(i) for i in range(len(index))],
+            }
+        )
+        .join(files, on="filename", how="left")
+        .with_columns(
+            _renamed_from=pl.col("filename").is_in(renames["new_filename"].implode()),
+            _renamed_to=pl.col("filename").is_in(renames["old_filename"].implode()),
+        )
+        .with_columns(
+            # the oldest path is never a rename target, the newest is never renamed away
+            file_id=pl.col("filename")
+            .sort_by("_renamed_from", pl.col("first_seen").fill_null(datetime.max))
+            .first()
+            .over("_root"),
+            lineage_path=pl.col("filename")
+            .sort_by(
+                pl.col("_renamed_to").not_(),
+                pl.col("last_seen").fill_null(datetime.min),
+            )
+            .last()
+            .over("_root"),
+        )
+        .select("filename", "file_id", "lineage_path")
+    )
@@ -0,0 +1,142 @@
+import logging
+import re
+from hashlib import sha1
+
+import polars as pl
+from polars import DataFrame
+
+from .objects import ObjectNotFound, ObjectReader
+
+logger = logging.getLogger(__name__)
+
+MAILMAP_FILE = ".mailmap"
+
+# an optional name followed by an email in angle brackets
+ENTRY_PATTERN = re.compile(r"\s*([^<]*?)\s*<([^>]*)>")
+
+
+def _merge(
+    entry: tuple[str | None, str | None] | None, proper_name: str, proper_email: str
+) -> tuple[str | None, str | None]:
+    """Like git, a later line for the same commit identity only replaces what it sets"""
+    name, email = entry or (None, None)
+    return proper_name or name, proper_email.lower() or email
+
+
+class Mailmap:
+    """Canonical names and emails from a git `.mailmap` file.
+
+    Supports every form described in gitmailmap(5). Emails and names are matched
+    case insensitively and, like the rest of rpo, emails are lowercased.
+    """
+
+    def __init__(self, text: str = "", digest: str | None = None):
+        self.digest = digest if digest is not None else sha1(text.encode()).hexdigest()
+        # (commit name, commit email) -> (proper name, proper email)
+        self._by_name_email: dict[tuple[str, str], tuple[str | None, str | None]] = {}
+        # commit email -> (proper name, proper email)
+        self._by_email: dict[str, tuple[str | None, str | None]] = {}
+        for line in text.splitlines():
+            self._parse_line(line)
+
+    def __len__(self):
+        return len(self._by_email) + len(self._by_name_email)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def _parse_line(self, line: str):
+        if line.lstrip().startswith("#"):
+            return
+        entries = ENTRY_PATTERN.findall(line)
+        if not entries or len(entries) > 2:
+            return
+        proper_name, proper_email = entries[0]
+        if len(entries) == 1:
+            # Proper Name <commit@email>
+            commit_name, commit_email = "", proper_email
+            proper_email = ""
+        else:
+            commit_name, commit_email = entries[1]
+
+        commit_email = commit_email.lower()
+        if commit_name:
+            key = (commit_name.casefold(), commit_email)
+            self._by_name_email[key] = _merge(
+                self._by_name_email.get(key), proper_name, proper_email
+            )
+        else:
+            self._by_email[commit_email] = _merge(
+                self._by_email.get(commit_email), proper_name, proper_email
+            )
+
+    @classmethod
+    def from_objects(cls, objects: ObjectReader, rev: str = "HEAD") -> "Mailmap":
+        """Reads the `.mailmap` at the root of the repository at the given revision"""
+        try:
+            digest, _, data = objects.read(f"{rev}:{MAILMAP_FILE}")
+        except ObjectNotFound:
+            return cls("", digest="")
+        mailmap = cls(data.decode("utf-8", errors="replace"), digest=digest)
+        logger.info(f"Loaded {len(mailmap)} mailmap entries at {rev}")
+        return mailmap
+
+    def resolve(
+        self, name: str | None, email: str | None
+    ) -> tuple[str | None, str | None]:
+        """The canonical (name, email) for a commit identity"""
+        email_key = (email or "").lower()
+        match = self._by_name_email.get(((name or "").casefold(), email_key))
+        if match is None:
+            match = self._by_email.get(email_key)
+        if match is None:
+            return name, email
+        proper_name, proper_email = match
+        return proper_name or name, proper_email or email
+
+    def mapping(self, pairs: DataFrame) -> DataFrame:
+        """Resolves each distinct `raw_name`, `raw_email` pair to its canonical `name` and `email`"""
+        pairs = pairs.select("raw_name", "raw_email").unique()
+        resolved = [self.resolve(name, email) for name, email in pairs.iter_rows()]
+        return pairs.with_columns(
+            name=pl.Series([n for n, _ in resolved], dtype=pl.String),
+            email=pl.Series([e for _, e in resolved], dtype=pl.String),
+        )
+
+    def apply(
+        self, df: DataFrame, roles: tuple[str, ...] = ("author", "committer")
+    ) -> DataFrame:
+        """Replaces the name and email columns of each role in `df` with their canonical values"""
+        if not self:
+            return df
+        for role in roles:
+            name, email = f"{role}_name", f"{role}_email"
+            if name not in df.columns or email not in df.columns:
+                continue
+            mapping = self.mapping(
+                df.select(
+                    pl.col(name).alias("raw_name"), pl.col(email).alias("raw_email")
+                )
+            ).rename(
+                {
+                    "raw_name": name,
+                    "raw_email": email,
+                    "name": "_mailmap_name",
+                    "email": "_mailmap_email",
+                }
+            )
+            df = (
+                df.join(
+                    mapping,
+                    on=[name, email],
+                    how="left",
+                    nulls_equal=True,
+                    maintain_order="left",
+                )
+                .with_columns(
+                    pl.col("_mailmap_name").alias(name),
+                    pl.col("_mailmap_email").alias(email),
+                )
+                .drop("_mailmap_name", "_mailmap_email")
+            )
+        return df
@@ -10,16 +10,26 @@ from pydanclick import from_pydantic
 
 from .analyzer import RepoAnalyzer
 from .models import (
+    COCHANGE_MAX_FILES,
     ActivityReportCmdOptions,
     BlameCmdOptions,
+    BlameFilterOptions,
+    CompareCmdOptions,
+    CouplingCmdOptions,
     DataSelectionOptions,
     FileSaveOptions,
     GitOptions,
+    HotspotsCmdOptions,
+    IdentitiesCmdOptions,
     OutputOptions,
     PunchcardCmdOptions,
+    PunchcardsCmdOptions,
     RevisionsCmdOptions,
     SummaryCmdOptions,
 )
+from .plan import ReportPlan
+from .watch import watch as watch_refs
+
 
 logging.basicConfig(
     level=getenv("LOG_LEVEL", logging.INFO),
@@ -51,6 +61,28 @@ def data_options(func):
     )(func)
 
 
+def blame_options(func):
+    return from_pydantic("blame_options", BlameFilterOptions)(func)
+
+
+def dry_run_options(func):
+    func = click.option(
+        "--time-budget",
+        "time_budget",
+        type=click.FloatRange(min=0, min_open=True),
+        default=None,
+        help="With --dry-run, suggest how to fit the blame in this many seconds",
+    )(func)
+    return click.option(
+        "--dry-run",
+        "--explain",
+        "dry_run",
+        is_flag=True,
+        default=False,
+        help="Estimate the git invocations, time and memory the blame takes, from a few timed blames, instead of running it",
+    )(func)
+
+
 def plot_options(func):
     return from_pydantic("file_output", OutputOptions, rename={})(func)
 
@@ -98,16 +130,29 @@ def cli(
 
 
 @cli.command()
+@click.option(
+    "--approximate",
+    is_flag=True,
+    default=False,
+    help=SummaryCmdOptions.model_fields["approximate"].description,
+)
 @data_options
 @file_options
 @click.pass_context
 def summary(
-    ctx: click.Context, data_options: DataSelectionOptions, file_output: FileSaveOptions
+    ctx: click.Context,
+    data_options: DataSelectionOptions,
+    file_output: FileSaveOptions,
+    approximate: bool,
 ):
     """Generate very high level summary for the repository"""
     ra = ctx.obj.get("analyzer")
     _ = ra.summary(
-        SummaryCmdOptions(**data_options.model_dump(), **file_output.model_dump())
+        SummaryCmdOptions(
+            **data_options.model_dump(),
+            **file_output.model_dump(),
+            approximate=approximate,
+        )
     )
 
 
@@ -125,13 +170,89 @@ def revisions(
     )
 
 
+@cli.command()
+@file_options
+@click.pass_context
+def identities(ctx: click.Context, file_output: FileSaveOptions):
+    """List the identities resolved from names and emails in the repository history"""
+    ra = ctx.obj.get("analyzer")
+    _ = ra.identity_report(IdentitiesCmdOptions(**file_output.model_dump()))
+
+
+@cli.command()
+@click.option(
+    "--plan",
+    "plan_file",
+    type=click.Path(exists=True, dir_okay=False),
+    required=True,
+    help='A json list of reports to run, e.g., [{"report": "summary", "options": {"identify_by": "email"}}]',
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=None,
+    help="The number of reports to run at once",
+)
+@click.pass_context
+def report(ctx: click.Context, plan_file: PathLike[str], workers: int | None):
+    """Runs every report in a plan, sharing the work common to them"""
+    ra: RepoAnalyzer = ctx.obj.get("analyzer")
+    _ = ReportPlan.from_file(plan_file).run(ra, workers=workers)
+
+
+@cli.command()
+@click.option(
+    "--plan",
+    "plan_file",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help="A json list of reports to run again whenever new commits are ingested, like the plan of `report`",
+)
+@click.option(
+    "--interval",
+    type=click.FloatRange(min=0, min_open=True),
+    default=5.0,
+    show_default=True,
+    help="How often to check the refs for updates, in seconds",
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=None,
+    help="The number of reports to run at once",
+)
+@click.pass_context
+def watch(
+    ctx: click.Context,
+    plan_file: PathLike[str] | None,
+    interval: float,
+    workers: int | None,
+):
+    """Ingests new commits whenever the analyzed branch moves, until interrupted"""
+    ra: RepoAnalyzer = ctx.obj.get("analyzer")
+    if not ra.options.persist_data:
+        logger.warning("The store isn't persisted, so a restart ingests everything")
+    plan = ReportPlan.from_file(plan_file) if plan_file else None
+    logger.info(f"Watching {ra.ref} every {interval}s")
+    try:
+        watch_refs(ra, plan, interval=interval, workers=workers)
+    except KeyboardInterrupt:
+        logger.info("Stopped watching")
+
+
 @cli.command(aliases=["activity"])
 @click.option(
     "--report-type",
     "-t",
-    type=click.Choice(choices=["user", "users", "file", "files"]),
+    type=click.Choice(choices=["user", "users", "file", "files", "timeline"]),
     default="user",
 )
+@click.option(
+    "--sample",
+    type=click.FloatRange(0, 1, min_open=True),
+    default=None,
+    help=ActivityReportCmdOptions.model_fields["sample"].description,
+)
 @data_options
 @plot_options
 @click.pass_context
@@ -139,15 +260,18 @@ def activity_report(
     ctx: click.Context,
     data_options: DataSelectionOptions,
     file_output: OutputOptions,
-    report_type: Literal["user", "users", "file", "files"],
+    report_type: Literal["user", "users", "file", "files", "timeline"],
+    sample: float | None,
 ):
     """Produces file or author report of activity at a particular git revision"""
     ra = ctx.obj.get("analyzer")
 
     options = ActivityReportCmdOptions(
-        **file_output.model_dump(), **data_options.model_dump()
+        **file_output.model_dump(), **data_options.model_dump(), sample=sample
     )  #
-    if report_type.lower().startswith("file"):
+    if report_type.lower() == "timeline":
+        _ = ra.file_timeline(options)
+    elif report_type.lower().startswith("file"):
         _ = ra.file_report(options)
     else:
         _ = ra.contributor_report(options)
@@ -158,19 +282,30 @@ def activity_report(
 @cli.command
 @data_options
 @plot_options
+@blame_options
+@dry_run_options
 @click.option("--revision", "-R", "revision", type=str, default=None)
 @click.pass_context
 def blame(
     ctx: click.Context,
     data_options: DataSelectionOptions,
     file_output: OutputOptions,
+    blame_options: BlameFilterOptions,
     revision: str,
+    dry_run: bool,
+    time_budget: float | None,
 ):
     """Computes the per user blame for all files at a given revision"""
     ra: RepoAnalyzer = ctx.obj.get("analyzer")
     options = BlameCmdOptions(
-        **file_output.model_dump(), **data_options.model_dump()
+        **file_output.model_dump(),
+        **data_options.model_dump(),
+        **blame_options.model_dump(),
     )  #
+    if dry_run:
+        estimate = ra.estimate_blame(options, rev=revision, budget_seconds=time_budget)
+        click.echo(estimate.explain())
+        return
     data_key = "lines"
     _ = ra.blame(options, rev=revision, data_field=data_key)
 
@@ -180,34 +315,181 @@ def blame(
 @cli.command(aliases=["cblame"])
 @data_options
 @plot_options
+@blame_options
+@dry_run_options
 @click.pass_context
 def cumulative_blame(
-    ctx: click.Context, data_options: DataSelectionOptions, file_output: FileSaveOptions
+    ctx: click.Context,
+    data_options: DataSelectionOptions,
+    file_output: FileSaveOptions,
+    blame_options: BlameFilterOptions,
+    dry_run: bool,
+    time_budget: float | None,
 ):
     """Computes the cumulative blame of the repository over time. For every file in every revision,
     calculate the blame information.
     """
     ra: RepoAnalyzer = ctx.obj.get("analyzer")
     options = BlameCmdOptions(
-        **file_output.model_dump(), **data_options.model_dump()
+        **file_output.model_dump(),
+        **data_options.model_dump(),
+        **blame_options.model_dump(),
     )  #
+    if dry_run:
+        estimate = ra.estimate_blame(
+            options, cumulative=True, budget_seconds=time_budget
+        )
+        click.echo(estimate.explain())
+        return
     _ = ra.cumulative_blame(options)
 
 
 @cli.command()
 @data_options
 @plot_options
-@click.argument("identifier", type=str)
+@click.option(
+    "--min-commits",
+    type=int,
+    default=0,
+    help="Also make punchcards for every user with at least this many commits",
+)
+@click.argument("identifiers", type=str, nargs=-1)
 @click.pass_context
 def punchcard(
     ctx: click.Context,
-    identifier: str,
+    identifiers: tuple[str, ...],
+    min_commits: int,
+    data_options: DataSelectionOptions,
+    file_output: FileSaveOptions,
+):
+    """Computes commits for the given users by datetime. With more than one user, or a
+    minimum number of commits, every punchcard is computed in one pass and plotted together.
+    """
+    ra: RepoAnalyzer = ctx.obj.get("analyzer")
+    if len(identifiers) == 1 and not min_commits:
+        options = PunchcardCmdOptions(
+            identifier=identifiers[0],
+            **file_output.model_dump(),
+            **data_options.model_dump(),
+        )  #
+        _ = ra.punchcard(options)
+    else:
+        batch_options = PunchcardsCmdOptions(
+            identifiers=list(identifiers),
+            min_commits=min_commits,
+            **file_output.model_dump(),
+            **data_options.model_dump(),
+        )
+        _ = ra.punchcards(batch_options)
+
+
+@cli.command()
+@data_options
+@plot_options
+@click.option(
+    "--window",
+    "-w",
+    "windows",
+    type=int,
+    multiple=True,
+    default=[30, 90, 365],
+    show_default=True,
+    help="A trailing window in days to measure churn over. The shortest ranks hotspots",
+)
+@click.option(
+    "--by",
+    "hotspot_by",
+    type=click.Choice(["file", "directory"]),
+    default="file",
+    help="Whether to find hotspot files or directories",
+)
+@click.option(
+    "--depth",
+    type=int,
+    default=1,
+    help="How many directory levels to group files by, with --by directory",
+)
+@click.pass_context
+def hotspots(
+    ctx: click.Context,
+    windows: tuple[int, ...],
+    hotspot_by: Literal["file", "directory"],
+    depth: int,
+    data_options: DataSelectionOptions,
+    file_output: OutputOptions,
+):
+    """Ranks files or directories by how much faster they change recently than over their history"""
+    ra: RepoAnalyzer = ctx.obj.get("analyzer")
+    options = HotspotsCmdOptions(
+        windows=list(windows),
+        hotspot_by=hotspot_by,
+        depth=depth,
+        **file_output.model_dump(),
+        **data_options.model_dump(),
+    )
+    _ = ra.hotspots(options)
+
+
+@cli.command()
+@data_options
+@file_options
+@click.option(
+    "--min-commits",
+    type=int,
+    default=2,
+    show_default=True,
+    help="Only report pairs of files changed together in at least this many commits",
+)
+@click.option(
+    "--min-confidence",
+    type=click.FloatRange(0, 1),
+    default=0.0,
+    help="Only report pairs where at least this share of the commits of one file also change the other",
+)
+@click.option(
+    "--max-files",
+    type=int,
+    default=COCHANGE_MAX_FILES,
+    show_default=True,
+    help="Leave out commits that change more files than this",
+)
+@click.pass_context
+def coupling(
+    ctx: click.Context,
+    min_commits: int,
+    min_confidence: float,
+    max_files: int,
     data_options: DataSelectionOptions,
     file_output: FileSaveOptions,
 ):
-    """Computes commits for a given user by datetime"""
+    """Finds pairs of files that tend to change in the same commits"""
     ra: RepoAnalyzer = ctx.obj.get("analyzer")
-    options = PunchcardCmdOptions(
-        identifier=identifier, **file_output.model_dump(), **data_options.model_dump()
-    )  #
-    _ = ra.punchcard(options)
+    options = CouplingCmdOptions(
+        min_commits=min_commits,
+        min_confidence=min_confidence,
+        max_files=max_files,
+        **file_output.model_dump(),
+        **data_options.model_dump(),
+    )
+    _ = ra.coupling(options)
+
+
+@cli.command()
+@data_options
+@file_options
+@click.argument("branches", nargs=-1, required=True)
+@click.pass_context
+def compare(
+    ctx: click.Context,
+    branches: tuple[str, ...],
+    data_options: DataSelectionOptions,
+    file_output: FileSaveOptions,
+):
+    """Compares the commits, changes and authors of branches, and how many commits are unique to each"""
+    ra: RepoAnalyzer = ctx.obj.get("analyzer")
+    options = CompareCmdOptions(
+        branches=list(branches),
+        **file_output.model_dump(),
+        **data_options.model_dump(),
+    )
+    _ = ra.compare_branches(options)
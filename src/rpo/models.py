@@ -1,15 +1,46 @@
-from collections.abc import Iterable
+import json
+import re
+from collections.abc import Iterable, Sequence
 from copy import deepcopy
 from datetime import datetime
 from fnmatch import fnmatch
+from fnmatch import translate as fnmatch_translate
 from pathlib import Path
-from typing import Any, Literal
+from typing import Any, Literal, cast
 
 import polars as pl
 import polars.selectors as cs
 from git import Commit as GitCommit
+from git.util import Stats
 from pydantic import BaseModel, Field
 
+from .mailmap import Mailmap
+from .types import ProgressMode
+
+# files commonly generated by package managers, e.g., lock files
+GENERATED_FILE_GLOBS = (
+    "*.lock",  # ruby, rust, abunch of things
+    "package-lock.json",
+    "go.sum",
+    "node_modules/*",
+)
+
+
+# commits that change more files than this are left out of co-change analysis, because
+# their pairs grow quadratically and say little about how files are coupled
+COCHANGE_MAX_FILES = 50
+
+
+def fnmatch_regex(pattern: str) -> str:
+    """`fnmatch.translate` as a regex that polars can match, which has no `\\Z`"""
+    return "^" + fnmatch_translate(pattern).removesuffix(r"\Z") + "$"
+
+
+def is_generated(filename: str | None) -> bool:
+    return filename is not None and any(
+        fnmatch(filename, p) for p in GENERATED_FILE_GLOBS
+    )
+
 
 class FileSaveOptions(BaseModel):
     JSON: bool = Field(default=False, description="Save output as json")
@@ -71,13 +102,26 @@ class DataSelectionOptions(BaseModel):
     )
     generated: bool = Field(
         default=False,
-        description="If false (default), exclude files commonly generated by package managers, e.g., lock files. Otherwise, these will be ignored in analysis",
+        description="If false (default), exclude files commonly generated by package managers, e.g., lock files, and files marked linguist-generated or linguist-vendored in .gitattributes. Otherwise, these will be ignored in analysis",
+    )
+    follow_renames: bool = Field(
+        default=False,
+        description="If true, files are identified across renames, and reported under their most recent path",
+    )
+    resolve_identities: bool = Field(
+        default=False,
+        description="If true, automatically merge names and emails that refer to the same person (shared emails, matching names) before analysis. Aliases are applied afterwards.",
     )
 
     @property
     def group_by_key(self):
         return f"{self.aggregate_by}_{self.identify_by}"
 
+    @property
+    def selection_key(self) -> str:
+        """Identifies the data selection, ignoring every other option of a command"""
+        return self.model_dump_json(include=set(DataSelectionOptions.model_fields))
+
     @property
     def sort_key(self):
         if self.sort_by == "user":
@@ -90,33 +134,42 @@ class DataSelectionOptions(BaseModel):
             return pl.col(self.sort_by.lower())
 
     def _generated_file_globs(self) -> Iterable[str]:
-        return [
-            "*.lock",  # ruby, rust, abunch of things
-            "package-lock.json",
-            "go.sum",
-            "node_modules/*",
-        ]
+        return list(GENERATED_FILE_GLOBS)
 
-    def glob_filter_expr(self, filenames: pl.Series | Iterable[str]):
-        if self.exclude_globs:
-            filter_expr = list(
-                not any(fnmatch(filename, p) for p in self.exclude_globs)
-                for filename in filenames
+    @property
+    def filters_rows(self) -> bool:
+        """Whether the selection drops commits for reasons other than generated files,
+        or limits the number of rows
+        """
+        return bool(
+            self.include_globs or self.exclude_globs or self.exclude_users or self.limit
+        )
+
+    def glob_filter_expr(
+        self,
+        filenames: pl.Series | Iterable[str],
+        generated: pl.Series | None = None,
+    ) -> pl.Series:
+        """Which of `filenames` the include and exclude globs keep. Without globs,
+        generated files are dropped unless `generated` is set. Which files are generated
+        can be given, it defaults to matching `GENERATED_FILE_GLOBS`.
+        """
+        names = pl.Series(filenames, dtype=pl.String)
+
+        def matches(globs: Iterable[str]) -> pl.Series:
+            return names.str.contains(
+                "|".join(f"(?:{fnmatch_regex(p)})" for p in globs)
             )
+
+        if self.exclude_globs:
+            return ~matches(self.exclude_globs)
         elif self.include_globs:
-            filter_expr = list(
-                any(fnmatch(filename, p) for p in self.include_globs)
-                for filename in filenames
-            )
+            return matches(self.include_globs)
         elif not self.generated:
-            filter_expr = list(
-                not any(fnmatch(filename, p) for p in self._generated_file_globs())
-                for filename in filenames
-            )
-        else:
-            filter_expr = list(True for _ in filenames)
-
-        return filter_expr
+            if generated is None:
+                generated = matches(self._generated_file_globs())
+            return ~generated
+        return pl.Series([True] * len(names), dtype=pl.Boolean)
 
 
 class RevisionsCmdOptions(DataSelectionOptions, FileSaveOptions):
@@ -126,12 +179,46 @@ class RevisionsCmdOptions(DataSelectionOptions, FileSaveOptions):
 class SummaryCmdOptions(DataSelectionOptions, FileSaveOptions):
     """Options for the ProjectAnalyzer.summary command"""
 
+    approximate: bool = Field(
+        default=False,
+        description="If true, estimate the distinct counts from sketches kept in the store, in constant time, and report a 95% error bound for each. Selections the sketches can't answer are counted exactly, with an error of 0",
+    )
+
+
+class IdentitiesCmdOptions(FileSaveOptions):
+    """Options for the ProjectAnalyzer.identity_report command"""
+
 
 class ActivityReportCmdOptions(DataSelectionOptions, OutputOptions):
     """Options for the ProjectAnalyzer.activity_report"""
 
+    sample: float | None = Field(
+        default=None,
+        gt=0,
+        le=1,
+        description="If set, only read this fraction of the commits, and scale the totals of the user and file reports up, with a 95% error bound for each. The same commits are sampled on every run",
+    )
+
+
+class BlameFilterOptions(BaseModel):
+    max_file_size_kb: int | None = Field(
+        default=1024,
+        ge=1,
+        description="Skip blaming files larger than this, in KB, e.g., bundles and generated files",
+    )
+    max_lines: int | None = Field(
+        default=None,
+        ge=1,
+        description="Skip blaming files with more lines than this. Counting lines reads every blob, which also detects binary files that the history doesn't already mark. Unlimited if not set",
+    )
+    every: int = Field(
+        default=1,
+        ge=1,
+        description="For cumulative blame, only blame every Nth revision, counting back from the latest",
+    )
+
 
-class BlameCmdOptions(DataSelectionOptions, OutputOptions):
+class BlameCmdOptions(DataSelectionOptions, OutputOptions, BlameFilterOptions):
     """Options for ProjectAnalyzer.blame and ProjectAnalyzer.cumulative_blame"""
 
 
@@ -139,10 +226,72 @@ class BusFactorCmdOptions(DataSelectionOptions, OutputOptions):
     """Options for ProjectAnalyzer.bus_factor"""
 
 
-class PunchcardCmdOptions(DataSelectionOptions, OutputOptions):
-    """Options for ProjectAnalyzer.punchcard"""
+class HotspotsCmdOptions(DataSelectionOptions, OutputOptions):
+    """Options for ProjectAnalyzer.hotspots"""
 
-    identifier: str
+    windows: list[int] = Field(
+        default=[30, 90, 365],
+        min_length=1,
+        description="The trailing windows, in days before the analyzed revision, to measure churn over. The shortest one is the recent churn that hotspots are ranked by",
+    )
+    hotspot_by: Literal["file", "directory"] = Field(
+        default="file",
+        description="Whether to find hotspot files or directories",
+    )
+    depth: int = Field(
+        default=1,
+        ge=1,
+        description="How many directory levels to group files by, when finding hotspot directories",
+    )
+
+    @property
+    def hotspot_key(self) -> str:
+        return "filename" if self.hotspot_by == "file" else "directory"
+
+
+class CouplingCmdOptions(DataSelectionOptions, OutputOptions):
+    """Options for ProjectAnalyzer.coupling"""
+
+    min_commits: int = Field(
+        default=2,
+        ge=1,
+        description="Only report pairs of files changed together in at least this many commits",
+    )
+    min_confidence: float = Field(
+        default=0.0,
+        ge=0,
+        le=1,
+        description="Only report pairs where at least this share of the commits of one file also change the other",
+    )
+    max_files: int = Field(
+        default=COCHANGE_MAX_FILES,
+        ge=2,
+        description="Leave out commits that change more files than this, e.g., mass reformats or vendoring",
+    )
+
+
+class CompareCmdOptions(DataSelectionOptions, OutputOptions):
+    """Options for ProjectAnalyzer.compare_branches"""
+
+    branches: list[str] = Field(
+        default=[],
+        min_length=1,
+        description="The branches, or any other refs, to compare",
+    )
+
+
+class PunchcardsCmdOptions(DataSelectionOptions, OutputOptions):
+    """Options for ProjectAnalyzer.punchcards"""
+
+    identifiers: list[str] = Field(
+        default=[],
+        description="The user identifiers (name or email) to make punchcards for",
+    )
+    min_commits: int = Field(
+        default=0,
+        ge=0,
+        description="Also make punchcards for every user with at least this many commits. If no identifiers or minimum are given, every user is included",
+    )
 
     @property
     def punchcard_key(self):
@@ -151,6 +300,12 @@ class PunchcardCmdOptions(DataSelectionOptions, OutputOptions):
         return "authored_datetime"
 
 
+class PunchcardCmdOptions(PunchcardsCmdOptions):
+    """Options for ProjectAnalyzer.punchcard"""
+
+    identifier: str
+
+
 class GitOptions(BaseModel):
     path: Path = Field(
         default=Path.cwd(),
@@ -160,6 +315,10 @@ class GitOptions(BaseModel):
         default=None,
         description="The branch to use for analysis. If not specified, defaults to the 'main' or 'master', in that order.",
     )
+    check_dirty: Literal["skip", "index", "working_tree"] = Field(
+        default="index",
+        description="How to check for uncommitted changes. 'index' only compares staged changes to HEAD, which is fast even on huge checkouts, 'working_tree' also stats every tracked file",
+    )
     ignore_merges: bool = Field(
         default=False,
         description="Whether to ignore merge commits in contribution analysis",
@@ -176,6 +335,59 @@ class GitOptions(BaseModel):
         default=True,
         description="If true, persist commit data locally to speed up future analyses",
     )
+    cache_size_mb: int = Field(
+        default=256,
+        ge=0,
+        description="Size bound of the report result cache in the rpo data directory, in MB. Results are only cached when persisting data. 0 disables the cache",
+    )
+    memory_limit_mb: int | None = Field(
+        default=None,
+        ge=64,
+        description="Bound the memory used by ingest and cumulative blame, in MB. DuckDB spills to disk past the limit, and history is ingested and cumulative blame is collected in batches that fit in it. Other reports still load the selected history into memory, see `--sample` and `--approximate` to read less of it",
+    )
+    max_git_processes: int | None = Field(
+        default=None,
+        ge=1,
+        description="The most git processes to run at once for ingest and blame. Defaults to the number of cpus",
+    )
+    ingest_workers: int = Field(
+        default=1,
+        ge=1,
+        description="Worker processes that ingest history in parallel, each diffing and parsing a contiguous shard of the commits. 1 ingests sequentially",
+    )
+    progress: ProgressMode = Field(
+        default="log",
+        description="How to report progress of long running ingest and blame jobs: as log events, rendered to stderr, or not at all",
+    )
+    since: datetime | None = Field(
+        default=None,
+        description="Only analyze commits committed at or after this date. Applied by git, so older history is never read",
+    )
+    until: datetime | None = Field(
+        default=None,
+        description="Only analyze commits committed at or before this date. Applied by git, so newer history is never read",
+    )
+    pathspecs: list[str] = Field(
+        default=[],
+        description="Only analyze changes to these paths (directories, files or globs, relative to the root of the repository). Applied by git, so other paths are never diffed",
+    )
+
+    @property
+    def scope(self) -> str:
+        """A stable key for the set of paths being analyzed. Empty if all paths are analyzed"""
+        return json.dumps(sorted(self.pathspecs)) if self.pathspecs else ""
+
+    def pathspec_filter_expr(self, col: str = "filename") -> pl.Expr:
+        """Matches paths the same way the git pathspecs in `pathspecs` do"""
+        if not self.pathspecs:
+            return pl.lit(True)
+        patterns = [
+            fnmatch_regex(p)
+            if any(c in p for c in "*?[")
+            else f"^{re.escape(p.rstrip('/'))}(?:/|$)"
+            for p in self.pathspecs
+        ]
+        return pl.col(col).str.contains("|".join(f"(?:{p})" for p in patterns))
 
 
 def recursive_getattr(
@@ -196,6 +408,64 @@ def recursive_getattr(
         return recursive_getattr(getattr(obj, head), tail)
 
 
+def file_stats_args(
+    sha: str, parent: str | None, pathspecs: Sequence[str] = ()
+) -> list[str]:
+    """The git command that `Commit.stats` runs for a commit, restricted to `pathspecs`"""
+    if parent is not None:
+        return [
+            "diff",
+            "--numstat",
+            "--no-renames",
+            "--raw",
+            parent,
+            sha,
+            "--",
+            *pathspecs,
+        ]
+    return [
+        "diff-tree",
+        "-r",
+        "--numstat",
+        "--no-renames",
+        "--root",
+        "--raw",
+        sha,
+        "--",
+        *pathspecs,
+    ]
+
+
+def parse_file_stats(output: str, root: bool = False) -> dict[str, dict[str, Any]]:
+    """Parses the output of the `file_stats_args` command into `Stats.files`"""
+    lines = output.splitlines()
+    if root:
+        # diff-tree starts with the sha of the commit
+        lines = lines[1:]
+    # `--raw` lines come first, followed by the same files in the same order for `--numstat`
+    text = ""
+    for raw, numstat in zip(lines, lines[len(lines) // 2 :]):
+        change_type = raw.split("\t")[0][-1]
+        text += f"{change_type}\t{numstat}\n"
+    return Stats._list_from_string(None, text).files  # type: ignore[arg-type]
+
+
+def commit_file_stats(
+    git_commit: GitCommit, pathspecs: Sequence[str] = ()
+) -> dict[str, dict[str, Any]]:
+    """Per file change statistics of a commit against its first parent. Same as
+    `Commit.stats.files`, but git only diffs the paths matching `pathspecs`, if given.
+    """
+    if not pathspecs:
+        # the paths are strs, GitPython only declares them as path-like
+        return cast(dict[str, dict[str, Any]], git_commit.stats.files)
+    parent = git_commit.parents[0].hexsha if git_commit.parents else None
+    output = git_commit.repo.git.execute(
+        ["git", *file_stats_args(git_commit.hexsha, parent, pathspecs)]
+    )
+    return parse_file_stats(str(output), root=parent is None)
+
+
 class FileChangeCommitRecord(BaseModel):
     repository: str
     sha: str
@@ -215,9 +485,25 @@ class FileChangeCommitRecord(BaseModel):
     lines: float | None = None
     change_type: Literal["M", "A", "D"] | None = None
     is_binary: bool | None = None
+    # identities as recorded in the commit, before .mailmap resolution
+    raw_author_name: str | None = None
+    raw_author_email: str | None = None
+    raw_committer_name: str | None = None
+    raw_committer_email: str | None = None
 
     @classmethod
-    def from_git(cls, git_commit: GitCommit, for_repo: str, by_file: bool = False):
+    def from_git(
+        cls,
+        git_commit: GitCommit,
+        for_repo: str,
+        by_file: bool = False,
+        mailmap: Mailmap | None = None,
+        pathspecs: Sequence[str] = (),
+        stats: dict[str, dict[str, Any]] | None = None,
+    ):
+        """Records of a commit, or of each file it changes with `by_file`. File `stats` that
+        were already read, e.g., by a `GitScheduler`, are used instead of diffing again.
+        """
         fields = {
             "hexsha": "sha",
             "authored_datetime": "authored_datetime",
@@ -231,9 +517,18 @@ class FileChangeCommitRecord(BaseModel):
         }
         base = {v: recursive_getattr(git_commit, f) for f, v in fields.items()}
         base["repository"] = for_repo
+        for role in ("author", "committer"):
+            name, email = base[f"{role}_name"], base[f"{role}_email"]
+            base[f"raw_{role}_name"], base[f"raw_{role}_email"] = name, email
+            if mailmap:
+                base[f"{role}_name"], base[f"{role}_email"] = mailmap.resolve(
+                    name, email
+                )
         if by_file:
             data = deepcopy(base)
-            for f, changes in git_commit.stats.files.items():
+            if stats is None:
+                stats = commit_file_stats(git_commit, pathspecs)
+            for f, changes in stats.items():
                 data["filename"] = f
                 # if all the line change statistics are 0, it's a binary file
                 lines_changed = sum(
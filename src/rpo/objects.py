@@ -0,0 +1,340 @@
+import logging
+import os
+import subprocess
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import IO, Any, NamedTuple
+
+import polars as pl
+from polars import DataFrame
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SIZE = 8192
+
+TREE_SCHEMA = {"filename": pl.String, "mode": pl.String, "sha": pl.String}
+
+
+class ObjectNotFound(KeyError):
+    pass
+
+
+class Signature(NamedTuple):
+    name: str
+    email: str
+    datetime: datetime
+
+
+class CommitInfo(NamedTuple):
+    sha: str
+    tree: str
+    parents: tuple[str, ...]
+    author: Signature
+    committer: Signature
+    summary: str
+    gpgsig: str = ""
+
+
+class TreeEntry(NamedTuple):
+    mode: str
+    name: str
+    sha: str
+
+    @property
+    def is_tree(self) -> bool:
+        return self.mode == "40000"
+
+    @property
+    def is_blob(self) -> bool:
+        return not self.is_tree and self.mode != "160000"
+
+
+class LRUCache[K, V]:
+    """A least recently used cache, safe to share between threads"""
+
+    def __init__(self, maxsize: int = DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data: OrderedDict[K, V] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: K) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def get(self, key: K) -> V | None:
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key: K, value: V):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                _ = self._data.popitem(last=False)
+
+
+def parse_signature(line: str, lower_email: bool = True) -> Signature:
+    """Parses `Name <email> timestamp tz` from a commit header"""
+    name, _, rest = line.partition(" <")
+    email, _, when = rest.partition("> ")
+    timestamp, tz = when.split()
+    sign = -1 if tz.startswith("-") else 1
+    offset = timedelta(hours=int(tz[1:3]), minutes=int(tz[3:5])) * sign
+    return Signature(
+        name,
+        email.lower() if lower_email else email,
+        datetime.fromtimestamp(int(timestamp), timezone(offset)),
+    )
+
+
+def parse_commit(sha: str, data: bytes) -> CommitInfo:
+    """Parses a raw commit. Emails keep their case, and the signature is read like
+    GitPython reads `Commit.gpgsig`
+    """
+    header, _, message = data.decode("utf-8", errors="replace").partition("\n\n")
+    fields: dict[str, Any] = {"parents": []}
+    signature: list[str] = []
+    key = ""
+    for line in header.splitlines():
+        if line.startswith(" "):
+            # continuation of a multi-line header
+            if key == "gpgsig":
+                signature.append(line[1:])
+            continue
+        key, _, value = line.partition(" ")
+        if key == "parent":
+            fields["parents"].append(value)
+        elif key == "gpgsig" and not signature:
+            signature.append(value)
+        elif key in ("tree", "author", "committer") and key not in fields:
+            fields[key] = value
+    return CommitInfo(
+        sha=sha,
+        tree=fields["tree"],
+        parents=tuple(fields["parents"]),
+        author=parse_signature(fields["author"], lower_email=False),
+        committer=parse_signature(fields["committer"], lower_email=False),
+        summary=message.split("\n", 1)[0],
+        gpgsig="\n".join(signature).rstrip("\n"),
+    )
+
+
+def parse_tree(data: bytes, hash_size: int) -> list[TreeEntry]:
+    entries = []
+    i = 0
+    while i < len(data):
+        space = data.index(b" ", i)
+        nul = data.index(b"\0", space)
+        entries.append(
+            TreeEntry(
+                mode=data[i:space].decode(),
+                name=data[space + 1 : nul].decode("utf-8", errors="surrogateescape"),
+                sha=data[nul + 1 : nul + 1 + hash_size].hex(),
+            )
+        )
+        i = nul + 1 + hash_size
+    return entries
+
+
+class _BatchProcess:
+    """A `git cat-file` process in one of the batch modes"""
+
+    def __init__(self, git_dir: Path, mode: str):
+        self.process = subprocess.Popen(
+            ["git", f"--git-dir={git_dir}", "cat-file", mode],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        self.stdin: IO[bytes] = self.process.stdin  # type: ignore[assignment]
+        self.stdout: IO[bytes] = self.process.stdout  # type: ignore[assignment]
+
+    def request(self, names: Iterable[str]):
+        self.stdin.write(b"".join(f"{n}\n".encode() for n in names))
+        self.stdin.flush()
+
+    def header(self, name: str) -> tuple[str, str, int]:
+        parts = self.stdout.readline().decode().split()
+        if len(parts) != 3:
+            raise ObjectNotFound(name)
+        sha, kind, size = parts
+        return sha, kind, int(size)
+
+    def close(self):
+        for stream in (self.stdin, self.stdout):
+            stream.close()
+        _ = self.process.wait()
+
+
+class ObjectReader:
+    """Reads git objects through long lived `git cat-file --batch` and `--batch-check`
+    processes, instead of starting a git process per query.
+
+    Decoded commits and trees are kept in an LRU cache. Recursive tree listings are cached
+    per tree, so listing consecutive revisions only descends into the subtrees that changed.
+
+    The processes are started lazily and belong to the process that started them, so a
+    reader copied into a worker process starts its own.
+    """
+
+    def __init__(self, git_dir: Path | str, cache_size: int = DEFAULT_CACHE_SIZE):
+        self.git_dir = Path(git_dir)
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._pid: int | None = None
+        self._batch: _BatchProcess | None = None
+        self._check: _BatchProcess | None = None
+        self._init_caches()
+
+    def _init_caches(self):
+        self._commits: LRUCache[str, CommitInfo] = LRUCache(self.cache_size)
+        self._trees: LRUCache[str, list[TreeEntry]] = LRUCache(self.cache_size)
+        self._listings: LRUCache[str, DataFrame] = LRUCache(self.cache_size)
+        self._sizes: LRUCache[str, int] = LRUCache(self.cache_size * 8)
+
+    def __getstate__(self):
+        return {"git_dir": self.git_dir, "cache_size": self.cache_size}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _processes(self) -> tuple[_BatchProcess, _BatchProcess]:
+        if self._pid != os.getpid() or self._batch is None or self._check is None:
+            # never share the pipes of a parent process
+            self._pid = os.getpid()
+            self._batch = _BatchProcess(self.git_dir, "--batch")
+            self._check = _BatchProcess(self.git_dir, "--batch-check")
+        return self._batch, self._check
+
+    def close(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                for p in (self._batch, self._check):
+                    if p is not None:
+                        p.close()
+            self._batch = self._check = None
+            self._pid = None
+
+    def read(self, name: str) -> tuple[str, str, bytes]:
+        """The (sha, type, content) of an object, by sha or any name git can resolve, e.g., `HEAD:path`"""
+        with self._lock:
+            batch, _ = self._processes()
+            batch.request([name])
+            sha, kind, size = batch.header(name)
+            data = batch.stdout.read(size)
+            _ = batch.stdout.read(1)
+        return sha, kind, data
+
+    def info(self, names: Iterable[str]) -> list[tuple[str, str, int] | None]:
+        """The (sha, type, size) of each object, or None if it doesn't exist. Queries are pipelined"""
+        names = list(names)
+        results: list[tuple[str, str, int] | None] = []
+        with self._lock:
+            _, check = self._processes()
+            # write from another thread so a large request can't deadlock on a full pipe
+            writer = threading.Thread(target=check.request, args=(names,))
+            writer.start()
+            for name in names:
+                try:
+                    results.append(check.header(name))
+                except ObjectNotFound:
+                    results.append(None)
+            writer.join()
+        return results
+
+    def rev_parse(self, rev: str) -> str:
+        (res,) = self.info([rev])
+        if res is None:
+            raise ObjectNotFound(rev)
+        return res[0]
+
+    def commit(self, rev: str) -> CommitInfo:
+        # only shas are cached, names like `HEAD` are resolved every time, since they move
+        cached = self._commits.get(rev)
+        if cached is not None:
+            return cached
+        sha, kind, data = self.read(f"{rev}^{{commit}}")
+        commit = self._commits.get(sha)
+        if commit is None:
+            commit = parse_commit(sha, data)
+            self._commits.put(sha, commit)
+        return commit
+
+    def tree(self, sha: str) -> list[TreeEntry]:
+        cached = self._trees.get(sha)
+        if cached is not None:
+            return cached
+        sha, kind, data = self.read(sha)
+        if kind != "tree":
+            raise ValueError(f"{sha} is a {kind}, not a tree")
+        entries = parse_tree(data, hash_size=len(sha) // 2)
+        self._trees.put(sha, entries)
+        return entries
+
+    def _listing(self, tree_sha: str) -> DataFrame:
+        """Every blob below a tree, with paths relative to it"""
+        cached = self._listings.get(tree_sha)
+        if cached is not None:
+            return cached
+        entries = self.tree(tree_sha)
+        blobs = [e for e in entries if e.is_blob]
+        frames = [
+            DataFrame(
+                {
+                    "filename": [e.name for e in blobs],
+                    "mode": [e.mode for e in blobs],
+                    "sha": [e.sha for e in blobs],
+                },
+                schema=TREE_SCHEMA,
+            )
+        ]
+        for e in entries:
+            if e.is_tree:
+                frames.append(
+                    self._listing(e.sha).with_columns(
+                        (pl.lit(f"{e.name}/") + pl.col("filename")).alias("filename")
+                    )
+                )
+        listing = pl.concat(frames).sort("filename")
+        self._listings.put(tree_sha, listing)
+        return listing
+
+    def ls_tree(self, rev: str, with_sizes: bool = False) -> DataFrame:
+        """Recursive listing of the blobs at a revision, like `git ls-tree -r [-l]`"""
+        listing = self._listing(self.commit(rev).tree)
+        if with_sizes:
+            sizes = self.sizes(listing["sha"])
+            listing = listing.with_columns(
+                size=pl.Series([sizes[s] for s in listing["sha"]], dtype=pl.UInt64)
+            )
+        return listing
+
+    def sizes(self, shas: Iterable[str]) -> dict[str, int]:
+        """The size of each blob in bytes"""
+        sizes: dict[str, int] = {}
+        missing: list[str] = []
+        for sha in set(shas):
+            cached = self._sizes.get(sha)
+            if cached is None:
+                missing.append(sha)
+            else:
+                sizes[sha] = cached
+        for sha, res in zip(missing, self.info(missing)):
+            sizes[sha] = res[2] if res is not None else 0
+            self._sizes.put(sha, sizes[sha])
+        return sizes
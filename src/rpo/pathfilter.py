@@ -0,0 +1,247 @@
+import logging
+import re
+from collections.abc import Iterable, Sequence
+from hashlib import sha1
+from typing import NamedTuple
+
+import polars as pl
+
+from .models import GENERATED_FILE_GLOBS, fnmatch_regex
+from .objects import ObjectReader
+
+logger = logging.getLogger(__name__)
+
+GITIGNORE_FILE = ".gitignore"
+GITATTRIBUTES_FILE = ".gitattributes"
+
+# attributes that mark files as generated for linguist, and so for rpo
+GENERATED_ATTRIBUTES = ("linguist-generated", "linguist-vendored")
+
+
+class Rule(NamedTuple):
+    # matches the whole path, relative to the root of the repository
+    regex: str
+    # whether a matching path is ignored or generated
+    value: bool
+    # only matches directories, like gitignore patterns with a trailing slash
+    directory: bool = False
+
+
+def wildmatch_regex(pattern: str) -> str:
+    """A gitignore(5) pattern body as a regex, without anchors"""
+    parts: list[str] = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith("**", i):
+            before = i == 0 or pattern[i - 1] == "/"
+            after = i + 2 == len(pattern) or pattern[i + 2] == "/"
+            if before and after:
+                if i + 2 == len(pattern):
+                    # a trailing /** matches everything inside
+                    parts.append(".*")
+                else:
+                    # a leading **/ or a /**/ matches any number of directories
+                    parts.append("(?:.*/)?")
+                i += 3
+                continue
+            parts.append("[^/]*")
+            i += 2
+        elif c == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif c == "?":
+            parts.append("[^/]")
+            i += 1
+        elif c == "[" and (end := pattern.find("]", i + 2)) != -1:
+            body = pattern[i + 1 : end]
+            if body[0] in "!^":
+                body = "^" + body[1:]
+            parts.append("[" + body.replace("\\", "\\\\") + "]")
+            i = end + 1
+        elif c == "\\" and i + 1 < len(pattern):
+            parts.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            parts.append(re.escape(c))
+            i += 1
+    return "".join(parts)
+
+
+def pattern_regex(pattern: str, base: str = "") -> str:
+    """A gitignore(5) pattern read from a file in the directory `base`, as a regex that
+    matches whole paths. Patterns without a slash match a name at any depth.
+    """
+    if "/" in pattern:
+        return f"^{re.escape(base)}{wildmatch_regex(pattern.lstrip('/'))}$"
+    return f"^{re.escape(base)}(?:.*/)?{wildmatch_regex(pattern)}$"
+
+
+def parse_gitignore(text: str, base: str = "") -> list[Rule]:
+    rules = []
+    for line in text.splitlines():
+        # trailing spaces are ignored unless they are escaped
+        line = re.sub(r"(?<!\\)\s+$", "", line)
+        if not line or line.startswith("#"):
+            continue
+        negated = line.startswith("!")
+        if negated or line.startswith(("\\#", "\\!")):
+            line = line[1:]
+        directory = line.endswith("/")
+        line = line.rstrip("/")
+        if line:
+            rules.append(Rule(pattern_regex(line, base), not negated, directory))
+    return rules
+
+
+def parse_gitattributes(text: str, base: str = "") -> list[Rule]:
+    """The rules that set or unset any of `GENERATED_ATTRIBUTES`"""
+    rules = []
+    for line in text.splitlines():
+        fields = line.split()
+        if not fields or fields[0].startswith(("#", "!", '"')):
+            continue
+        # unlike gitignore, a pattern that matches a directory doesn't match its files
+        pattern, attributes = fields[0], fields[1:]
+        if pattern.endswith("/"):
+            continue
+        for attribute in attributes:
+            name, _, value = attribute.lstrip("-!").partition("=")
+            if name in GENERATED_ATTRIBUTES:
+                unset = attribute[0] in "-!" or value == "false"
+                rules.append(Rule(pattern_regex(pattern, base), not unset))
+    return rules
+
+
+class PathRules:
+    """Rules where the last one that matches a path decides, like the lines of a
+    gitignore file. Runs of rules with the same value are compiled into one regex, so
+    a path is matched against each run rather than each rule.
+    """
+
+    def __init__(self, rules: Sequence[Rule]):
+        self.rules = list(rules)
+        self._runs: list[tuple[str, bool]] = []
+        for rule in self.rules:
+            if self._runs and self._runs[-1][1] == rule.value:
+                regex, value = self._runs.pop()
+                self._runs.append((f"{regex}|(?:{rule.regex})", value))
+            else:
+                self._runs.append((f"(?:{rule.regex})", rule.value))
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    @property
+    def digest(self) -> str:
+        return sha1(repr(self.rules).encode()).hexdigest()
+
+    def match(self, paths: pl.Series) -> pl.Series:
+        """Whether each path is matched by a rule with a true value, and no later rule"""
+        expr: pl.Expr = pl.lit(False)
+        for regex, value in self._runs:
+            expr = (
+                pl.when(pl.col("path").str.contains(regex)).then(value).otherwise(expr)
+            )
+        return pl.DataFrame({"path": paths}).select(expr.alias("matched"))["matched"]
+
+
+def _ancestors(paths: Iterable[str]) -> list[str]:
+    """Every directory above the paths, parents before their children"""
+    dirs: set[str] = set()
+    for path in paths:
+        parts = path.split("/")[:-1]
+        dirs.update("/".join(parts[: i + 1]) for i in range(len(parts)))
+    return sorted(dirs, key=lambda d: (d.count("/"), d))
+
+
+class PathFilter:
+    """Which paths are ignored and which are generated, from every `.gitignore` and the
+    linguist attributes in every `.gitattributes` of a revision.
+
+    Rules of deeper files take precedence, like in git. Paths are matched once per unique
+    path, so repeated paths, e.g., the file changes of a history, cost nothing extra.
+    """
+
+    def __init__(
+        self, ignore: Sequence[Rule] = (), generated: Sequence[Rule] = ()
+    ) -> None:
+        self.ignore = PathRules(ignore)
+        # the generated file globs are the defaults, that attributes can override
+        self.generated_rules = PathRules(
+            [Rule(fnmatch_regex(p), True) for p in GENERATED_FILE_GLOBS]
+            + list(generated)
+        )
+
+    @property
+    def digest(self) -> str:
+        """Identifies which files are generated, which is stored with every file change"""
+        return self.generated_rules.digest
+
+    @classmethod
+    def from_objects(cls, objects: ObjectReader, rev: str = "HEAD") -> "PathFilter":
+        """Reads the rule files at a revision through a shared `ObjectReader`"""
+        listing = objects.ls_tree(rev).filter(
+            pl.col("filename").str.contains(
+                f"(?:^|/)(?:{re.escape(GITIGNORE_FILE)}|{re.escape(GITATTRIBUTES_FILE)})$"
+            )
+        )
+        ignore: list[Rule] = []
+        generated: list[Rule] = []
+        files = sorted(
+            listing.select("filename", "sha").iter_rows(),
+            key=lambda r: (r[0].count("/"), r[0]),
+        )
+        for filename, sha in files:
+            base, _, name = filename.rpartition("/")
+            base = f"{base}/" if base else ""
+            _, _, data = objects.read(sha)
+            text = data.decode("utf-8", errors="replace")
+            if name == GITIGNORE_FILE:
+                ignore.extend(parse_gitignore(text, base))
+            else:
+                generated.extend(parse_gitattributes(text, base))
+        logger.info(
+            f"Loaded {len(ignore)} ignore and {len(generated)} generated file rules at {rev}"
+        )
+        return cls(ignore, generated)
+
+    def ignored(self, paths: pl.Series) -> pl.Series:
+        """Whether each path is ignored. Like git, a path in an ignored directory can't be
+        re-included by a later negated pattern.
+        """
+        if not self.ignore:
+            return pl.Series([False] * len(paths), dtype=pl.Boolean)
+        names = paths.unique().drop_nulls()
+        dirs = pl.Series(_ancestors(names), dtype=pl.String)
+        matched = dict(zip(dirs, self.ignore.match(dirs)))
+        ignored_dirs: set[str] = set()
+        for d in dirs:
+            parent = d.rpartition("/")[0]
+            if matched[d] or parent in ignored_dirs:
+                ignored_dirs.add(d)
+
+        files = PathRules([r for r in self.ignore.rules if not r.directory])
+        df = pl.DataFrame({"path": names}).with_columns(
+            ignored=files.match(names)
+            | pl.col("path")
+            .str.replace(r"/[^/]*$|^[^/]*$", "")
+            .is_in(pl.Series(sorted(ignored_dirs), dtype=pl.String).implode())
+        )
+        return (
+            pl.DataFrame({"path": paths})
+            .join(df, on="path", how="left", maintain_order="left")["ignored"]
+            .fill_null(False)
+        )
+
+    def generated(self, paths: pl.Series) -> pl.Series:
+        """Whether each path is generated or vendored"""
+        names = paths.unique().drop_nulls()
+        df = pl.DataFrame(
+            {"path": names, "generated": self.generated_rules.match(names)}
+        )
+        return (
+            pl.DataFrame({"path": paths})
+            .join(df, on="path", how="left", maintain_order="left")["generated"]
+            .fill_null(False)
+        )
@@ -0,0 +1,121 @@
+import json
+import logging
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from os import PathLike
+from typing import TYPE_CHECKING, Any, Literal
+
+from polars import DataFrame
+from pydantic import BaseModel, Field
+
+from .models import (
+    ActivityReportCmdOptions,
+    BlameCmdOptions,
+    CompareCmdOptions,
+    CouplingCmdOptions,
+    HotspotsCmdOptions,
+    PunchcardsCmdOptions,
+    RevisionsCmdOptions,
+    SummaryCmdOptions,
+)
+
+if TYPE_CHECKING:
+    from .analyzer import RepoAnalyzer
+
+logger = logging.getLogger(__name__)
+
+type ReportName = Literal[
+    "summary",
+    "revisions",
+    "users",
+    "files",
+    "timeline",
+    "blame",
+    "cumulative-blame",
+    "punchcard",
+    "hotspots",
+    "coupling",
+    "compare",
+]
+
+# report name -> (options model, RepoAnalyzer method)
+REPORTS: dict[str, tuple[type[BaseModel], str]] = {
+    "summary": (SummaryCmdOptions, "summary"),
+    "revisions": (RevisionsCmdOptions, "revisions"),
+    "users": (ActivityReportCmdOptions, "contributor_report"),
+    "files": (ActivityReportCmdOptions, "file_report"),
+    "timeline": (ActivityReportCmdOptions, "file_timeline"),
+    "blame": (BlameCmdOptions, "blame"),
+    "cumulative-blame": (BlameCmdOptions, "cumulative_blame"),
+    "punchcard": (PunchcardsCmdOptions, "punchcards"),
+    "hotspots": (HotspotsCmdOptions, "hotspots"),
+    "coupling": (CouplingCmdOptions, "coupling"),
+    "compare": (CompareCmdOptions, "compare_branches"),
+}
+
+
+class ReportSpec(BaseModel):
+    report: ReportName
+    options: dict[str, Any] = Field(
+        default={},
+        description="The options of the report, as accepted by its command",
+    )
+
+    def command_options(self) -> Any:
+        model, _ = REPORTS[self.report]
+        return model.model_validate(self.options)
+
+
+class ReportPlan:
+    """Runs many reports over one analyzer.
+
+    Reports are grouped by their data selection, so the selected revisions are computed
+    once per group and shared. The store is read before any report runs, and the reports
+    themselves then run concurrently.
+    """
+
+    def __init__(self, specs: list[ReportSpec]):
+        self.specs = specs
+        self.options = [s.command_options() for s in specs]
+
+    @classmethod
+    def from_file(cls, path: str | PathLike[str]) -> "ReportPlan":
+        """Reads a json list of report specs, or an object with a `reports` list"""
+        with open(path, "r") as f:
+            raw = json.load(f)
+        if isinstance(raw, dict):
+            raw = raw.get("reports", [])
+        return cls([ReportSpec.model_validate(r) for r in raw])
+
+    def groups(self) -> dict[str, list[int]]:
+        """The indexes of the reports that share each data selection"""
+        groups: dict[str, list[int]] = defaultdict(list)
+        for i, options in enumerate(self.options):
+            groups[options.selection_key].append(i)
+        return dict(groups)
+
+    def run(
+        self, analyzer: "RepoAnalyzer", workers: int | None = None
+    ) -> list[DataFrame]:
+        """Runs every report, returning their results in the order of the specs"""
+        start = time.perf_counter()
+        groups = self.groups()
+        # reports of a group share every option prepare reads
+        analyzer.prepare(
+            [self.options[indexes[0]] for indexes in groups.values()], workers=workers
+        )
+        logger.info(
+            f"Running {len(self.specs)} reports over {len(groups)} data selections"
+        )
+
+        def run_report(i: int) -> DataFrame:
+            _, method = REPORTS[self.specs[i].report]
+            return getattr(analyzer, method)(self.options[i])
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(run_report, range(len(self.specs))))
+        logger.info(
+            f"Ran {len(self.specs)} reports in {time.perf_counter() - start:.2f}s"
+        )
+        return results
@@ -33,6 +33,8 @@ class Plotter:
             out = self._plot_blame()
         elif self.plot_type == "punchcard":
             out = self._plot_punchcard()
+        elif self.plot_type == "punchcards":
+            out = self._plot_punchcards()
         else:
             raise ValueError("Unsupported plot type")
 
@@ -75,3 +77,18 @@ class Plotter:
         output = self.location / f"{filename}.png"
         chart.save(output, ppi=DEFAULT_PPI)
         return output
+
+    def _plot_punchcards(self) -> Path:
+        # one punchcard per user, see https://altair-viz.github.io/user_guide/compound_charts.html
+        title = self.plot_args.pop("title", "Punchcards")
+        filename = self.plot_args.pop("filename", f"punchcards_{time.time()}")
+        facet = self.plot_args.pop("facet")
+        columns = self.plot_args.pop("columns", 4)
+        chart = (
+            self.df.plot.circle(**self.plot_args)
+            .facet(facet=facet, columns=columns)
+            .properties(title=title)
+        )
+        output = self.location / f"{filename}.png"
+        chart.save(output, ppi=DEFAULT_PPI)
+        return output
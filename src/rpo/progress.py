@@ -0,0 +1,128 @@
+import logging
+import sys
+import time
+from datetime import timedelta
+from typing import Any
+
+from .types import ProgressMode
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 2.0
+DEFAULT_CHECK_EVERY = 32
+
+
+class ProgressReporter:
+    """Reports completed vs. total work, throughput, ETA and worker utilization for a long running job.
+
+    Calls to `update` only increment counters. The clock is consulted every `check_every`
+    updates and a report is rendered at most once per `interval` seconds, so the reporter is
+    safe to call from hot loops.
+    """
+
+    def __init__(
+        self,
+        task: str,
+        total: int | None = None,
+        unit: str = "items",
+        secondary_unit: str | None = None,
+        mode: ProgressMode = "log",
+        workers: int | None = None,
+        interval: float = DEFAULT_INTERVAL,
+        check_every: int = DEFAULT_CHECK_EVERY,
+    ):
+        self.task = task
+        self.total = total
+        self.unit = unit
+        self.secondary_unit = secondary_unit
+        self.mode = mode
+        self.workers = workers
+        self.interval = interval
+        self.check_every = max(1, check_every)
+
+        self.completed = 0
+        self.secondary = 0
+        self.busy = 0.0
+
+        self._started = time.monotonic()
+        self._last_report = self._started
+        self._next_check = self.check_every
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "none"
+
+    def update(self, n: int = 1, secondary: int = 0, busy: float = 0.0):
+        """Record `n` completed units of work, `secondary` completed secondary units (e.g. files
+        for an ingest measured in commits) and `busy` seconds of worker time spent on them.
+        """
+        self.completed += n
+        self.secondary += secondary
+        self.busy += busy
+        if not self.enabled or self.completed < self._next_check:
+            return
+        self._next_check = self.completed + self.check_every
+        now = time.monotonic()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            self._emit(now)
+
+    def close(self):
+        if self.enabled:
+            self._emit(time.monotonic(), final=True)
+
+    def stats(self, now: float | None = None) -> dict[str, Any]:
+        now = time.monotonic() if now is None else now
+        elapsed = max(now - self._started, 1e-9)
+        rate = self.completed / elapsed
+        eta = None
+        if self.total is not None and rate > 0:
+            eta = max(self.total - self.completed, 0) / rate
+        utilization = None
+        if self.workers:
+            utilization = min(self.busy / (elapsed * self.workers), 1.0)
+        return {
+            "task": self.task,
+            "completed": self.completed,
+            "total": self.total,
+            "unit": self.unit,
+            "rate": rate,
+            "secondary": self.secondary,
+            "secondary_unit": self.secondary_unit,
+            "secondary_rate": self.secondary / elapsed,
+            "elapsed": elapsed,
+            "eta": eta,
+            "utilization": utilization,
+        }
+
+    def format(self, stats: dict[str, Any]) -> str:
+        total = f"/{stats['total']}" if stats["total"] is not None else ""
+        parts = [
+            f"{stats['task']}: {stats['completed']}{total} {stats['unit']}",
+            f"{stats['rate']:.1f} {stats['unit']}/s",
+        ]
+        if stats["secondary_unit"]:
+            parts.append(
+                f"{stats['secondary_rate']:.1f} {stats['secondary_unit']}/s",
+            )
+        if stats["utilization"] is not None:
+            parts.append(f"{stats['utilization']:.0%} of {self.workers} workers busy")
+        parts.append(f"elapsed {timedelta(seconds=round(stats['elapsed']))}")
+        if stats["eta"] is not None:
+            parts.append(f"ETA {timedelta(seconds=round(stats['eta']))}")
+        return ", ".join(parts)
+
+    def _emit(self, now: float, final: bool = False):
+        stats = self.stats(now)
+        msg = self.format(stats)
+        if self.mode == "stderr":
+            _ = sys.stderr.write(f"\r{msg}\033[K" + ("\n" if final else ""))
+            _ = sys.stderr.flush()
+        else:
+            logger.info(msg, extra={"progress": stats})
@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import os
+import threading
+from collections import deque
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from pathlib import Path
+from typing import Any, NamedTuple
+
+from git.exc import GitCommandError
+
+from .objects import Signature, parse_signature
+
+logger = logging.getLogger(__name__)
+
+# the longest stdout line a parser can be handed
+LINE_LIMIT = 2**24
+
+type LineParser[T] = Callable[[AsyncIterator[bytes]], Awaitable[T]]
+
+
+async def read_all(lines: AsyncIterator[bytes]) -> bytes:
+    """The whole stdout of a command"""
+    return b"".join([line async for line in lines])
+
+
+class BlameCommit(NamedTuple):
+    sha: str
+    author: Signature
+    committer: Signature
+
+
+class BlameHunk(NamedTuple):
+    commit: BlameCommit
+    lines: int
+
+
+async def parse_blame_incremental(lines: AsyncIterator[bytes]) -> list[BlameHunk]:
+    """Parses `git blame --incremental -p` output as it streams, into one hunk per group of
+    lines attributed to a commit. Commit headers are only given the first time a commit
+    appears, so they are remembered by sha.
+    """
+    commits: dict[str, BlameCommit] = {}
+    hunks: list[BlameHunk] = []
+    sha, count = "", 0
+    headers: dict[str, str] = {}
+    async for raw in lines:
+        line = raw.decode("utf-8", errors="replace").rstrip("\n")
+        key, _, value = line.partition(" ")
+        if not sha:
+            sha, count = key, int(value.split()[2])
+            headers = {}
+        elif key == "filename":
+            # the last line of every hunk
+            if sha not in commits:
+                commits[sha] = BlameCommit(
+                    sha,
+                    *(
+                        parse_signature(
+                            f"{headers[role]} {headers[f'{role}-mail']} "
+                            f"{headers[f'{role}-time']} {headers[f'{role}-tz']}"
+                        )
+                        for role in ("author", "committer")
+                    ),
+                )
+            hunks.append(BlameHunk(commits[sha], count))
+            sha = ""
+        else:
+            headers[key] = value
+    return hunks
+
+
+class GitScheduler:
+    """Runs git commands as asyncio subprocesses, at most `max_processes` at a time.
+
+    The event loop runs in a background thread, so any number of threads, e.g., the
+    reports of a plan, can submit commands and share the one limit. Each command's stdout
+    is streamed to a parser on the loop as it is produced.
+
+    Like `ObjectReader`, the loop belongs to the process that started it, so a scheduler
+    copied into another process starts its own.
+    """
+
+    def __init__(self, git_dir: Path | str, max_processes: int | None = None):
+        self.git_dir = Path(git_dir)
+        self.max_processes = max_processes or os.cpu_count() or 4
+        self._lock = threading.Lock()
+        self._pid: int | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._slots: asyncio.Semaphore | None = None
+
+    def __getstate__(self):
+        return {"git_dir": self.git_dir, "max_processes": self.max_processes}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _event_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._loop = asyncio.new_event_loop()
+                self._slots = asyncio.Semaphore(self.max_processes)
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name="git-scheduler", daemon=True
+                )
+                self._thread.start()
+            return self._loop
+
+    def close(self):
+        with self._lock:
+            if self._loop is not None and self._pid == os.getpid():
+                _ = self._loop.call_soon_threadsafe(self._loop.stop)
+                if self._thread is not None:
+                    self._thread.join()
+                self._loop.close()
+            self._loop = self._thread = self._slots = None
+            self._pid = None
+
+    async def _run[T](self, args: list[str], parse: LineParser[T]) -> T:
+        assert self._slots is not None
+        async with self._slots:
+            process = await asyncio.create_subprocess_exec(
+                "git",
+                f"--git-dir={self.git_dir}",
+                *args,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                limit=LINE_LIMIT,
+            )
+            assert process.stdout is not None and process.stderr is not None
+            # read stderr alongside, so a chatty command can't block on a full pipe
+            stderr = asyncio.ensure_future(process.stderr.read())
+            stdout = process.stdout
+
+            async def lines() -> AsyncIterator[bytes]:
+                while line := await stdout.readline():
+                    yield line
+
+            try:
+                result = await parse(lines())
+                # whatever the parser left is drained, so the process can exit
+                while await stdout.read(2**16):
+                    pass
+            except BaseException:
+                if process.returncode is None:
+                    process.kill()
+                _ = await process.wait()
+                raise
+            status = await process.wait()
+            if status != 0:
+                raise GitCommandError(["git", *args], status, await stderr)
+            _ = await stderr
+            return result
+
+    def submit[T](
+        self, args: list[str], parse: LineParser[T] = read_all
+    ) -> "Future[T]":
+        """Runs `git <args>` once a slot is free, parsing its stdout with `parse`"""
+        loop = self._event_loop()
+        return asyncio.run_coroutine_threadsafe(self._run(args, parse), loop)
+
+    def run[T](self, args: list[str], parse: LineParser[T] = read_all) -> T:
+        return self.submit(args, parse).result()
+
+    def map[I, T](
+        self,
+        items: Iterable[I],
+        command: Callable[[I], list[str]],
+        parse: LineParser[Any] = read_all,
+        window: int | None = None,
+    ) -> Iterator[tuple[I, T]]:
+        """Runs the command of each item, yielding items with their results in order.
+
+        At most `window` commands, by default twice the process limit, are running or
+        waiting to be consumed. Items are only drawn as results are consumed, so a slow
+        consumer holds back a large, lazily produced input.
+        """
+        window = window or 2 * self.max_processes
+        pending: deque[tuple[I, Future[T]]] = deque()
+        try:
+            for item in items:
+                pending.append((item, self.submit(command(item), parse)))
+                if len(pending) >= window:
+                    item, future = pending.popleft()
+                    yield item, future.result()
+            while pending:
+                item, future = pending.popleft()
+                yield item, future.result()
+        finally:
+            for _, future in pending:
+                _ = future.cancel()
+
+    def map_unordered[I, T](
+        self,
+        items: Iterable[I],
+        command: Callable[[I], list[str]],
+        parse: LineParser[Any] = read_all,
+        window: int | None = None,
+    ) -> Iterator[tuple[I, T]]:
+        """Like `map`, but yields each item as soon as its command finishes, so a slow
+        command doesn't hold back the commands after it. Commands still start in the order
+        of `items`, so giving the costliest first leaves the cheap ones to fill the gaps.
+        """
+        window = window or 2 * self.max_processes
+        pending: dict[Future[T], I] = {}
+
+        def finished() -> Iterator[tuple[I, T]]:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+
+        try:
+            for item in items:
+                pending[self.submit(command(item), parse)] = item
+                if len(pending) >= window:
+                    yield from finished()
+            while pending:
+                yield from finished()
+        finally:
+            for future in pending:
+                _ = future.cancel()
@@ -0,0 +1,140 @@
+import math
+from collections.abc import Iterable
+
+import polars as pl
+from polars import DataFrame
+
+
+# HyperLogLog registers are indexed by the top PRECISION bits of a value's hash
+PRECISION = 12
+REGISTERS = 2**PRECISION
+# the standard error of a distinct count estimated from REGISTERS registers
+RELATIVE_ERROR = 1.04 / math.sqrt(REGISTERS)
+# error bounds are reported at 95% confidence
+Z_95 = 1.96
+
+# the columns of file_changes whose distinct values are sketched
+SKETCH_COLUMNS = (
+    "sha",
+    "filename",
+    "author_name",
+    "author_email",
+    "committer_name",
+    "committer_email",
+)
+
+# The HyperLogLog registers of the changes in {source}, for each month and for all of
+# them, as (period, source, kind, idx, rank) rows. Registers that are still 0 aren't
+# stored. Values are hashed with md5, which is stable across versions of everything, so
+# registers of different stores and releases can be merged.
+SKETCH_REGISTERS = f"""WITH hashed AS (
+    SELECT strftime(committed_datetime, '%Y-%m') AS period,
+      NOT coalesce(is_generated, false) AS source,
+      kind,
+      md5_number_upper(value) AS h
+    FROM (
+      SELECT committed_datetime, is_generated, {", ".join(SKETCH_COLUMNS)} FROM {{source}}
+    ) UNPIVOT (value FOR kind IN ({", ".join(SKETCH_COLUMNS)}))
+  ), registers AS (
+    SELECT period, source, kind,
+      (h >> {64 - PRECISION})::USMALLINT AS idx,
+      -- the position of the first 1 bit after the index bits
+      coalesce(
+        nullif(position('1' IN substr(h::BIT::VARCHAR, {PRECISION + 1})), 0),
+        {64 - PRECISION + 1}
+      )::UTINYINT AS rank
+    FROM hashed
+  )
+  SELECT period, source, kind, idx, max(rank) AS rank FROM (
+    SELECT * FROM registers
+    UNION ALL
+    SELECT 'all' AS period, source, kind, idx, rank FROM registers
+  )
+  GROUP BY ALL"""
+
+# the first and last authored change in each month and overall
+SKETCH_PERIODS = """WITH periods AS (
+    SELECT strftime(committed_datetime, '%Y-%m') AS period,
+      NOT coalesce(is_generated, false) AS source,
+      authored_datetime
+    FROM {source}
+  )
+  SELECT period, source,
+    min(authored_datetime) AS first_authored,
+    max(authored_datetime) AS last_authored
+  FROM (
+    SELECT * FROM periods
+    UNION ALL
+    SELECT 'all' AS period, source, authored_datetime FROM periods
+  )
+  GROUP BY ALL"""
+
+
+def merge(registers: Iterable[DataFrame]) -> DataFrame:
+    """The union of sketches, e.g., of several repositories or periods. Each frame has
+    `kind`, `idx` and `rank` columns, and the union keeps the largest rank of each register.
+    """
+    return (
+        pl.concat([r.select("kind", "idx", "rank") for r in registers])
+        .group_by("kind", "idx")
+        .agg(pl.max("rank"))
+    )
+
+
+def estimate(registers: DataFrame) -> DataFrame:
+    """The distinct count of each kind of value in a sketch, with its 95% error bound"""
+    m = REGISTERS
+    alpha = 0.7213 / (1 + 1.079 / m)
+    return (
+        merge([registers])
+        .group_by("kind")
+        .agg(
+            zeros=m - pl.len(),
+            harmonic=(2.0 ** -pl.col("rank").cast(pl.Float64)).sum(),
+        )
+        .with_columns(
+            raw=alpha * m**2 / (pl.col("harmonic") + pl.col("zeros")),
+        )
+        .with_columns(
+            # linear counting is more accurate while many registers are empty
+            estimate=pl.when((pl.col("raw") <= 2.5 * m) & (pl.col("zeros") > 0))
+            .then(m * (m / pl.col("zeros").cast(pl.Float64)).log())
+            .otherwise(pl.col("raw"))
+            .round()
+        )
+        .select(
+            "kind",
+            "estimate",
+            error=(pl.col("estimate") * RELATIVE_ERROR * Z_95).round(),
+        )
+        .sort("kind")
+    )
+
+
+def scale_sample(
+    df: DataFrame, by: str, columns: Iterable[str], fraction: float
+) -> DataFrame:
+    """Totals of `columns` per `by`, estimated from the changes of a sample of commits,
+    each sampled independently with probability `fraction`. Each total has an `_error`
+    column with its 95% error bound.
+    """
+    columns = list(columns)
+    # a sampled commit stands for 1 / fraction commits, with its variance
+    per_commit = df.group_by(by, "sha").agg(pl.sum(*columns))
+    variance = (1 - fraction) / fraction**2
+    return (
+        per_commit.group_by(by)
+        .agg(
+            *[(pl.col(c).cast(pl.Float64).sum() / fraction).alias(c) for c in columns],
+            *[
+                (pl.col(c).cast(pl.Float64).pow(2).sum() * variance)
+                .sqrt()
+                .mul(Z_95)
+                .alias(f"{c}_error")
+                for c in columns
+            ],
+        )
+        .with_columns(pl.col(*columns, *[f"{c}_error" for c in columns]).round())
+        .select(by, *[x for c in columns for x in (c, f"{c}_error")])
+        .sort(by)
+    )
@@ -0,0 +1,53 @@
+import hashlib
+import logging
+import os
+from pathlib import Path
+
+import polars as pl
+from polars import DataFrame
+
+logger = logging.getLogger(__name__)
+
+SUFFIX = ".arrow"
+
+
+class Snapshot:
+    """A frame kept as an uncompressed Arrow IPC file, valid for one watermark.
+
+    Loading memory-maps the file, so a frame is available without deserializing it, and
+    concurrent processes that load the same snapshot share its pages. Saving a snapshot
+    for a new watermark drops the snapshots of every other watermark.
+    """
+
+    def __init__(self, path: Path):
+        # e.g., `<data directory>/<name>.revs`, with the watermark and suffix appended
+        self.path = path
+
+    def _file(self, watermark: str) -> Path:
+        digest = hashlib.sha256(watermark.encode()).hexdigest()[:16]
+        return self.path.with_name(f"{self.path.name}-{digest}{SUFFIX}")
+
+    def load(self, watermark: str) -> DataFrame | None:
+        path = self._file(watermark)
+        try:
+            df = pl.read_ipc(path, memory_map=True)
+        except (FileNotFoundError, pl.exceptions.ComputeError, OSError):
+            return None
+        logger.debug(f"Memory-mapped snapshot {path.name}")
+        return df
+
+    def save(self, watermark: str, df: DataFrame):
+        path = self._file(watermark)
+        # write and rename, so concurrent readers never map a partial file
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        df.write_ipc(tmp, compression="uncompressed")
+        _ = tmp.replace(path)
+        # processes that mapped an older snapshot keep reading it until they're done
+        for other in self.path.parent.glob(f"{self.path.name}-*{SUFFIX}"):
+            if other != path:
+                other.unlink(missing_ok=True)
+        logger.debug(f"Wrote snapshot {path.name}")
+
+    def clear(self):
+        for path in self.path.parent.glob(f"{self.path.name}-*{SUFFIX}"):
+            path.unlink(missing_ok=True)
@@ -0,0 +1,66 @@
+import logging
+import tempfile
+from pathlib import Path
+
+import polars as pl
+from polars import DataFrame
+
+logger = logging.getLogger(__name__)
+
+
+class FrameSpool:
+    """Collects frames with the same schema, like repeated `vstack`s.
+
+    With a `max_bytes` budget, buffered frames are written to parquet files in a
+    temporary directory whenever they grow past it, and `collect` reads them back with the
+    streaming engine, so building a result never holds more than one buffer of its parts.
+    """
+
+    def __init__(self, max_bytes: int | None = None, directory: Path | None = None):
+        self.max_bytes = max_bytes
+        self._buffer: list[DataFrame] = []
+        self._buffered = 0
+        self._parts: list[Path] = []
+        self._tmp: tempfile.TemporaryDirectory[str] | None = None
+        self._directory = directory
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def append(self, df: DataFrame):
+        self._buffer.append(df)
+        self._buffered += df.estimated_size()
+        if self.max_bytes is not None and self._buffered > self.max_bytes:
+            self._spill()
+
+    def _spill(self):
+        if not self._buffer:
+            return
+        if self._tmp is None:
+            self._tmp = tempfile.TemporaryDirectory(
+                prefix="rpo-spool-", dir=self._directory
+            )
+        path = Path(self._tmp.name) / f"{len(self._parts)}.parquet"
+        pl.concat(self._buffer, how="vertical_relaxed").write_parquet(path)
+        logger.debug(f"Spilled {self._buffered} bytes to {path}")
+        self._parts.append(path)
+        self._buffer, self._buffered = [], 0
+
+    def collect(self) -> DataFrame:
+        if not self._parts:
+            return (
+                pl.concat(self._buffer, how="vertical_relaxed")
+                if self._buffer
+                else DataFrame()
+            )
+        self._spill()
+        return pl.scan_parquet(self._parts).collect(engine="streaming")
+
+    def close(self):
+        self._buffer, self._buffered, self._parts = [], 0, []
+        if self._tmp is not None:
+            self._tmp.cleanup()
+            self._tmp = None
@@ -1,3 +1,5 @@
 from typing import Literal
 
-type SupportedPlotType = Literal["cumulative_blame", "blame", "punchcard"]
+type SupportedPlotType = Literal["cumulative_blame", "blame", "punchcard", "punchcards"]
+
+type ProgressMode = Literal["none", "log", "stderr"]
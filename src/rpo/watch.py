@@ -0,0 +1,107 @@
+import logging
+import os
+import threading
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from git.exc import GitCommandError
+from polars import DataFrame
+
+from .objects import ObjectNotFound
+from .plan import ReportPlan
+
+if TYPE_CHECKING:
+    from .analyzer import RepoAnalyzer
+
+logger = logging.getLogger(__name__)
+
+# the files that change whenever a ref moves, relative to the common git directory
+REF_FILES = ("HEAD", "packed-refs")
+REF_DIRECTORY = "refs"
+
+type Fingerprint = tuple[tuple[str, int, int], ...]
+
+
+class RefWatcher:
+    """Detects ref updates by polling the files git keeps refs in.
+
+    Git updates a loose ref by renaming a lock file over it, which changes the directory
+    it's in, and rewrites `packed-refs` whole, so comparing the stat of `HEAD`,
+    `packed-refs` and the directories under `refs` detects every update without reading
+    any of them.
+
+    `git_dir` is the common git directory. A linked worktree keeps its own `HEAD` in its
+    `worktree_git_dir`, which is watched too.
+    """
+
+    def __init__(self, git_dir: Path | str, worktree_git_dir: Path | str | None = None):
+        self.git_dir = Path(git_dir)
+        self.worktree_git_dir = (
+            Path(worktree_git_dir) if worktree_git_dir is not None else None
+        )
+        self._last: Fingerprint | None = None
+
+    def fingerprint(self) -> Fingerprint:
+        paths = [str(self.git_dir / name) for name in REF_FILES]
+        if self.worktree_git_dir not in (None, self.git_dir):
+            paths.append(str(self.worktree_git_dir / "HEAD"))
+        for root, _, _ in os.walk(self.git_dir / REF_DIRECTORY):
+            paths.append(root)
+        stats = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            stats.append((path, st.st_mtime_ns, st.st_size))
+        return tuple(stats)
+
+    def changed(self) -> bool:
+        """Whether any ref may have moved since the last call. True on the first call"""
+        fingerprint = self.fingerprint()
+        changed = fingerprint != self._last
+        self._last = fingerprint
+        return changed
+
+
+def watch(
+    analyzer: "RepoAnalyzer",
+    plan: ReportPlan | None = None,
+    interval: float = 5.0,
+    workers: int | None = None,
+    stop: threading.Event | None = None,
+    on_update: Callable[[str, list[DataFrame]], None] | None = None,
+) -> None:
+    """Keeps the store of `analyzer` up to date with its ref until `stop` is set.
+
+    Whenever the refs change and the analyzed ref has a new head, only its new commits
+    are ingested, which also updates the rollups and invalidates the cached results.
+    The reports of `plan` then run again. Between polls the thread just waits.
+    """
+    stop = stop or threading.Event()
+    watcher = RefWatcher(Path(analyzer.repo.common_dir), Path(analyzer.repo.git_dir))
+    last: str | None = None
+    while not stop.is_set():
+        if watcher.changed():
+            try:
+                head = analyzer.refresh()
+            except (ObjectNotFound, GitCommandError) as e:
+                # e.g., the branch was deleted, it's ingested again once it's back
+                logger.warning(f"Can't resolve the analyzed ref: {e}")
+                _ = stop.wait(interval)
+                continue
+            if head != last:
+                start = time.perf_counter()
+                analyzer.ingest()
+                results = (
+                    plan.run(analyzer, workers=workers) if plan is not None else []
+                )
+                logger.info(
+                    f"Updated {analyzer.ref} to {head} in {time.perf_counter() - start:.2f}s"
+                )
+                if on_update is not None:
+                    on_update(head, results)
+                last = head
+        _ = stop.wait(interval)
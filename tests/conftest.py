@@ -98,6 +98,6 @@ def tmp_repo(repos_directory: Path, actors: list[Actor]) -> Repo:
 
 
 @pytest.fixture
-def tmp_repo_analyzer(tmp_repo: Repo) -> RepoAnalyzer:
-    ra = RepoAnalyzer(repo=tmp_repo, in_memory=True)
-    return ra
+def tmp_repo_analyzer(tmp_repo: Repo) -> Generator[RepoAnalyzer]:
+    with RepoAnalyzer(repo=tmp_repo, in_memory=True) as ra:
+        yield ra
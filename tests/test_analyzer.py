@@ -1,16 +1,23 @@
+from datetime import UTC, datetime, timedelta
 from typing import LiteralString
 
+import polars as pl
 import pytest
 from git import Actor
 from git.repo import Repo
 
 from rpo.analyzer import RepoAnalyzer
+from rpo.cache import ResultCache
 from rpo.models import (
     ActivityReportCmdOptions,
     BlameCmdOptions,
     BusFactorCmdOptions,
+    CompareCmdOptions,
+    CouplingCmdOptions,
     GitOptions,
+    HotspotsCmdOptions,
     PunchcardCmdOptions,
+    PunchcardsCmdOptions,
     RevisionsCmdOptions,
     SummaryCmdOptions,
 )
@@ -178,7 +185,401 @@ def test_punchcard(
     assert sum(df_dict[identifier]) == count, "aggregation is incorrect"
 
 
+@pytest.mark.parametrize(
+    "identifiers, min_commits, expected",
+    [
+        ([], 0, {"User0 Lastname", "User1 Lastname", "User2 Lastname"}),
+        (["User0 Lastname"], 0, {"User0 Lastname"}),
+        (["User0 Lastname"], 3, {"User0 Lastname", "User2 Lastname"}),
+    ],
+    ids=["everyone", "listed", "listed-and-minimum"],
+)
+def test_punchcards(tmp_repo_analyzer, identifiers, min_commits, expected):
+    options = PunchcardsCmdOptions(
+        identifiers=identifiers, min_commits=min_commits, aggregate_by="committer"
+    )
+    df = tmp_repo_analyzer.punchcards(options)
+    assert set(df["committer_name"]) == expected
+    # each histogram matches the single user punchcard
+    for identifier in expected:
+        single = tmp_repo_analyzer.punchcard(
+            PunchcardCmdOptions(identifier=identifier, aggregate_by="committer")
+        )
+        user = df.filter(pl.col("committer_name") == identifier)
+        assert user["lines"].sum() == single[identifier].sum()
+
+
 def test_revisions(tmp_repo_analyzer):
     res = tmp_repo_analyzer.revisions(RevisionsCmdOptions())
 
     assert res.height == 6, "Number of revisions incorrect"
+
+
+def test_resolve_identities(tmp_repo_analyzer):
+    options = SummaryCmdOptions(identify_by="email", resolve_identities=True)
+    summary = tmp_repo_analyzer.summary(options).to_dict(as_series=False)
+    # the actor who changed their email is merged by their name
+    assert summary["contributors"] == [3]
+    identities = tmp_repo_analyzer.identities
+    assert identities["identity_id"].n_unique() == 3
+
+
+def test_persisted_store_is_reused(tmp_repo):
+    first = RepoAnalyzer(repo=tmp_repo).revs
+    second = RepoAnalyzer(repo=tmp_repo).revs
+    assert first.height == second.height
+    assert first["sha"].n_unique() == 6
+
+
+def test_commit_count_is_cached(tmp_repo):
+    ra = RepoAnalyzer(repo=tmp_repo, in_memory=True)
+    assert ra.commit_count == 6
+    head = tmp_repo.head.commit.hexsha
+    assert ra._db.get_metadata(f"commit_count:{head}") == "6"
+
+    # a fresh count comes from the store, not from git
+    ra._db.set_metadata(f"commit_count:{head}", "42")
+    ra._commit_count = None
+    assert ra.commit_count == 42
+
+
+@pytest.mark.parametrize("check_dirty", ["skip", "index", "working_tree"])
+def test_dirty_check_is_lazy(tmp_repo, monkeypatch, check_dirty):
+    calls = []
+    monkeypatch.setattr(
+        Repo, "is_dirty", lambda _, **kwargs: calls.append(kwargs) or False
+    )
+    ra = RepoAnalyzer(
+        repo=tmp_repo, options=GitOptions(check_dirty=check_dirty), in_memory=True
+    )
+    assert not calls, "dirty check should not run on construction"
+    assert not ra.is_dirty
+    if check_dirty == "skip":
+        assert not calls
+    else:
+        assert calls == [
+            {
+                "index": True,
+                "working_tree": check_dirty == "working_tree",
+                "untracked_files": False,
+            }
+        ]
+
+
+def test_pathspecs_pushed_down_and_widened(tmp_repo):
+    ra = RepoAnalyzer(
+        repo=tmp_repo,
+        options=GitOptions(pathspecs=["small_repo/3_line.txt"]),
+        in_memory=True,
+    )
+    scoped = ra.revs
+    assert set(scoped["filename"]) == {"small_repo/3_line.txt"}
+    assert scoped["sha"].n_unique() == 3
+
+    # a wider query only ingests what is missing, without duplicating rows
+    ra.options.pathspecs = []
+    ra._revs = None
+    full = ra.revs
+    assert full["sha"].n_unique() == 6
+    assert full.filter(pl.col("filename") == "small_repo/3_line.txt").height == 3
+
+
+def test_window_pushed_down_and_widened(tmp_repo):
+    since = datetime.now(UTC) - timedelta(days=4, hours=12)
+    ra = RepoAnalyzer(repo=tmp_repo, options=GitOptions(since=since), in_memory=True)
+    assert ra.revs["sha"].n_unique() == 4
+    assert ra._db.change_count() == 4, "commits outside the window were read"
+
+    ra.options.since = None
+    ra._revs = None
+    assert ra.revs["sha"].n_unique() == 6
+    assert ra._db.ingest_windows("") == [(None, None)]
+
+
+def test_reports_answer_from_rollups(tmp_path, actors: list[Actor]):
+    r = Repo.init(tmp_path)
+
+    def commit(files: dict[str, str], actor: Actor):
+        for name, text in files.items():
+            path = tmp_path / name
+            path.parent.mkdir(exist_ok=True)
+            _ = path.write_text(text)
+        _ = r.index.add(list(files))
+        _ = r.index.commit("commit", author=actor, committer=actor)
+
+    commit({"src/a.py": "1\n2\n", "Cargo.lock": "x\n"}, actors[0])
+    commit({"Cargo.lock": "x\ny\n"}, actors[1])
+    commit({"src/b.py": "1\n"}, actors[1])
+
+    ra = RepoAnalyzer(repo=r, options=GitOptions(pathspecs=["src"]), in_memory=True)
+    _ = ra.revs
+    # the wider ingest adds the lock file to a commit that is already in the rollups
+    ra.options.pathspecs = []
+    ra._revs = None
+
+    for generated in (False, True):
+        options = ActivityReportCmdOptions(generated=generated)
+        # any row filter answers from the file changes instead
+        full_scan = ActivityReportCmdOptions(generated=generated, exclude_users=["x"])
+        assert ra._use_rollups(options) and not ra._use_rollups(full_scan)
+        assert (
+            ra.contributor_report(options)
+            .sort("author_name")
+            .equals(ra.contributor_report(full_scan).sort("author_name"))
+        )
+        assert (
+            ra.file_report(options)
+            .sort("filename")
+            .equals(ra.file_report(full_scan).sort("filename"))
+        )
+        summary = ra.summary(SummaryCmdOptions(generated=generated))
+        expected = ra.summary(
+            SummaryCmdOptions(generated=generated, exclude_users=["x"])
+        )
+        assert summary.rows() == expected.rows()
+        # small counts are estimated exactly, even after an incremental ingest
+        approximate = ra.summary(
+            SummaryCmdOptions(generated=generated, approximate=True)
+        )
+        assert approximate.select(summary.columns).rows() == summary.rows()
+
+    punchcard = ra.punchcard(PunchcardCmdOptions(identifier="User1 Lastname"))
+    assert punchcard["User1 Lastname"].sum() == 1
+
+
+def test_results_are_cached(tmp_repo):
+    options = ActivityReportCmdOptions(identify_by="email")
+    expected = RepoAnalyzer(repo=tmp_repo).contributor_report(options)
+
+    ra = RepoAnalyzer(repo=tmp_repo)
+    assert ra.contributor_report(options).equals(expected)
+    assert ra._ingested is None, "a cached result read the history"
+    # output options don't change the result
+    options.stdout = False
+    _ = ra.contributor_report(options)
+    assert ra._ingested is None
+
+    uncached = RepoAnalyzer(repo=tmp_repo, options=GitOptions(cache_size_mb=0))
+    assert uncached.contributor_report(options).equals(expected)
+    assert uncached._ingested is not None
+
+
+def test_cumulative_blame_caches_only_its_result(tmp_repo, tmp_path):
+    ra = RepoAnalyzer(repo=tmp_repo, in_memory=True)
+    ra._results = ResultCache(tmp_path, max_bytes=2**30)
+    _ = ra.cumulative_blame(BlameCmdOptions())
+    assert len(list(tmp_path.glob("*.parquet"))) == 1
+
+
+def test_memory_limited_ingest(tmp_repo, monkeypatch):
+    expected = RepoAnalyzer(repo=tmp_repo, in_memory=True).revs
+    # store every commit on its own
+    monkeypatch.setattr("rpo.analyzer.RECORDS_PER_MB", 0)
+    ra = RepoAnalyzer(
+        repo=tmp_repo, options=GitOptions(memory_limit_mb=64), in_memory=True
+    )
+    assert ra.ingest_batch_size == 1
+    assert ra.revs.sort("sha", "filename").equals(expected.sort("sha", "filename"))
+    limit = ra._db._execute("SELECT current_setting('memory_limit') AS limit")
+    assert limit["limit"][0] == "61.0 MiB"
+
+
+def test_hotspots(tmp_path, actors: list[Actor]):
+    r = Repo.init(tmp_path)
+    now = datetime.now(UTC)
+
+    def commit(name: str, lines: int, days_ago: int, actor: Actor):
+        path = tmp_path / name
+        path.parent.mkdir(exist_ok=True)
+        _ = path.write_text("".join(f"{days_ago} {i}\n" for i in range(lines)))
+        _ = r.index.add([name])
+        date = f"{int((now - timedelta(days=days_ago)).timestamp())} +0000"
+        _ = r.index.commit(
+            "commit", author=actor, committer=actor, author_date=date, commit_date=date
+        )
+
+    # stable churned a lot long ago, hot was quiet until recently
+    commit("src/stable.py", 50, 700, actors[0])
+    commit("src/hot.py", 2, 700, actors[0])
+    commit("src/stable.py", 50, 600, actors[1])
+    commit("docs/readme.md", 1, 200, actors[0])
+    commit("src/hot.py", 10, 20, actors[1])
+    commit("src/hot.py", 20, 10, actors[2])
+    commit("src/stable.py", 50, 5, actors[0])
+
+    ra = RepoAnalyzer(repo=r, in_memory=True)
+    df = ra.hotspots(HotspotsCmdOptions(windows=[365, 30]))
+    assert df["filename"].to_list() == ["src/hot.py", "src/stable.py", "docs/readme.md"]
+    hot = df.row(0, named=True)
+    assert (hot["commits"], hot["commits_30d"], hot["commits_365d"]) == (3, 2, 2)
+    assert (hot["authors"], hot["authors_30d"]) == (3, 2)
+    # every commit rewrites the file
+    assert hot["churn_30d"] == (2 + 10) + (10 + 20)
+    assert df["acceleration"][0] > df["acceleration"][1] > 0
+    assert df.filter(pl.col("filename") == "docs/readme.md")["acceleration"][0] == 0
+
+    by_dir = ra.hotspots(HotspotsCmdOptions(hotspot_by="directory", limit=1))
+    assert by_dir["directory"].to_list() == ["src"]
+
+
+def test_coupling(tmp_path, actors: list[Actor]):
+    r = Repo.init(tmp_path)
+
+    def commit(*names: str):
+        for name in names:
+            path = tmp_path / name
+            path.parent.mkdir(exist_ok=True)
+            with open(path, "a") as f:
+                _ = f.write("line\n")
+        _ = r.index.add(list(names))
+        _ = r.index.commit("commit", author=actors[0], committer=actors[0])
+
+    commit("src/a.py", "src/b.py")
+    commit("src/a.py", "src/b.py", "docs/a.md")
+    commit("src/a.py")
+    commit("docs/a.md", "src/b.py")
+    # too large to say anything about coupling
+    commit(*(f"gen/{i}.py" for i in range(60)), "src/a.py", "src/b.py")
+
+    ra = RepoAnalyzer(repo=r, options=GitOptions(pathspecs=["src"]), in_memory=True)
+    _ = ra.revs
+    # the wider ingest completes commits that are already in the pair index
+    ra.options.pathspecs = []
+    ra._revs = None
+
+    options = CouplingCmdOptions(min_commits=1)
+    from_index = ra.coupling(options)
+    assert ra._use_rollups(options)
+    full_scan = ra.coupling(CouplingCmdOptions(min_commits=1, exclude_users=["x"]))
+    assert from_index.equals(full_scan)
+
+    # every commit of docs/a.md also changes src/b.py
+    top = from_index.row(0, named=True)
+    assert (top["file_a"], top["file_b"], top["commits"]) == (
+        "docs/a.md",
+        "src/b.py",
+        2,
+    )
+    assert (top["confidence_ab"], top["confidence_ba"]) == (1, 2 / 3)
+    assert not from_index["file_a"].str.starts_with("gen/").any()
+    assert from_index.height == 3
+
+    assert ra.coupling(CouplingCmdOptions()).height == 2
+    assert ra.coupling(CouplingCmdOptions(min_confidence=0.7)).height == 1
+    # a higher cutoff includes the large commit
+    coupled = ra.coupling(CouplingCmdOptions(max_files=100))
+    assert coupled.row(0)[:3] == ("src/a.py", "src/b.py", 3)
+
+
+def test_blame_skips_binary_and_oversized_files(tmp_path, actors: list[Actor]):
+    r = Repo.init(tmp_path)
+    _ = (tmp_path / "small.py").write_text("a\nb\n")
+    _ = (tmp_path / "long.txt").write_text("x\n" * 100)
+    _ = (tmp_path / "bundle.js").write_text("y" * 3000)
+    _ = (tmp_path / "image.png").write_bytes(b"\x89PNG\0\0\0" * 10)
+    _ = r.index.add(["small.py", "long.txt", "bundle.js", "image.png"])
+    _ = r.index.commit("files", author=actors[0], committer=actors[0])
+
+    ra = RepoAnalyzer(repo=r, in_memory=True)
+    options = BlameCmdOptions(max_file_size_kb=2, max_lines=10)
+    skips = ra.blame_skips(options)
+    assert dict(skips.select("filename", "reason").iter_rows()) == {
+        "bundle.js": "size",
+        "image.png": "binary",
+        "long.txt": "lines",
+    }
+    assert ra.blame(options)["lines"].to_list() == [2]
+
+    # by default, only known binary files and files over a MB are skipped
+    unlimited = BlameCmdOptions()
+    assert ra.blame_skips(unlimited)["filename"].to_list() == ["image.png"]
+    assert ra.blame(unlimited)["lines"].to_list() == [2 + 100 + 1]
+    # the largest files are blamed first
+    files, _ = ra._blame_files(unlimited, ra.head)
+    assert files["filename"].to_list() == ["bundle.js", "long.txt", "small.py"]
+
+
+def test_branches_share_the_store(tmp_path, actors: list[Actor]):
+    r = Repo.init(tmp_path, initial_branch="main")
+
+    def commit(name: str, actor: Actor):
+        _ = (tmp_path / name).write_text(f"{name}\n")
+        _ = r.index.add([name])
+        _ = r.index.commit(name, author=actor, committer=actor)
+
+    commit("a.txt", actors[0])
+    commit("b.txt", actors[0])
+    release = r.create_head("release")
+    commit("main.txt", actors[1])
+    release.checkout()
+    commit("fix.txt", actors[2])
+    commit("fix2.txt", actors[2])
+    r.heads["main"].checkout()
+
+    ra = RepoAnalyzer(repo=r, in_memory=True)
+    assert ra.ref == "refs/heads/main"
+    assert set(ra.revs["filename"]) == {"a.txt", "b.txt", "main.txt"}
+
+    inserted: list[str] = []
+    insert = ra._db.insert_file_changes
+
+    def spy(revs, *args):
+        inserted.extend(r.filename for r in revs)
+        return insert(revs, *args)
+
+    ra._db.insert_file_changes = spy
+    df = ra.compare_branches(CompareCmdOptions(branches=["main", "release"]))
+    # only the commits unique to the new branch were read
+    assert sorted(inserted) == ["fix.txt", "fix2.txt"]
+    rows = {row["branch"]: row for row in df.iter_rows(named=True)}
+    assert (rows["main"]["commits"], rows["main"]["unique_commits"]) == (3, 1)
+    assert (rows["release"]["commits"], rows["release"]["unique_commits"]) == (4, 2)
+    assert (rows["main"]["authors"], rows["release"]["authors"]) == (2, 2)
+    assert rows["release"]["head"] == r.heads["release"].commit.hexsha
+
+    # reports of one branch leave out the commits of the other, even from rollups
+    options = SummaryCmdOptions()
+    assert not ra._use_rollups(options)
+    assert ra.summary(options)["commits"].to_list() == [3]
+
+    on_release = RepoAnalyzer(
+        options=GitOptions(path=tmp_path, branch="release"), in_memory=True
+    )
+    on_release._db = ra._db
+    assert set(on_release.revs["filename"]) == {"a.txt", "b.txt", "fix.txt", "fix2.txt"}
+    assert on_release.blame(BlameCmdOptions())["lines"].sum() == 4
+
+
+def test_missing_stored_heads(tmp_repo: Repo):
+    ra = RepoAnalyzer(repo=tmp_repo, in_memory=True)
+    commits = ra.summary(SummaryCmdOptions())["commits"].to_list()
+    missing = "0" * 40
+
+    def rerun() -> list[int]:
+        again = RepoAnalyzer(repo=tmp_repo, in_memory=True)
+        again._db = ra._db
+        return again.summary(SummaryCmdOptions())["commits"].to_list()
+
+    # e.g., a branch that was force pushed and garbage collected, while the analyzed
+    # branch moved on, so its new commits are read excluding the stored heads
+    ra._db.tag_commits("refs/heads/gone", missing, [ra.head])
+    ra._db.tag_commits(ra.ref, tmp_repo.head.commit.parents[0].hexsha, [])
+    assert rerun() == commits
+    assert "refs/heads/gone" not in ra._db.ref_heads()
+
+    # a store written for another repository with the same name
+    ra._db.tag_commits(ra.ref, missing, [], replace=True)
+    assert rerun() == commits
+    assert ra._db.ref_heads() == {ra.ref: ra.head}
+
+
+def test_close_stops_git(tmp_repo: Repo):
+    with RepoAnalyzer(repo=tmp_repo, in_memory=True) as ra:
+        head = ra.head
+        _ = ra.blame(BlameCmdOptions())
+        batch, _ = ra.objects._processes()
+    assert batch.process.poll() is not None
+    assert ra.scheduler._thread is None
+    # both start again when needed
+    assert ra.head == head
+    ra.close()
@@ -0,0 +1,80 @@
+import os
+
+import polars as pl
+from pydantic import BaseModel
+
+from rpo.cache import ResultCache, result_key
+
+
+class Options(BaseModel):
+    identify_by: str = "name"
+    stdout: bool = True
+
+
+def test_result_key_is_stable_and_ignores_excluded_fields():
+    key = result_key("summary", Options())
+    assert key == result_key("summary", Options())
+    assert key != result_key("summary", Options(identify_by="email"))
+    assert key != result_key("blame", Options())
+    assert result_key("summary", Options(), exclude={"stdout"}) == result_key(
+        "summary", Options(stdout=False), exclude={"stdout"}
+    )
+
+
+def test_get_and_put(tmp_path):
+    cache = ResultCache(tmp_path, max_bytes=2**20)
+    df = pl.DataFrame({"a": [1, 2, 3]})
+    assert cache.get("k", "head1") is None
+    cache.put("k", "head1", df)
+    assert cache.get("k", "head1").equals(df)
+
+    calls = []
+    result = cache.cached("k", "head1", lambda: calls.append(1) or df)
+    assert result.equals(df) and not calls
+
+
+def test_new_watermark_invalidates(tmp_path):
+    cache = ResultCache(tmp_path, max_bytes=2**20)
+    cache.put("k", "head1", pl.DataFrame({"a": [1]}))
+    cache.put("other", "head2", pl.DataFrame({"a": [2]}))
+    assert cache.get("k", "head1") is None
+    assert cache.get("other", "head2") is not None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    df = pl.DataFrame({"a": list(range(1000))})
+    cache = ResultCache(tmp_path, max_bytes=2**20)
+    cache.put("first", "head", df)
+    size = next(tmp_path.glob("*.parquet")).stat().st_size
+    cache.max_bytes = 2 * size
+
+    cache.put("second", "head", df)
+    # make `first` the most recently used
+    os.utime(next(tmp_path.glob("*second*")), (0, 0))
+    assert cache.get("first", "head") is not None
+    cache.put("third", "head", df)
+    assert cache.get("second", "head") is None
+    assert cache.get("first", "head") is not None
+    assert cache.get("third", "head") is not None
+
+
+def test_directory_is_scanned_once_per_watermark(tmp_path, monkeypatch):
+    df = pl.DataFrame({"a": list(range(1000))})
+    cache = ResultCache(tmp_path, max_bytes=2**20)
+    cache.put("first", "head", df)
+    size = next(tmp_path.glob("*.parquet")).stat().st_size
+    cache.max_bytes = 3 * size
+
+    scans = []
+    scan = cache._scan
+    monkeypatch.setattr(
+        cache, "_scan", lambda prefix: scans.append(prefix) or scan(prefix)
+    )
+    for i in range(10):
+        cache.put(f"k{i}", "head", df)
+    assert not scans
+    # the sizes are tracked as entries are stored, so the budget still holds
+    assert len(list(tmp_path.glob("*.parquet"))) == 3
+    assert cache._bytes == 3 * size
+    cache.put("k", "head2", df)
+    assert len(scans) == 1
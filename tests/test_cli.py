@@ -27,6 +27,8 @@ def test_top_level_help(runner):
         "revisions",
         "blame",
         "cumulative-blame",
+        "compare",
+        "watch",
     ],
 )
 def test_subcommand_help(runner, subcommand):
@@ -39,7 +41,7 @@ def test_subcommand_help(runner, subcommand):
 @pytest.mark.parametrize(
     "persistence", ["--persist-data", "--no-persist-data"], ids=("persist", "inmemory")
 )
-@pytest.mark.parametrize("subcommand", ["blame", "cblame", "punchcard"])
+@pytest.mark.parametrize("subcommand", ["blame", "cblame", "punchcard", "hotspots"])
 def test_plottable_subcommands(
     subcommand, persistence, identify_by, runner, tmp_repo, actors
 ):
@@ -67,3 +69,25 @@ def test_plottable_subcommands(
     assert p.exists(), "Plot path does not exist"
     if p.is_dir():
         assert len(list(p.glob("*.png"))) == 1, "Image file DNE"
+
+
+@pytest.mark.slow
+def test_batch_punchcards(runner, tmp_repo, actors):
+    args = [
+        "-p",
+        tmp_repo.working_dir,
+        "--no-persist-data",
+        "punchcard",
+        "--visualize",
+        "--img-location",
+        "./img",
+        "--min-commits",
+        "1",
+        actors[0].name,
+    ]
+    result = runner.invoke(cli, args)
+    assert result.exit_code == 0, (
+        f"CLI command failed, Output: {result.output}\nExc: {format_exception(*result.exc_info)}"
+    )
+    # every punchcard is in one faceted chart
+    assert len(list(Path("./img").glob("*punchcards*.png"))) == 1
@@ -0,0 +1,77 @@
+import polars as pl
+import pytest
+
+from rpo.analyzer import RepoAnalyzer
+from rpo.cost import (
+    BlameCostModel,
+    BlameEstimate,
+    BlameSample,
+    directory_costs,
+    suggest_every,
+    suggest_exclusions,
+)
+from rpo.models import BlameCmdOptions
+
+
+def test_fit_cost_model():
+    model = BlameCostModel.fit(
+        [BlameSample(100, 0.2, 1), BlameSample(300, 0.4, 3), BlameSample(500, 0.6, 5)]
+    )
+    assert model.overhead == pytest.approx(0.1)
+    assert model.per_byte == pytest.approx(0.001)
+    assert model.hunks_per_byte == pytest.approx(0.01)
+    # without any spread in size, the whole cost is per byte
+    assert BlameCostModel.fit([BlameSample(100, 0.5, 2)]).per_byte == 0.005
+    assert BlameCostModel.fit([]) == (0.0, 0.0, 0.0)
+
+
+def test_suggestions():
+    files = pl.DataFrame(
+        {
+            "filename": ["big/a", "big/b", "small/c", "root"],
+            "size": [1000, 1000, 100, 5000],
+        }
+    )
+    directories = directory_costs(files, BlameCostModel(1.0, 0.001, 0.0))
+    assert directories.rows() == [("big", 4.0), ("small", 1.1)]
+    # root files can't be excluded by directory
+    assert suggest_exclusions(directories, 11.1, 8) == ("big/*",)
+    assert suggest_exclusions(directories, 11.1, 6.5) == ("big/*", "small/*")
+    assert suggest_exclusions(directories, 11.1, 1) == ()
+    assert suggest_every(100, 50, 10) == 5
+    assert suggest_every(1, 50, 10) is None
+    assert BlameCostModel(1.0, 0.001, 0.0).seconds(2, 1000) == 3.0
+
+
+def test_explain():
+    estimate = BlameEstimate(10, 100, 10_000, 60.0, 30.0, 2, 2**30, 10.0, every=3)
+    explained = estimate.explain()
+    assert "peak memory:     1,024 MB" in explained
+    assert "--every 3" in explained
+    # memory that couldn't be measured is left out
+    assert "peak memory" not in estimate._replace(peak_memory_bytes=None).explain()
+    unfit = estimate._replace(every=None).explain()
+    assert "no revision interval or excluded directories fit it" in unfit
+
+
+def test_estimate_blame(tmp_repo_analyzer: RepoAnalyzer):
+    options = BlameCmdOptions()
+    single = tmp_repo_analyzer.estimate_blame(options)
+    assert single.revisions == 1
+    files, _ = tmp_repo_analyzer._blame_files(options, tmp_repo_analyzer.head)
+    assert single.invocations == files.height
+    assert single.bytes == files["size"].sum()
+
+    cumulative = tmp_repo_analyzer.estimate_blame(options, cumulative=True)
+    assert cumulative.revisions == 6
+    assert cumulative.cpu_seconds > 0
+    budgeted = tmp_repo_analyzer.estimate_blame(
+        options, cumulative=True, budget_seconds=1e-9
+    )
+    # even a single revision takes longer
+    assert budgeted.every is None
+    assert "exceeds the budget" in budgeted.explain()
+
+    every = tmp_repo_analyzer.estimate_blame(BlameCmdOptions(every=4), cumulative=True)
+    # the latest revision and the fourth before it
+    assert every.revisions == 2
@@ -0,0 +1,128 @@
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytest
+
+from rpo.db import DB, merge_windows, missing_windows
+
+d = [datetime(2025, m, 1) for m in range(1, 13)]
+
+
+@pytest.mark.parametrize(
+    "windows,expected",
+    [
+        ([], []),
+        ([(d[0], d[2]), (d[1], d[3])], [(d[0], d[3])]),
+        ([(d[0], d[1]), (d[2], d[3])], [(d[0], d[1]), (d[2], d[3])]),
+        ([(d[2], None), (None, d[0]), (d[1], d[3])], [(None, d[0]), (d[1], None)]),
+        ([(None, d[1]), (d[1], None)], [(None, None)]),
+    ],
+    ids=["empty", "overlap", "disjoint", "open-ended", "touching"],
+)
+def test_merge_windows(windows, expected):
+    assert merge_windows(windows) == expected
+
+
+@pytest.mark.parametrize(
+    "requested,covered,expected",
+    [
+        ((None, None), [], [(None, None)]),
+        ((None, None), [(None, None)], []),
+        ((d[2], d[5]), [(d[0], d[3])], [(d[3], d[5])]),
+        (
+            (d[2], d[8]),
+            [(d[3], d[4]), (d[6], d[7])],
+            [(d[2], d[3]), (d[4], d[6]), (d[7], d[8])],
+        ),
+        ((None, None), [(d[3], None)], [(None, d[3])]),
+        ((d[0], d[1]), [(d[5], d[6])], [(d[0], d[1])]),
+    ],
+    ids=["nothing-covered", "all-covered", "tail", "gaps", "open-ended", "no-overlap"],
+)
+def test_missing_windows(requested, covered, expected):
+    assert missing_windows(requested, covered) == expected
+
+
+def test_ingest_windows_by_scope():
+    db = DB("windows", initialize=True, in_memory=True)
+    db.add_ingest_window('["docs"]', d[0], d[2])
+    db.add_ingest_window('["docs"]', d[1], d[4])
+    db.add_ingest_window("", d[6], None)
+    assert db.ingest_windows('["docs"]') == [(d[0], d[4]), (d[6], None)]
+    # windows for some paths don't cover other paths
+    assert db.ingest_windows('["src"]') == [(d[6], None)]
+    assert db.ingest_windows("") == [(d[6], None)]
+
+
+def test_metadata():
+    db = DB("metadata", initialize=True, in_memory=True)
+    assert db.get_metadata("missing") is None
+    db.set_metadata("key", "value")
+    db.set_metadata("key", "updated")
+    assert db.get_metadata("key") == "updated"
+    db.delete_metadata("key")
+    assert db.get_metadata("key") is None
+
+
+def test_in_memory_stores_are_isolated():
+    first = DB("first", initialize=True, in_memory=True)
+    second = DB("second", initialize=True, in_memory=True)
+    first.set_metadata("key", "first")
+    second.set_metadata("key", "second")
+    assert first.get_metadata("key") == "first"
+    assert second.get_metadata("key") == "second"
+    second.close()
+    # closing one store leaves the other usable
+    assert first.get_metadata("key") == "first"
+
+
+def test_concurrent_reads_see_whole_writes():
+    db = DB("concurrent", initialize=True, in_memory=True)
+    db.set_metadata("a", "0")
+    db.set_metadata("b", "0")
+    stop = threading.Event()
+
+    def write():
+        for i in range(1, 50):
+            with db._writing():
+                db.set_metadata("a", str(i))
+                db.set_metadata("b", str(i))
+        stop.set()
+
+    def read() -> list[tuple[str, str]]:
+        seen = []
+        while not stop.is_set():
+            with db._reader() as cur:
+                rows = dict(cur.execute("SELECT key, value FROM metadata").fetchall())
+            seen.append((rows["a"], rows["b"]))
+        return seen
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        readers = [executor.submit(read) for _ in range(4)]
+        executor.submit(write).result()
+        for r in readers:
+            assert all(a == b for a, b in r.result())
+
+
+def test_reads_run_side_by_side():
+    db = DB("side_by_side", initialize=True, in_memory=True)
+    reader = db._reader
+    # every read holds its cursor until all four ran, which only finishes if they
+    # don't wait for each other
+    all_read = threading.Barrier(4, timeout=10)
+    cursors: set[int] = set()
+
+    @contextmanager
+    def spy():
+        with reader() as cur:
+            yield cur
+            cursors.add(id(cur))
+            _ = all_read.wait()
+
+    db._reader = spy
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda _: db._execute("SELECT 42 AS a"), range(4)))
+    assert [r["a"][0] for r in results] == [42] * 4
+    assert len(cursors) == 4
@@ -0,0 +1,71 @@
+import polars as pl
+
+from rpo.identity import UnionFind, apply_identities, resolve_identities
+
+
+def test_union_find():
+    uf = UnionFind(5)
+    uf.union_by_key(["a", "b", "a", None, None])
+    assert uf.find(0) == uf.find(2)
+    assert uf.find(0) != uf.find(1)
+    # None never merges
+    assert uf.find(3) != uf.find(4)
+
+
+def test_resolve_identities():
+    pairs = pl.DataFrame(
+        {
+            "name": ["Jane Doe", "jane doe", "J. Doe", "root", "root", "Bot"],
+            "email": [
+                "jane@example.com",
+                "JANE@example.com ",
+                "123+jdoe@users.noreply.github.com",
+                "admin@example.com",
+                "ops@example.com",
+                "jdoe@users.noreply.github.com",
+            ],
+            "commits": [10, 1, 2, 3, 4, 5],
+        }
+    )
+    identities = resolve_identities(pairs)
+    assert identities.height == pairs.height
+    by_email = dict(zip(identities["email"], identities["identity_id"], strict=True))
+
+    # shared (normalized) email and name
+    assert by_email["jane@example.com"] == by_email["JANE@example.com "]
+    # github noreply emails with and without the numeric id
+    assert (
+        by_email["123+jdoe@users.noreply.github.com"]
+        == by_email["jdoe@users.noreply.github.com"]
+    )
+    # generic names don't merge unrelated people
+    assert by_email["admin@example.com"] != by_email["ops@example.com"]
+
+    jane = identities.filter(pl.col("identity_id") == by_email["jane@example.com"])
+    assert set(jane["identity_name"]) == {"Jane Doe"}
+    assert set(jane["identity_email"]) == {"jane@example.com"}
+
+
+def test_apply_identities():
+    identities = resolve_identities(
+        pl.DataFrame(
+            {
+                "name": ["Jane Doe", "Jane Doe"],
+                "email": ["jane@example.com", "jane@work.com"],
+                "commits": [3, 1],
+            }
+        )
+    )
+    df = pl.DataFrame(
+        {
+            "author_name": ["Jane Doe", "Other"],
+            "author_email": ["jane@work.com", "other@example.com"],
+            "lines": [1, 2],
+        }
+    )
+    resolved = apply_identities(df, identities)
+    assert resolved["author_email"].to_list() == [
+        "jane@example.com",
+        "other@example.com",
+    ]
+    assert resolved.columns == df.columns
@@ -0,0 +1,68 @@
+import pytest
+from git import Actor
+from git.repo import Repo
+
+from rpo.analyzer import RepoAnalyzer
+from rpo.ingest import read_shard, shards, split_diff_tree
+from rpo.models import FileChangeCommitRecord, GitOptions
+
+
+@pytest.mark.parametrize(
+    "n,count,sizes",
+    [(10, 3, [4, 3, 3]), (2, 4, [1, 1]), (0, 4, []), (5, 1, [5])],
+)
+def test_shards_are_contiguous(n, count, sizes):
+    parts = shards(list(range(n)), count)
+    assert [len(p) for p in parts] == sizes
+    assert [i for p in parts for i in p] == list(range(n))
+
+
+def test_split_diff_tree():
+    output = "a\n:raw\n1\t2\tf\nb\nc\n:raw\n3\t4\tg"
+    assert list(split_diff_tree(output, ["a", "b", "c"])) == [
+        ("a", ":raw\n1\t2\tf"),
+        ("b", ""),
+        ("c", ":raw\n3\t4\tg"),
+    ]
+    with pytest.raises(ValueError):
+        _ = list(split_diff_tree(output, ["a", "d"]))
+
+
+def test_shard_matches_records(tmp_repo: Repo):
+    commits = list(tmp_repo.iter_commits("HEAD"))
+    df = read_shard(tmp_repo.git_dir, [c.hexsha for c in commits], "repo")
+    for c in commits:
+        for record in FileChangeCommitRecord.from_git(c, "repo", by_file=True):
+            row = df.filter(sha=c.hexsha, filename=record.filename).row(0, named=True)
+            for field in ("author_name", "author_email", "gpgsig", "change_type"):
+                assert row[field] == getattr(record, field)
+            assert row["insertions"] == record.insertions
+            assert row["committed_datetime"] == record.committed_datetime
+
+
+@pytest.fixture(params=["tmp_repo", "mixed_case_emails"])
+def ingest_repo(request: pytest.FixtureRequest, tmp_path) -> Repo:
+    if request.param == "tmp_repo":
+        return request.getfixturevalue("tmp_repo")
+    r = Repo.init(tmp_path)
+    for i, email in enumerate(["DAVE@Q.com", "dave@q.com", "Erin@Q.com"]):
+        name = f"{i}.txt"
+        _ = (tmp_path / name).write_text(f"{i}\n")
+        _ = r.index.add([name])
+        actor = Actor(email.split("@")[0], email)
+        _ = r.index.commit(name, author=actor, committer=actor)
+    return r
+
+
+def test_sharded_ingest_matches_sequential(ingest_repo: Repo):
+    sequential = RepoAnalyzer(repo=ingest_repo, in_memory=True)
+    sharded = RepoAnalyzer(
+        repo=ingest_repo, options=GitOptions(ingest_workers=2), in_memory=True
+    )
+    order = ["sha", "filename"]
+    assert sharded.revs.sort(order).equals(sequential.revs.sort(order))
+    assert (
+        sharded._db.activity_by_file()
+        .sort("filename")
+        .equals(sequential._db.activity_by_file().sort("filename"))
+    )
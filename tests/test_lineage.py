@@ -0,0 +1,86 @@
+from datetime import datetime
+
+import polars as pl
+import pytest
+from git import Actor
+from git.repo import Repo
+
+from rpo.analyzer import RepoAnalyzer
+from rpo.lineage import build_lineage, parse_renames
+from rpo.models import ActivityReportCmdOptions
+
+LOG = """commit aaaa 1700000000
+
+R100\tsrc/old.py\tsrc/new.py
+commit bbbb 1600000000
+R090\tdocs/a.md\tdocs/b.md
+M\tdocs/c.md
+"""
+
+
+def test_parse_renames():
+    renames = parse_renames(LOG)
+    assert renames.height == 2
+    assert renames.row(0) == (
+        "aaaa",
+        datetime(2023, 11, 14, 22, 13, 20),
+        "src/old.py",
+        "src/new.py",
+    )
+
+
+def test_build_lineage():
+    files = pl.DataFrame(
+        {
+            "filename": ["a", "b", "c", "other"],
+            "first_seen": [
+                datetime(2020, 1, 1),
+                datetime(2021, 1, 1),
+                datetime(2022, 1, 1),
+                datetime(2020, 1, 1),
+            ],
+            "last_seen": [
+                datetime(2021, 1, 1),
+                datetime(2022, 1, 1),
+                datetime(2023, 1, 1),
+                datetime(2020, 1, 1),
+            ],
+        }
+    )
+    renames = parse_renames("commit x 1\nR100\ta\tb\ncommit y 2\nR100\tb\tc\n")
+    lineage = build_lineage(files, renames)
+    by_file = {f: (i, p) for f, i, p in lineage.iter_rows()}
+    assert by_file["a"] == by_file["b"] == by_file["c"] == ("a", "c")
+    assert by_file["other"] == ("other", "other")
+
+
+@pytest.fixture
+def renamed_repo(tmp_path) -> Repo:
+    root = tmp_path / "renamed_repo"
+    r = Repo.init(root)
+    actor = Actor("Jane Doe", "jane@example.com")
+    contents = "\n".join(f"line {i}" for i in range(20))
+    _ = (root / "old.txt").write_text(contents)
+    _ = r.index.add("old.txt")
+    _ = r.index.commit("add", author=actor, committer=actor)
+    _ = r.index.move(["old.txt", "new.txt"])
+    _ = r.index.commit("rename", author=actor, committer=actor)
+    _ = (root / "new.txt").write_text(contents + "\nline 20")
+    _ = r.index.add("new.txt")
+    _ = r.index.commit("modify", author=actor, committer=actor)
+    return r
+
+
+def test_file_report_follows_renames(renamed_repo: Repo):
+    ra = RepoAnalyzer(repo=renamed_repo, in_memory=True)
+    plain = ra.file_report(ActivityReportCmdOptions())
+    assert set(plain["filename"]) == {"old.txt", "new.txt"}
+
+    followed = ra.file_report(ActivityReportCmdOptions(follow_renames=True))
+    assert followed["filename"].to_list() == ["new.txt"]
+    assert followed["lines"].sum() == plain["lines"].sum()
+    assert set(ra.lineage["file_id"]) == {"old.txt"}
+
+    timeline = ra.file_timeline(ActivityReportCmdOptions(follow_renames=True))
+    assert set(timeline["filename"]) == {"new.txt"}
+    assert timeline["commits"].sum() == 3
@@ -0,0 +1,99 @@
+import polars as pl
+import pytest
+from git import Actor
+from git.repo import Repo
+
+from rpo.analyzer import RepoAnalyzer
+from rpo.mailmap import Mailmap
+from rpo.models import SummaryCmdOptions
+
+MAILMAP = """
+# comments and blank lines are ignored
+
+Jane Doe <jane@example.com>
+<jane@example.com> <jane@old.example.com>
+Joe Developer <joe@example.com> <joe@laptop.local>
+Joe Developer <joe@example.com> joe <shared@example.com>
+"""
+
+
+@pytest.fixture
+def mailmap():
+    return Mailmap(MAILMAP)
+
+
+@pytest.mark.parametrize(
+    "raw,expected",
+    [
+        (("jane", "jane@example.com"), ("Jane Doe", "jane@example.com")),
+        (("Jane", "JANE@old.example.com"), ("Jane", "jane@example.com")),
+        (("joe", "joe@laptop.local"), ("Joe Developer", "joe@example.com")),
+        (("Joe", "shared@example.com"), ("Joe Developer", "joe@example.com")),
+        (("Someone", "shared@example.com"), ("Someone", "shared@example.com")),
+        (("Other", "other@example.com"), ("Other", "other@example.com")),
+    ],
+    ids=[
+        "name-only",
+        "email-only",
+        "name-and-email",
+        "by-name-and-email",
+        "name-mismatch",
+        "unmapped",
+    ],
+)
+def test_resolve(mailmap: Mailmap, raw, expected):
+    assert mailmap.resolve(*raw) == expected
+
+
+def test_lines_for_the_same_email_are_merged():
+    mailmap = Mailmap("Proper Name <c@x.org>\n<proper@x.org> <c@x.org>\n")
+    assert mailmap.resolve("c", "c@x.org") == ("Proper Name", "proper@x.org")
+    # in either order
+    mailmap = Mailmap("<proper@x.org> <C@x.org>\nProper Name <c@x.org>\n")
+    assert mailmap.resolve("c", "c@x.org") == ("Proper Name", "proper@x.org")
+
+
+def test_apply(mailmap: Mailmap):
+    df = pl.DataFrame(
+        {
+            "author_name": ["jane", "Other", None],
+            "author_email": ["jane@example.com", "other@example.com", None],
+        }
+    )
+    resolved = mailmap.apply(df)
+    assert resolved["author_name"].to_list() == ["Jane Doe", "Other", None]
+    assert resolved.height == df.height
+
+
+@pytest.fixture
+def mailmap_repo(tmp_path) -> Repo:
+    r = Repo.init(tmp_path / "mailmap_repo")
+    path = tmp_path / "mailmap_repo" / "file.txt"
+    for i, actor in enumerate(
+        [Actor("jane", "jane@old.example.com"), Actor("Jane D", "jane@example.com")]
+    ):
+        _ = path.write_text("\n".join(str(j) for j in range(i + 1)))
+        _ = r.index.add(path)
+        _ = r.index.commit(f"commit {i}", author=actor, committer=actor)
+    mailmap = tmp_path / "mailmap_repo" / ".mailmap"
+    _ = mailmap.write_text(MAILMAP)
+    _ = r.index.add(mailmap)
+    _ = r.index.commit("add mailmap", author=actor, committer=actor)
+    return r
+
+
+def test_mailmap_applied_at_ingest(mailmap_repo: Repo):
+    ra = RepoAnalyzer(repo=mailmap_repo, in_memory=True)
+    revs = ra.revs
+    # the email only entry maps the email, but leaves the name alone
+    assert set(revs["author_name"]) == {"jane", "Jane Doe"}
+    assert set(revs["author_email"]) == {"jane@example.com"}
+    assert set(revs["raw_author_email"]) == {"jane@old.example.com", "jane@example.com"}
+
+    summary = ra.summary(SummaryCmdOptions(identify_by="email"))
+    assert summary["contributors"].to_list() == [1]
+
+    # a changed .mailmap only re-resolves the stored identities
+    ra._mailmap = Mailmap("", digest="changed")
+    ra._revs = None
+    assert set(ra.revs["author_name"]) == {"jane", "Jane D"}
@@ -0,0 +1,107 @@
+import pickle
+
+import pytest
+from git.repo import Repo
+
+from rpo.objects import ObjectNotFound, ObjectReader, parse_commit, parse_signature
+
+
+@pytest.fixture
+def reader(tmp_repo: Repo):
+    with ObjectReader(tmp_repo.git_dir) as r:
+        yield r
+
+
+def test_parse_signature():
+    sig = parse_signature("Jane Doe <Jane@Example.com> 1700000000 -0130")
+    assert sig.name == "Jane Doe"
+    assert sig.email == "jane@example.com"
+    assert sig.datetime.utcoffset().total_seconds() == -5400
+    assert sig.datetime.timestamp() == 1700000000
+    assert parse_signature("J <J@x.org> 0 +0000", lower_email=False).email == "J@x.org"
+
+
+def test_parse_signed_commit():
+    data = (
+        b"tree abc\nauthor A <a@x> 0 +0000\ncommitter A <a@x> 0 +0000\n"
+        b"gpgsig -----BEGIN PGP SIGNATURE-----\n \n line\n -----END PGP SIGNATURE-----\n"
+        b"\nsummary\n\nbody\n"
+    )
+    commit = parse_commit("sha", data)
+    assert commit.gpgsig == (
+        "-----BEGIN PGP SIGNATURE-----\n\nline\n-----END PGP SIGNATURE-----"
+    )
+    assert commit.summary == "summary"
+
+
+def test_commit_matches_gitpython(reader: ObjectReader, tmp_repo: Repo):
+    for expected in tmp_repo.iter_commits("HEAD"):
+        commit = reader.commit(expected.hexsha)
+        assert commit.tree == expected.tree.hexsha
+        assert commit.parents == tuple(p.hexsha for p in expected.parents)
+        assert commit.author.name == expected.author.name
+        assert commit.author.email == expected.author.email
+        assert commit.gpgsig == (expected.gpgsig or "")
+        assert commit.committer.datetime == expected.committed_datetime
+        assert commit.summary == expected.summary
+
+
+def test_ls_tree_matches_git(reader: ObjectReader, tmp_repo: Repo):
+    for c in tmp_repo.iter_commits("HEAD"):
+        expected = tmp_repo.git.ls_tree("-r", "-l", c.hexsha).splitlines()
+        listing = reader.ls_tree(c.hexsha, with_sizes=True)
+        assert sorted(listing["filename"]) == sorted(
+            line.split("\t")[1] for line in expected
+        )
+        assert sorted(listing["size"]) == sorted(
+            int(line.split("\t")[0].split()[-1]) for line in expected
+        )
+
+
+def test_subtree_listings_are_shared(reader: ObjectReader, tmp_repo: Repo):
+    head, parent = tmp_repo.head.commit, tmp_repo.head.commit.parents[0]
+    _ = reader.ls_tree(parent.hexsha)
+    trees = len(reader._trees)
+    _ = reader.ls_tree(head.hexsha)
+    # only the root and the one changed directory are read again
+    assert len(reader._trees) - trees == 2
+
+
+def test_missing_objects(reader: ObjectReader):
+    with pytest.raises(ObjectNotFound):
+        _ = reader.read("HEAD:does/not/exist")
+    assert reader.info(["HEAD", "0" * 40]) == [reader.info(["HEAD"])[0], None]
+    # the processes are still usable after a miss
+    assert reader.rev_parse("HEAD")
+
+
+def test_reader_pickles_without_processes(reader: ObjectReader):
+    head = reader.rev_parse("HEAD")
+    copy = pickle.loads(pickle.dumps(reader))
+    assert copy._batch is None
+    assert copy.rev_parse("HEAD") == head
+    copy.close()
+
+
+def test_sizes_beyond_cache_size(tmp_path):
+    repo = Repo.init(tmp_path)
+    for i in range(1, 41):
+        _ = (tmp_path / f"{i}.txt").write_text("x" * i)
+    _ = repo.index.add([f"{i}.txt" for i in range(1, 41)])
+    _ = repo.index.commit("many files")
+    with ObjectReader(repo.git_dir, cache_size=4) as r:
+        listing = r.ls_tree("HEAD", with_sizes=True)
+        assert len(listing) > r._sizes.maxsize
+    assert dict(zip(listing["filename"], listing["size"])) == {
+        f"{i}.txt": i for i in range(1, 41)
+    }
+
+
+def test_symbolic_revs_follow_their_ref(tmp_path):
+    repo = Repo.init(tmp_path)
+    _ = repo.index.commit("first")
+    with ObjectReader(repo.git_dir) as r:
+        first = r.commit("HEAD")
+        _ = repo.index.commit("second")
+        assert r.commit("HEAD").summary == "second"
+        assert r.commit(first.sha) is first
@@ -0,0 +1,128 @@
+import polars as pl
+import pytest
+from git import Actor
+from git.repo import Repo
+
+from rpo.analyzer import RepoAnalyzer
+from rpo.models import ActivityReportCmdOptions, BlameCmdOptions, GitOptions
+from rpo.pathfilter import PathFilter, parse_gitattributes, parse_gitignore
+
+GITIGNORE = """
+# comments and blank lines are ignored
+
+build/
+*.log
+!keep.log
+/root.txt
+docs/**/*.tmp
+\\#literal
+"""
+
+GITATTRIBUTES = """
+vendor/** linguist-vendored
+*.min.js linguist-generated=true
+package-lock.json -linguist-generated
+"""
+
+
+@pytest.fixture
+def path_filter():
+    return PathFilter(
+        parse_gitignore(GITIGNORE) + parse_gitignore("*.py\n!keep.py\n", "sub/"),
+        parse_gitattributes(GITATTRIBUTES),
+    )
+
+
+@pytest.mark.parametrize(
+    "path,ignored",
+    [
+        ("build/out.o", True),
+        ("src/build/out.o", True),
+        ("a.log", True),
+        ("src/a.log", True),
+        ("keep.log", False),
+        # a path in an ignored directory can't be re-included
+        ("build/keep.log", True),
+        ("root.txt", True),
+        ("src/root.txt", False),
+        ("docs/c.tmp", True),
+        ("docs/a/b/c.tmp", True),
+        ("#literal", True),
+        ("sub/a.py", True),
+        ("sub/deeper/b.py", True),
+        ("sub/keep.py", False),
+        ("a.py", False),
+    ],
+)
+def test_ignored(path_filter: PathFilter, path: str, ignored: bool):
+    assert path_filter.ignored(pl.Series([path])).to_list() == [ignored]
+
+
+@pytest.mark.parametrize(
+    "path,generated",
+    [
+        ("vendor/lib/a.py", True),
+        ("dist/app.min.js", True),
+        ("app.js", False),
+        # the default globs apply, unless an attribute unsets them
+        ("Cargo.lock", True),
+        ("package-lock.json", False),
+    ],
+)
+def test_generated(path_filter: PathFilter, path: str, generated: bool):
+    assert path_filter.generated(pl.Series([path])).to_list() == [generated]
+
+
+def test_repeated_paths_keep_their_order(path_filter: PathFilter):
+    paths = pl.Series(["a.log", "a.py", None, "a.log", "build/x"])
+    assert path_filter.ignored(paths).to_list() == [True, False, False, True, True]
+
+
+def test_digest_follows_generated_rules():
+    assert PathFilter().digest == PathFilter(parse_gitignore("*.log")).digest
+    assert (
+        PathFilter().digest
+        != PathFilter(generated=parse_gitattributes(GITATTRIBUTES)).digest
+    )
+
+
+def test_filters_applied_by_analyzer(tmp_path, actors: list[Actor]):
+    r = Repo.init(tmp_path)
+
+    def commit(files: dict[str, str]):
+        for name, text in files.items():
+            path = tmp_path / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            _ = path.write_text(text)
+        _ = r.index.add(list(files))
+        _ = r.index.commit("commit", author=actors[0], committer=actors[0])
+
+    # committed before it was ignored
+    commit({"src/a.py": "a\n", "out/bundle.js": "b\n" * 3, "vendor/lib.py": "c\n"})
+    commit({".gitignore": "out/\n", "src/a.py": "a\nb\n"})
+
+    ra = RepoAnalyzer(repo=r, in_memory=True)
+    report = ra.file_report(ActivityReportCmdOptions())
+    assert set(report["filename"]) == {".gitignore", "src/a.py", "vendor/lib.py"}
+    blamed = ra.blame(BlameCmdOptions())["lines"].sum()
+    assert blamed == 1 + 2 + 1
+
+    unfiltered = RepoAnalyzer(
+        options=GitOptions(path=tmp_path, use_gitignore=False), in_memory=True
+    )
+    assert (
+        "out/bundle.js"
+        in unfiltered.file_report(ActivityReportCmdOptions())["filename"]
+    )
+
+    # a changed .gitattributes only re-flags the stored changes
+    commit({".gitattributes": "vendor/** linguist-vendored\n"})
+    ra._path_filter = None
+    ra.ingest()
+    revs = ra.revs
+    vendored = revs.filter(pl.col("filename") == "vendor/lib.py")["is_generated"]
+    assert vendored.to_list() == [True]
+    report = ra.file_report(ActivityReportCmdOptions())
+    assert "vendor/lib.py" not in report["filename"]
+    generated = ra.file_report(ActivityReportCmdOptions(generated=True))
+    assert "vendor/lib.py" in generated["filename"]
@@ -0,0 +1,78 @@
+import json
+import threading
+
+import pytest
+from click.testing import CliRunner
+
+from rpo.analyzer import RepoAnalyzer
+from rpo.main import cli
+from rpo.plan import ReportPlan, ReportSpec
+
+
+@pytest.fixture
+def specs() -> list[ReportSpec]:
+    return [
+        ReportSpec(report="summary"),
+        ReportSpec(report="users", options={"exclude_users": ["nobody"]}),
+        ReportSpec(report="files", options={"exclude_users": ["nobody"]}),
+        ReportSpec(report="punchcard", options={"identify_by": "email"}),
+        ReportSpec(report="blame"),
+    ]
+
+
+def test_groups_by_data_selection(specs):
+    plan = ReportPlan(specs)
+    assert sorted(plan.groups().values()) == [[0, 4], [1, 2], [3]]
+
+
+def test_run_matches_individual_reports(tmp_repo_analyzer: RepoAnalyzer, specs):
+    plan = ReportPlan(specs)
+    results = plan.run(tmp_repo_analyzer, workers=4)
+    assert len(results) == len(specs)
+    # the users and files reports scan the same selection, which is filtered once
+    key = plan.options[1].selection_key
+    assert set(tmp_repo_analyzer._filtered) == {(key, True), (key, False)}
+
+    expected = tmp_repo_analyzer.contributor_report(plan.options[1])
+    assert results[1].sort("author_name").equals(expected.sort("author_name"))
+    expected = tmp_repo_analyzer.blame(plan.options[4])
+    assert results[4]["lines"].sum() == expected["lines"].sum()
+
+
+def test_selections_are_filtered_concurrently(tmp_repo_analyzer: RepoAnalyzer):
+    plan = ReportPlan(
+        [
+            ReportSpec(report="users", options={"exclude_users": ["nobody"]}),
+            ReportSpec(report="users", options={"exclude_users": ["somebody"]}),
+        ]
+    )
+    # each filter waits for the other, so filtering them one after another fails
+    both = threading.Barrier(2, timeout=10)
+    filter_revs = tmp_repo_analyzer._filter_revs
+
+    def spy(*args):
+        _ = both.wait()
+        return filter_revs(*args)
+
+    tmp_repo_analyzer._filter_revs = spy
+    results = plan.run(tmp_repo_analyzer, workers=2)
+    assert results[0].equals(results[1])
+
+
+def test_report_command(tmp_path, tmp_repo):
+    plan_file = tmp_path / "plan.json"
+    _ = plan_file.write_text(
+        json.dumps({"reports": [{"report": "summary"}, {"report": "files"}]})
+    )
+    result = CliRunner().invoke(
+        cli,
+        [
+            "-p",
+            tmp_repo.working_dir,
+            "--no-persist-data",
+            "report",
+            "--plan",
+            str(plan_file),
+        ],
+    )
+    assert result.exit_code == 0, result.output
@@ -0,0 +1,50 @@
+import logging
+
+import pytest
+
+from rpo.progress import ProgressReporter
+
+
+def test_stats_rates_and_eta():
+    progress = ProgressReporter(
+        "ingest", total=10, unit="commits", secondary_unit="files", mode="none"
+    )
+    for _ in range(4):
+        progress.update(secondary=3)
+    stats = progress.stats()
+    assert stats["completed"] == 4
+    assert stats["secondary"] == 12
+    assert stats["rate"] > 0
+    assert stats["eta"] is not None and stats["eta"] >= 0
+
+
+def test_utilization_requires_workers():
+    progress = ProgressReporter("blame", mode="none")
+    progress.update(busy=1.0)
+    assert progress.stats()["utilization"] is None
+
+    progress = ProgressReporter("blame", mode="none", workers=2)
+    progress.update(busy=0.0)
+    assert progress.stats()["utilization"] == 0.0
+
+
+def test_reports_are_batched(caplog: pytest.LogCaptureFixture):
+    caplog.set_level(logging.INFO, logger="rpo.progress")
+    progress = ProgressReporter(
+        "ingest", total=1000, mode="log", interval=0.0, check_every=100
+    )
+    for _ in range(1000):
+        progress.update()
+    progress.close()
+    records = [r for r in caplog.records if hasattr(r, "progress")]
+    # one report per `check_every` updates, plus the final report on close
+    assert len(records) == 11
+    assert records[-1].progress["completed"] == 1000
+
+
+def test_stderr_rendering(capsys: pytest.CaptureFixture[str]):
+    with ProgressReporter("blame", total=2, unit="files", mode="stderr") as progress:
+        progress.update(2)
+    err = capsys.readouterr().err
+    assert "blame: 2/2 files" in err
+    assert err.endswith("\n")
@@ -0,0 +1,93 @@
+import asyncio
+from collections import Counter
+
+import pytest
+from git.exc import GitCommandError
+from git.repo import Repo
+
+from rpo.scheduler import GitScheduler, parse_blame_incremental
+
+
+@pytest.fixture
+def scheduler(tmp_repo: Repo):
+    with GitScheduler(tmp_repo.git_dir, max_processes=2) as s:
+        yield s
+
+
+def test_run(scheduler: GitScheduler, tmp_repo: Repo):
+    assert scheduler.run(["rev-parse", "HEAD"]).decode().strip() == (
+        tmp_repo.head.commit.hexsha
+    )
+    with pytest.raises(GitCommandError):
+        _ = scheduler.run(["rev-parse", "does-not-exist"])
+    # the scheduler is still usable after a failure
+    assert scheduler.run(["rev-parse", "HEAD"])
+
+
+def test_process_limit(scheduler: GitScheduler):
+    running, peak = 0, 0
+
+    async def slow(lines):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.05)
+        async for _ in lines:
+            pass
+        running -= 1
+
+    futures = [scheduler.submit(["rev-parse", "HEAD"], slow) for _ in range(6)]
+    for f in futures:
+        f.result()
+    assert peak == 2
+
+
+def test_map_is_ordered_and_lazy(scheduler: GitScheduler, tmp_repo: Repo):
+    shas = [c.hexsha for c in tmp_repo.iter_commits("HEAD")]
+    drawn = 0
+
+    def items():
+        nonlocal drawn
+        for sha in shas:
+            drawn += 1
+            yield sha
+
+    results = scheduler.map(items(), lambda sha: ["rev-parse", sha], window=2)
+    first, output = next(results)
+    assert first == shas[0] and output.decode().strip() == shas[0]
+    # only a window of items is drawn ahead of the consumer
+    assert drawn == 2
+    assert [sha for sha, _ in results] == shas[1:]
+
+
+def test_map_unordered_is_not_held_back(scheduler: GitScheduler, tmp_repo: Repo):
+    head = tmp_repo.head.commit.hexsha
+
+    async def slow_head(lines):
+        output = b"".join([line async for line in lines])
+        if output.decode().strip() == head:
+            await asyncio.sleep(0.3)
+        return output
+
+    revs = ["HEAD", "HEAD~1", "HEAD~2", "HEAD~3"]
+    results = scheduler.map_unordered(
+        revs, lambda rev: ["rev-parse", rev], slow_head, window=3
+    )
+    # the slow command started first, and finishes last
+    assert [rev for rev, _ in results][-1] == "HEAD"
+
+
+def test_blame_matches_gitpython(scheduler: GitScheduler, tmp_repo: Repo):
+    for f in tmp_repo.git.ls_files().splitlines():
+        hunks = scheduler.run(
+            ["blame", "-p", "--incremental", "HEAD", "--", f], parse_blame_incremental
+        )
+        expected = Counter()
+        for entry in tmp_repo.blame_incremental("HEAD", f):
+            expected[entry.commit.hexsha, entry.commit.author.name] += len(
+                entry.linenos
+            )
+        lines = Counter()
+        for hunk in hunks:
+            lines[hunk.commit.sha, hunk.commit.author.name] += hunk.lines
+        assert lines == expected
@@ -0,0 +1,111 @@
+from datetime import datetime
+
+import polars as pl
+import pytest
+
+from rpo.analyzer import RepoAnalyzer
+from rpo.db import DB
+from rpo.models import ActivityReportCmdOptions, SummaryCmdOptions
+from rpo.sketch import estimate, merge, scale_sample
+
+
+def changes(shas: list[str], months: list[int]) -> pl.DataFrame:
+    n = len(shas)
+    return pl.DataFrame(
+        {
+            "repository": ["repo"] * n,
+            "sha": shas,
+            "author_name": [f"author{i % 50}" for i in range(n)],
+            "author_email": [f"author{i % 50}@example.com" for i in range(n)],
+            "committer_name": ["committer"] * n,
+            "committer_email": ["committer@example.com"] * n,
+            "authored_datetime": [datetime(2024, m, 1) for m in months],
+            "committed_datetime": [datetime(2024, m, 2) for m in months],
+            "filename": [f"src/{i % 3000}.py" for i in range(n)],
+            "insertions": [1] * n,
+            "deletions": [0] * n,
+            "lines": [1] * n,
+            "is_generated": [False] * n,
+        }
+    )
+
+
+@pytest.fixture
+def db():
+    db = DB(name="sketches", in_memory=True)
+    db.create_tables()
+    shas = [f"{i:040x}" for i in range(20_000)]
+    # inserted in two batches, the second updating the registers of the first
+    _ = db.insert_file_change_frames([changes(shas[:10_000], [1] * 10_000)])
+    _ = db.insert_file_change_frames([changes(shas[10_000:], [2] * 10_000)])
+    return db
+
+
+def counts(registers: pl.DataFrame) -> dict[str, tuple[float, float]]:
+    return {k: (n, e) for k, n, e in estimate(registers).iter_rows()}
+
+
+def test_estimates_are_within_their_error(db: DB):
+    estimates = counts(db.sketches())
+    for kind, exact in (("sha", 20_000), ("filename", 3000), ("author_name", 50)):
+        n, error = estimates[kind]
+        assert abs(n - exact) <= error
+    assert estimates["committer_name"] == (1, 0)
+
+
+def test_periods_merge_to_the_whole(db: DB):
+    january, february = (
+        db.sketches(since="2024-01", until="2024-01"),
+        db.sketches(since="2024-02"),
+    )
+    assert counts(merge([january, february])) == counts(db.sketches())
+    n, error = counts(january)["sha"]
+    assert abs(n - 10_000) <= error
+    # merging a sketch with itself, e.g., the same history in two stores, changes nothing
+    assert counts(merge([january, january])) == counts(january)
+
+
+def test_rebuilt_sketches_match_incremental(db: DB):
+    before = db.sketches().sort("kind", "idx")
+    db.rebuild_rollups()
+    assert db.sketches().sort("kind", "idx").equals(before)
+    assert db.sketch_bounds() == (datetime(2024, 1, 1), datetime(2024, 2, 1))
+
+
+def test_scale_sample():
+    df = pl.DataFrame(
+        {
+            "author": ["a", "a", "a", "b"],
+            "sha": ["1", "1", "2", "3"],
+            "lines": [1, 2, 3, 4],
+        }
+    )
+    exact = scale_sample(df, "author", ["lines"], 1.0).sort("author")
+    assert exact.rows() == [("a", 6, 0), ("b", 4, 0)]
+    half = scale_sample(df, "author", ["lines"], 0.5).sort("author")
+    # commit 1 stands for two commits of 3 lines, with a variance of 2 * 3^2
+    assert half["lines"].to_list() == [12, 8]
+    assert half["lines_error"][1] == round(1.96 * (2 * 4**2) ** 0.5)
+
+
+def test_sampled_reports(tmp_repo_analyzer: RepoAnalyzer):
+    options = ActivityReportCmdOptions()
+    exact = tmp_repo_analyzer.contributor_report(options).sort("author_name")
+    full = tmp_repo_analyzer.contributor_report(
+        ActivityReportCmdOptions(sample=1.0)
+    ).sort("author_name")
+    assert full.select(exact.columns).equals(exact)
+    assert full["lines_error"].sum() == 0
+
+    sampled = tmp_repo_analyzer.file_report(ActivityReportCmdOptions(sample=0.5))
+    assert {"lines_error", "net_error"} <= set(sampled.columns)
+    assert sampled.equals(
+        tmp_repo_analyzer.file_report(ActivityReportCmdOptions(sample=0.5))
+    )
+
+
+def test_approximate_summary_falls_back_to_exact(tmp_repo_analyzer: RepoAnalyzer):
+    options = SummaryCmdOptions(approximate=True, aliases={"a": "b"})
+    summary = tmp_repo_analyzer.summary(options)
+    assert summary["commits"].to_list() == [6]
+    assert summary["commits_error"].to_list() == [0]
@@ -0,0 +1,40 @@
+from datetime import UTC, datetime
+
+import polars as pl
+import pytest
+
+from rpo.analyzer import RepoAnalyzer
+from rpo.db import DB
+from rpo.snapshot import Snapshot
+
+
+def test_save_and_load(tmp_path):
+    snapshot = Snapshot(tmp_path / "repo.revs")
+    df = pl.DataFrame(
+        {"sha": ["a", "b"], "lines": [1, 2], "at": [datetime.now(UTC)] * 2}
+    )
+    assert snapshot.load("head1") is None
+    snapshot.save("head1", df)
+    assert snapshot.load("head1").equals(df)
+
+
+def test_new_watermark_replaces_snapshot(tmp_path):
+    snapshot = Snapshot(tmp_path / "repo.revs")
+    snapshot.save("head1", pl.DataFrame({"a": [1]}))
+    # a process that mapped the old snapshot keeps its frame
+    mapped = snapshot.load("head1")
+    snapshot.save("head2", pl.DataFrame({"a": [2]}))
+    assert snapshot.load("head1") is None
+    assert snapshot.load("head2")["a"].to_list() == [2]
+    assert mapped["a"].to_list() == [1]
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_warm_start_maps_snapshot(tmp_repo, monkeypatch: pytest.MonkeyPatch):
+    expected = RepoAnalyzer(repo=tmp_repo).revs
+
+    def fail(*_, **__):
+        raise AssertionError("the history was read from the store")
+
+    monkeypatch.setattr(DB, "all_file_changes", fail)
+    assert RepoAnalyzer(repo=tmp_repo).revs.equals(expected)
@@ -0,0 +1,29 @@
+import polars as pl
+from polars import DataFrame
+
+from rpo.spill import FrameSpool
+
+
+def frames(n: int) -> list[DataFrame]:
+    return [DataFrame({"i": [i] * 100, "name": [f"name{i}"] * 100}) for i in range(n)]
+
+
+def test_spool_in_memory():
+    with FrameSpool() as spool:
+        for df in frames(3):
+            spool.append(df)
+        assert not spool._parts
+        assert spool.collect().equals(pl.concat(frames(3)))
+    assert FrameSpool().collect().is_empty()
+
+
+def test_spool_spills_past_budget():
+    parts = frames(10)
+    with FrameSpool(max_bytes=parts[0].estimated_size() * 3) as spool:
+        for df in parts:
+            spool.append(df)
+        # every fourth frame spills the buffer
+        assert len(spool._parts) == 2
+        directory = spool._parts[0].parent
+        assert spool.collect().sort("i").equals(pl.concat(parts))
+    assert not directory.exists()
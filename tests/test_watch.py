@@ -0,0 +1,75 @@
+import threading
+
+from git import Actor
+from git.repo import Repo
+
+from rpo.analyzer import RepoAnalyzer
+from rpo.models import SummaryCmdOptions
+from rpo.plan import ReportPlan, ReportSpec
+from rpo.watch import RefWatcher, watch
+
+
+def commit(r: Repo, name: str, actor: Actor) -> str:
+    path = f"{r.working_tree_dir}/{name}"
+    with open(path, "w") as f:
+        _ = f.write(f"{name}\n")
+    _ = r.index.add([name])
+    return r.index.commit(name, author=actor, committer=actor).hexsha
+
+
+def test_ref_watcher(tmp_path, actors: list[Actor]):
+    r = Repo.init(tmp_path)
+    _ = commit(r, "a.txt", actors[0])
+    watcher = RefWatcher(r.common_dir)
+    assert watcher.changed()
+    assert not watcher.changed()
+    _ = commit(r, "b.txt", actors[0])
+    assert watcher.changed()
+    r.git.pack_refs("--all")
+    assert watcher.changed()
+    assert not watcher.changed()
+
+
+def test_ref_watcher_in_worktree(tmp_path, actors: list[Actor]):
+    r = Repo.init(tmp_path / "main")
+    _ = commit(r, "a.txt", actors[0])
+    _ = r.git.worktree("add", "--detach", str(tmp_path / "detached"))
+    worktree = Repo(tmp_path / "detached")
+    watcher = RefWatcher(worktree.common_dir, worktree.git_dir)
+    assert watcher.changed()
+    # a commit on a detached HEAD only changes the HEAD of that worktree
+    _ = commit(worktree, "b.txt", actors[0])
+    assert watcher.changed()
+    assert not watcher.changed()
+
+
+def test_watch_ingests_new_commits(tmp_path, actors: list[Actor]):
+    r = Repo.init(tmp_path)
+    _ = commit(r, "a.txt", actors[0])
+    ra = RepoAnalyzer(repo=r, in_memory=True)
+    plan = ReportPlan([ReportSpec(report="summary")])
+
+    updates: list[tuple[str, int]] = []
+    updated = threading.Event()
+
+    def on_update(head, results):
+        updates.append((head, results[0]["commits"].item()))
+        updated.set()
+
+    stop = threading.Event()
+    watcher = threading.Thread(
+        target=watch,
+        args=(ra, plan, 0.01),
+        kwargs={"stop": stop, "on_update": on_update},
+    )
+    watcher.start()
+    try:
+        assert updated.wait(10)
+        updated.clear()
+        head = commit(r, "b.txt", actors[1])
+        assert updated.wait(10)
+    finally:
+        stop.set()
+        watcher.join()
+    assert updates[-1] == (head, 2)
+    assert ra.summary(SummaryCmdOptions())["commits"].item() == 2